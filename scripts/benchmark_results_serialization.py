@@ -0,0 +1,91 @@
+"""Compares the SQL Lab results backend serialization formats
+
+Builds a synthetic result set and reports, for each format, the time spent
+encoding it (what the Celery worker pays), decoding the rows displayed in
+SQL Lab, decoding it fully into a DataFrame (CSV export) and the size of
+the blob stored in the results backend.
+
+    python scripts/benchmark_results_serialization.py --rows 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+
+import numpy as np
+
+from superset.dataframe import SupersetDataFrame
+from superset.db_engine_specs import BaseEngineSpec
+from superset.utils.results_serialization import (
+    deserialize_results, serializers,
+)
+
+
+def build_cdf(rows, cols):
+    rng = np.random.RandomState(0)
+    start = datetime(2018, 1, 1)
+    columns = []
+    cursor_description = []
+    for i in range(cols):
+        kind = i % 4
+        if kind == 0:
+            columns.append(rng.randint(0, 10 ** 6, rows).tolist())
+            cursor_description.append(('int_{}'.format(i), 'int'))
+        elif kind == 1:
+            columns.append(rng.rand(rows).tolist())
+            cursor_description.append(('float_{}'.format(i), 'float'))
+        elif kind == 2:
+            columns.append(
+                ['value_{}'.format(v) for v in rng.randint(0, 1000, rows)])
+            cursor_description.append(('str_{}'.format(i), 'string'))
+        else:
+            columns.append(
+                [start + timedelta(minutes=int(v))
+                 for v in rng.randint(0, 10 ** 5, rows)])
+            cursor_description.append(('dttm_{}'.format(i), 'datetime'))
+    data = list(zip(*columns))
+    return SupersetDataFrame(data, cursor_description, BaseEngineSpec)
+
+
+def timed(f, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--cols', type=int, default=20)
+    parser.add_argument('--display-limit', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cdf = build_cdf(args.rows, args.cols)
+    payload = {
+        'query_id': 1,
+        'status': 'success',
+        'columns': cdf.columns,
+        'query': {},
+    }
+    print('{} rows x {} columns'.format(args.rows, args.cols))
+    print('{:<10}{:>12}{:>14}{:>14}{:>14}'.format(
+        'format', 'encode (s)', 'display (s)', 'full df (s)', 'size (MB)'))
+    for name, serializer in sorted(serializers.items()):
+        encode_time, blob = timed(
+            lambda: serializer.serialize(payload, cdf), args.repeat)
+        display_time, _ = timed(
+            lambda: deserialize_results(blob).to_dict(args.display_limit),
+            args.repeat)
+        df_time, _ = timed(
+            lambda: deserialize_results(blob).to_dataframe(), args.repeat)
+        print('{:<10}{:>12.3f}{:>14.3f}{:>14.3f}{:>14.2f}'.format(
+            name, encode_time, display_time, df_time,
+            len(blob) / 1024. / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Measures the time spent by ``superset init`` syncing roles and permissions
+
+Fills the metadata database with a synthetic catalog of ``--tables`` tables
+of ``--metrics`` metrics each, ``--restricted`` of them restricted, without
+their permissions. It then runs ``sync_role_definitions`` twice, reporting
+the seconds spent in each phase of:
+
+* ``cold``: the permissions of the whole catalog are missing
+* ``warm``: everything is already in sync, as on most deploys
+
+The catalog and its permissions are deleted at the end. Point
+SUPERSET_CONFIG_PATH to a config using a scratch metadata database.
+
+    python scripts/benchmark_role_sync.py --tables 20000 --metrics 10
+"""
+import argparse
+import time
+
+from superset import app, db, security_manager
+from superset.connectors.sqla.models import SqlaTable, SqlMetric
+from superset.models.core import Database
+
+DATABASE_NAME = 'benchmark_role_sync'
+
+
+def create_catalog(tables, metrics, restricted):
+    """Inserts the synthetic catalog in bulk, which skips the listeners
+    creating the permissions of new tables"""
+    database = Database(database_name=DATABASE_NAME, sqlalchemy_uri='sqlite://')
+    db.session.add(database)
+    db.session.commit()
+    db.session.execute(SqlaTable.__table__.insert(), [
+        {
+            'table_name': 'table_{}'.format(i),
+            'schema': 'schema_{}'.format(i % 10),
+            'database_id': database.id,
+        }
+        for i in range(tables)
+    ])
+    table_ids = [
+        table_id for table_id, in db.session.query(SqlaTable.id)
+        .filter_by(database_id=database.id)
+    ]
+    db.session.execute(SqlMetric.__table__.insert(), [
+        {
+            'metric_name': 'metric_{}'.format(i),
+            'expression': 'SUM(col_{})'.format(i),
+            'is_restricted': i < restricted,
+            'table_id': table_id,
+        }
+        for table_id in table_ids
+        for i in range(metrics)
+    ])
+    db.session.commit()
+    return database
+
+
+def drop_catalog(database):
+    table_ids = db.session.query(SqlaTable.id).filter_by(database_id=database.id)
+    db.session.query(SqlMetric).filter(
+        SqlMetric.table_id.in_(table_ids.subquery())).delete(
+        synchronize_session=False)
+    db.session.query(SqlaTable).filter_by(database_id=database.id).delete(
+        synchronize_session=False)
+    db.session.delete(database)
+    db.session.commit()
+
+    # the permissions of the catalog all mention its database
+    pv_model = security_manager.permissionview_model
+    view_menu_model = security_manager.viewmenu_model
+    view_menus = db.session.query(view_menu_model).filter(
+        view_menu_model.name.like('%[{}]%'.format(DATABASE_NAME)))
+    view_menu_ids = view_menus.with_entities(view_menu_model.id)
+    db.session.query(pv_model).filter(
+        pv_model.view_menu_id.in_(view_menu_ids.subquery())).delete(
+        synchronize_session=False)
+    view_menus.delete(synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tables', type=int, default=5000)
+    parser.add_argument('--metrics', type=int, default=10)
+    parser.add_argument('--restricted', type=int, default=2)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.time()
+        database = create_catalog(args.tables, args.metrics, args.restricted)
+        print('Created {} tables x {} metrics in {:.2f}s'.format(
+            args.tables, args.metrics, time.time() - start))
+        try:
+            for run in ('cold', 'warm'):
+                start = time.time()
+                timings = security_manager.sync_role_definitions()
+                print('\n{}: {:.2f}s'.format(run, time.time() - start))
+                for phase, duration in timings.items():
+                    print('  {:<36}{:>8.2f}s'.format(phase, duration))
+        finally:
+            drop_catalog(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Measures the time spent building and compiling chart queries
+
+Builds a table with many columns and metrics in memory (nothing is stored
+in the metadata database nor sent to the analytics database) and reports
+the best time, in milliseconds, of:
+
+* ``get_sqla_query``: building the SQLAlchemy query of a chart
+* ``compile (engine)``: compiling it against an engine, as done before
+  dialects were cached
+* ``compile (dialect)``: compiling it with ``Database.compile_sqla_query``
+* ``reindent``: pretty printing the SQL, now only done when it is displayed
+
+    python scripts/benchmark_sqla_query.py --metrics 20 --groupby 10
+"""
+import argparse
+import time
+
+from superset import app
+from superset.connectors.sqla.models import SqlaTable, SqlMetric, TableColumn
+from superset.models.core import Database
+
+
+def build_table(uri, metrics, groupby):
+    database = Database(database_name='benchmark', sqlalchemy_uri=uri)
+    columns = [
+        TableColumn(column_name='col_{}'.format(i), type='VARCHAR(255)',
+                    groupby=True, filterable=True)
+        for i in range(groupby)
+    ]
+    columns.append(
+        TableColumn(column_name='value', type='FLOAT', is_dttm=False))
+    table_metrics = [
+        SqlMetric(metric_name='metric_{}'.format(i),
+                  expression='SUM(value * {})'.format(i + 1))
+        for i in range(metrics)
+    ]
+    return SqlaTable(
+        table_name='benchmark', database=database,
+        columns=columns, metrics=table_metrics)
+
+
+def timed(f, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = f()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--uri', default='sqlite://')
+    parser.add_argument('--metrics', type=int, default=20)
+    parser.add_argument('--groupby', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with app.app_context():
+        tbl = build_table(args.uri, args.metrics, args.groupby)
+        query_obj = dict(
+            groupby=['col_{}'.format(i) for i in range(args.groupby)],
+            metrics=['metric_{}'.format(i) for i in range(args.metrics)],
+            granularity=None,
+            from_dttm=None,
+            to_dttm=None,
+            filter=[{'col': 'col_0', 'op': 'in', 'val': ['a', 'b', 'c']}],
+            is_timeseries=False,
+            row_limit=10000,
+            extras={'where': '', 'having': ''},
+        )
+        database = tbl.database
+
+        build_time, qry = timed(
+            lambda: tbl.get_sqla_query(**query_obj), args.repeat)
+        engine_time, _ = timed(
+            lambda: str(qry.compile(
+                database.get_sqla_engine(),
+                compile_kwargs={'literal_binds': True})),
+            args.repeat)
+        dialect_time, sql = timed(
+            lambda: database.compile_sqla_query(qry), args.repeat)
+        reindent_time, _ = timed(
+            lambda: tbl.format_query_str(sql), args.repeat)
+
+    print('{} metrics x {} groupby on {}'.format(
+        args.metrics, args.groupby, args.uri))
+    for name, elapsed in (
+            ('get_sqla_query', build_time),
+            ('compile (engine)', engine_time),
+            ('compile (dialect)', dialect_time),
+            ('reindent', reindent_time)):
+        print('{:<20}{:>10.2f} ms'.format(name, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,7 @@ setup(
         'idna',
         'isodate',
         'markdown>=3.0',
+        'msgpack>=0.5.6, <1.0.0',
         'pandas>=0.18.0',
         'parsedatetime',
         'pathlib2',
@@ -89,6 +89,32 @@ describe('SqlEditorLeftBar', () => {
           expect(data).toEqual(mockTableOptions);
         });
     });
+
+    it('should poll while the table names are partial', () => {
+      const queryEditor = {
+        ...defaultQueryEditor,
+        dbId: 1,
+        schema: 'main',
+      };
+      wrapper.setProps({ queryEditor });
+      let requests = 0;
+      fetchMock.get(
+        GET_TABLE_NAMES_GLOB,
+        () => {
+          requests += 1;
+          return requests === 1 ? { options: [], partial: true } : { options: [table] };
+        },
+        { overwriteRoutes: true },
+      );
+
+      return wrapper
+        .instance()
+        .getTableNamesBySubStr('my table')
+        .then((data) => {
+          expect(requests).toBe(2);
+          expect(data).toEqual({ options: [table] });
+        });
+    });
   });
 
   it('dbMutator should build databases options', () => {
@@ -10,9 +10,13 @@ const QUERY_UPDATE_FREQ = 2000;
 const QUERY_UPDATE_BUFFER_MS = 5000;
 const MAX_QUERY_AGE_TO_POLL = 21600000;
 const QUERY_TIMEOUT_LIMIT = 7000;
+const QUERY_UPDATES_WAIT_S = 5;
 
 class QueryAutoRefresh extends React.PureComponent {
   componentWillMount() {
+    this.seq = null;
+    this.pending = false;
+    this.useQueryUpdates = true;
     this.startTimer();
   }
   componentWillUnmount() {
@@ -41,21 +45,58 @@ class QueryAutoRefresh extends React.PureComponent {
     this.timer = null;
   }
   stopwatch() {
-    // only poll /superset/queries/ if there are started or running queries
-    if (this.shouldCheckForQueries()) {
-      SupersetClient.get({
-        endpoint: `/superset/queries/${this.props.queriesLastUpdate - QUERY_UPDATE_BUFFER_MS}`,
-        timeout: QUERY_TIMEOUT_LIMIT,
-      }).then(({ json }) => {
-        if (Object.keys(json).length > 0) {
-          this.props.actions.refreshQueries(json);
-        }
-        this.props.actions.setUserOffline(false);
-        }).catch(() => {
+    // only poll for updates if there are started or running queries
+    if (this.shouldCheckForQueries() && !this.pending) {
+      this.pending = true;
+      const refresh = this.useQueryUpdates ? this.fetchQueryUpdates() : this.fetchQueries();
+      refresh
+        .then(() => {
+          this.props.actions.setUserOffline(false);
+        })
+        .catch(() => {
           this.props.actions.setUserOffline(true);
+        })
+        .then(() => {
+          this.pending = false;
         });
     }
   }
+  fetchQueries() {
+    return SupersetClient.get({
+      endpoint: `/superset/queries/${this.props.queriesLastUpdate - QUERY_UPDATE_BUFFER_MS}`,
+      timeout: QUERY_TIMEOUT_LIMIT,
+    }).then(({ json }) => {
+      if (Object.keys(json).length > 0) {
+        this.props.actions.refreshQueries(json);
+      }
+    });
+  }
+  fetchQueryUpdates() {
+    // long polls the updates pushed by the workers, falls back on
+    // /superset/queries/ when updates may have been missed
+    const seq = this.seq === null ? '' : this.seq;
+    return SupersetClient.get({
+      endpoint: `/superset/query_updates/?seq=${seq}&wait=${QUERY_UPDATES_WAIT_S}`,
+      timeout: QUERY_TIMEOUT_LIMIT + QUERY_UPDATES_WAIT_S * 1000,
+    })
+      .then(({ json }) => {
+        this.seq = json.seq;
+        if (Object.keys(json.queries).length > 0) {
+          this.props.actions.refreshQueries(json.queries);
+        }
+        if (json.resync) {
+          return this.fetchQueries();
+        }
+        return null;
+      })
+      .catch((response) => {
+        if (response && response.status === 404) {
+          this.useQueryUpdates = false;
+          return this.fetchQueries();
+        }
+        throw response;
+      });
+  }
   render() {
     return null;
   }
@@ -26,6 +26,11 @@ const defaultProps = {
   offline: false,
 };
 
+// while the server crawls the schemas of the database, the table names it
+// returns are partial and asked for again
+export const TABLE_NAMES_POLL_INTERVAL = 1000;
+export const TABLE_NAMES_MAX_POLLS = 10;
+
 class SqlEditorLeftBar extends React.PureComponent {
   constructor(props) {
     super(props);
@@ -56,12 +61,21 @@ class SqlEditorLeftBar extends React.PureComponent {
     if (this.props.offline || !this.props.queryEditor.dbId || !input) {
       return Promise.resolve({ options: [] });
     }
+    return this.fetchTableNames(input, 0);
+  }
 
+  fetchTableNames(input, polls) {
     return SupersetClient.get({
       endpoint: `/superset/tables/${this.props.queryEditor.dbId}/${
         this.props.queryEditor.schema
       }/${input}`,
-    }).then(({ json }) => ({ options: json.options }));
+    }).then(({ json }) => {
+      if (json.partial && polls < TABLE_NAMES_MAX_POLLS) {
+        return new Promise(resolve => setTimeout(resolve, TABLE_NAMES_POLL_INTERVAL))
+          .then(() => this.fetchTableNames(input, polls + 1));
+      }
+      return { options: json.options };
+    });
   }
 
   dbMutator(data) {
@@ -367,6 +367,41 @@ def update_datasources_cache():
                 print('{}'.format(str(e)))
 
 
+@app.cli.command()
+@click.option(
+    '--strategy', '-s',
+    default='top_n_dashboards',
+    help='Strategy selecting the charts to warm up: top_n_slices, '
+         'top_n_dashboards, dashboard, datasource or slice')
+@click.option(
+    '--option', '-o',
+    multiple=True,
+    help='Option of the strategy as key=value, for instance top_n=10, '
+         'since="7 days ago", dashboard_ids=1,2 or table_name=energy_usage')
+@click.option(
+    '--workers', '-w',
+    type=int,
+    help='Number of charts warmed up concurrently')
+def warm_up_cache(strategy, option, workers):
+    """Runs the queries of the selected charts to fill the cache"""
+    from superset.tasks.cache import get_strategy, warm_up_slices
+    kwargs = {}
+    for opt in option:
+        key, value = opt.split('=', 1)
+        kwargs[key] = value.split(',') if key.endswith('_ids') else value
+    slice_ids = get_strategy(strategy, **kwargs).get_slice_ids(db.session)
+    print('Warming up {} charts'.format(len(slice_ids)))
+    failed = 0
+    for result in warm_up_slices(slice_ids, max_workers=workers):
+        if result['error']:
+            failed += 1
+            print(Fore.RED + '[{slice_id}] {slice_name}: failed in '
+                  '{duration}s: {error}'.format(**result) + Style.RESET_ALL)
+        else:
+            print('[{slice_id}] {slice_name}: {duration}s'.format(**result))
+    print('Warmed up {} charts, {} failed'.format(len(slice_ids), failed))
+
+
 @app.cli.command()
 @click.option(
     '--workers', '-w',
@@ -105,6 +105,11 @@ DRUID_IS_ACTIVE = True
 DRUID_TZ = tz.tzutc()
 DRUID_ANALYSIS_TYPES = ['cardinality']
 
+# Number of seconds the results of each query sent to Druid, including the
+# first phase of two-phase queries, are kept in the CACHE_CONFIG cache.
+# Forcing the refresh of a chart doesn't bypass it. Set to 0 to disable.
+DRUID_QUERY_CACHE_TIMEOUT = 0
+
 # ----------------------------------------------------
 # AUTHENTICATION CONFIG
 # ----------------------------------------------------
@@ -198,12 +203,87 @@ CORS_OPTIONS = {}
 # TODO: Add processing of other spreadsheet formats (xls, xlsx etc)
 ALLOWED_EXTENSIONS = set(['csv'])
 
+# Number of rows of an uploaded CSV file read and inserted at a time, which
+# bounds the memory used by an upload
+CSV_UPLOAD_CHUNK_SIZE = 10000
+
+# Have Celery workers create the tables of uploaded CSV files, the upload
+# only saves the file and its progress is reported by
+# /superset/csv_upload_status/<id>/. Requires CELERY_CONFIG with
+# `superset.tasks.csv_upload` in its CELERY_IMPORTS and an UPLOAD_FOLDER
+# shared with the workers.
+CSV_UPLOAD_ASYNC = False
+
 # CSV Options: key/value pairs that will be passed as argument to DataFrame.to_csv method
 # note: index option should not be overridden
 CSV_EXPORT = {
     'encoding': 'utf-8',
 }
 
+# Number of seconds during which a chart payload past its cache timeout is
+# still served from cache while a Celery worker refreshes it in the
+# background. Requires CELERY_CONFIG with `superset.tasks.cache` in its
+# CELERY_IMPORTS. Set to 0 to run the queries of expired charts right away.
+CACHE_STALE_WHILE_REVALIDATE_TIMEOUT = 0
+
+# When a chart isn't in cache, concurrent requests for it wait for the first
+# one to run the query and cache its results instead of running it too.
+# Number of seconds they wait before running the query themselves, set to 0
+# to disable. The lock is shared across processes with Redis and memcached.
+CACHE_SINGLE_FLIGHT_WAIT_TIMEOUT = 30
+
+# Number of seconds after which the lock taken by a worker running a chart
+# query expires, in case the worker dies before releasing it
+CACHE_SINGLE_FLIGHT_LOCK_TIMEOUT = 300
+
+# Number of seconds between two reads of the cache by the requests waiting
+# for a chart query run by another one
+CACHE_SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+
+# Caches the results of the time series charts of SQL tables one day at a
+# time so that moving the time range of a chart, or reloading a relative
+# range like "Last 90 days" on the next day, only queries the days that
+# aren't in cache yet. Only applies to time grains of a day or less.
+TIMESERIES_INCREMENTAL_CACHE = False
+
+# Days ending less than this many seconds ago are queried every time rather
+# than served from the incremental cache, as late data may still land in them
+TIMESERIES_INCREMENTAL_CACHE_SETTLE_TIME = 60 * 60 * 24
+
+# Number of charts warmed up concurrently by the `superset warm_up_cache`
+# command, the `cache.warm_up` Celery task and the /warm_up_cache endpoint
+CACHE_WARMUP_MAX_WORKERS = 4
+
+# Number of seconds the partition fields and latest partitions of Presto and
+# Hive tables, used by the `latest_partition` macros, are kept in the
+# TABLE_NAMES_CACHE_CONFIG cache
+PARTITION_METADATA_CACHE_TIMEOUT = 60 * 5
+
+# Number of schemas listed concurrently when fetching the names of all the
+# tables and views of a database for the SQL Lab table picker
+METADATA_FETCH_MAX_WORKERS = 8
+
+# Number of seconds after which a crawl of the table names of a database
+# is considered dead, and started over by the next request, unless it
+# reports back. A running crawl reports every half of it.
+METADATA_CRAWL_HEARTBEAT_TIMEOUT = 60
+
+# Maximum number of queries a single chart (time comparisons, filter box
+# fields, ...) runs concurrently. Set to 1 to run them serially.
+VIZ_QUERIES_MAX_WORKERS = 4
+
+# Maximum number of chart queries a web server process runs at the same time
+# against a given database, None for no limit.
+MAX_CONCURRENT_QUERIES_PER_DATABASE = 10
+
+# Number of rows fetched from the database cursor at a time when running
+# chart queries
+SQL_FETCH_BATCH_SIZE = 10000
+
+# CSV exports are streamed to the client, this is the number of rows
+# fetched from the database and rendered at a time
+CSV_STREAMING_CHUNK_SIZE = 10000
+
 # ---------------------------------------------------
 # Time grain configurations
 # ---------------------------------------------------
@@ -300,7 +380,11 @@ WARNING_MSG = None
 # Example:
 class CeleryConfig(object):
   BROKER_URL = 'sqla+sqlite:///celerydb.sqlite'
-  CELERY_IMPORTS = ('superset.sql_lab', )
+  CELERY_IMPORTS = (
+    'superset.sql_lab',
+    'superset.tasks.cache',
+    'superset.tasks.csv_upload',
+  )
   CELERY_RESULT_BACKEND = 'db+sqlite:///celery_results.sqlite'
   CELERY_ANNOTATIONS = {'tasks.add': {'rate_limit': '10/s'}}
   CELERYD_LOG_LEVEL = 'DEBUG'
@@ -331,11 +415,53 @@ SQLLAB_DEFAULT_DBID = None
 # by celery.
 SQLLAB_ASYNC_TIME_LIMIT_SEC = 60 * 60 * 6
 
+# Settings of the pools of connections to the databases, kept per database,
+# schema and effective user. The keys are passed to sqlalchemy.create_engine
+# and can be overridden by the ``connection_pool`` object of the ``extra``
+# field of each database, ``"enabled": false`` opens a new connection for
+# every query instead. SQL Lab queries always get a connection of their own.
+DEFAULT_DB_CONNECTION_POOL = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 3600,
+    'pool_pre_ping': True,
+}
+
+# Engines, and their pool of connections, that haven't been used for that many
+# seconds are disposed of
+DB_POOL_IDLE_TIMEOUT = 60 * 10
+
 # An instantiated derivative of werkzeug.contrib.cache.BaseCache
 # if enabled, it can be used to store the results of long-running queries
 # in SQL Lab by using the "Run Async" button/feature
 RESULTS_BACKEND = None
 
+# How result sets are serialized into the RESULTS_BACKEND. `msgpack` stores
+# the result set column by column which is much faster to encode and decode
+# for large results than `json` (a zlib compressed JSON list of rows).
+# Blobs written with either format can always be read back.
+RESULTS_BACKEND_SERIALIZATION = 'msgpack'
+
+# An instantiated derivative of werkzeug.contrib.cache.BaseCache shared by the
+# web servers and the workers, used to deliver cancel signals and progress of
+# running SQL Lab queries without polling the metadata database. Defaults to
+# the RESULTS_BACKEND; when neither is set the query row is polled instead.
+SQLLAB_QUERY_CHANNEL_BACKEND = None
+
+# The minimum interval (in seconds) between two commits of the progress of a
+# running SQL Lab query to the metadata database. Progress is still published
+# on the query channel as soon as it changes.
+SQLLAB_PROGRESS_COMMIT_INTERVAL = 5
+
+# When a query channel is available SQL Lab long polls the status updates of
+# queries for up to SQLLAB_QUERY_UPDATES_MAX_WAIT seconds instead of polling
+# the metadata database every couple of seconds. Each long poll holds a web
+# server worker (or thread) while waiting. Clients lagging by more than
+# SQLLAB_QUERY_UPDATES_MAX_EVENTS updates fall back on a regular refresh.
+SQLLAB_QUERY_UPDATES_MAX_WAIT = 5
+SQLLAB_QUERY_UPDATES_MAX_EVENTS = 1000
+
 # The S3 bucket where you want to store your external hive tables created
 # from CSV files. For example, 'companyname-superset'
 CSV_TO_HIVE_UPLOAD_S3_BUCKET = None
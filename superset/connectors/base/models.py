@@ -1,18 +1,75 @@
 # pylint: disable=C,R,W
+from collections import OrderedDict
+from datetime import datetime
+from itertools import chain
 import json
+from types import MappingProxyType
 
 from past.builtins import basestring
+import sqlalchemy as sa
 from sqlalchemy import (
     and_, Boolean, Column, Integer, String, Text,
 )
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import foreign, relationship
+from sqlalchemy.orm import foreign, object_session, relationship, Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
 
 from superset.models.core import Slice
-from superset.models.helpers import AuditMixinNullable, ImportMixin
+from superset.models.helpers import (
+    AuditMixinNullable, copy_detached, ImportMixin,
+)
 from superset.utils import core as utils
 
 
+class DatasourceIndex(object):
+    """Read only lookups of the columns and metrics of a datasource by name
+
+    ``version`` is the ``index_version`` of the datasource the index was
+    built from.
+    """
+
+    def __init__(self, version, columns, metrics):
+        self.version = version
+        self.columns = MappingProxyType(
+            OrderedDict((c.column_name, c) for c in columns))
+        self.metrics = MappingProxyType(
+            OrderedDict((m.metric_name, m) for m in metrics))
+
+
+# shared indexes by datasource uid, see ``BaseDatasource.index``
+_shared_indexes = {}
+
+# (version, JSON) by datasource uid, see ``BaseDatasource.data_json``
+_data_payloads = {}
+
+
+def touch_datasources_on_flush(datasource_class, child_classes, foreign_key):
+    """Updates the ``changed_on`` of the datasources whose columns or metrics
+    (``child_classes``) are inserted, updated or deleted, which changes their
+    ``index_version``
+
+    The datasources touched by a flush are updated by a single statement at
+    the end of the flush.
+    """
+    datasources = datasource_class.__table__
+
+    def after_flush(session, flush_context):
+        ids = {
+            getattr(obj, foreign_key)
+            for obj in chain(session.new, session.dirty, session.deleted)
+            if isinstance(obj, child_classes)
+        }
+        ids.discard(None)
+        if ids:
+            session.execute(
+                datasources.update()
+                .where(datasources.c.id.in_(sorted(ids)))
+                .values(changed_on=datetime.now()))
+
+    sa.event.listen(Session, 'after_flush', after_flush)
+
+
 class BaseDatasource(AuditMixinNullable, ImportMixin):
     """A common interface to objects that are queryable
     (tables and datasources)"""
@@ -63,11 +120,84 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
     # placeholder for a relationship to a derivative of BaseMetric
     metrics = []
 
+    # whether ``build_index`` returns objects that can be shared across
+    # sessions and threads
+    share_index = False
+
     @property
     def uid(self):
         """Unique id across datasource types"""
         return '{self.id}__{self.type}'.format(**locals())
 
+    @property
+    def index_version(self):
+        """Changes whenever the columns or metrics of the datasource do"""
+        return self.changed_on
+
+    def build_index(self):
+        return DatasourceIndex(self.index_version, self.columns, self.metrics)
+
+    def detached_copy(self):
+        """Returns a copy of the datasource, its columns, metrics and the
+        objects it points to (database, cluster, owner) outside of any session
+
+        Unlike the datasource itself, the copy can build and run queries from
+        other threads as long as it isn't altered. Returns ``None`` for
+        datasources that aren't ORM objects.
+        """
+        mapper = sa.inspect(type(self), raiseerr=False)
+        if mapper is None:
+            return None
+        datasource = copy_detached(self)
+        for rel in mapper.relationships:
+            if rel.direction is MANYTOONE:
+                obj = getattr(self, rel.key)
+                set_committed_value(
+                    datasource, rel.key,
+                    copy_detached(obj) if obj is not None else None)
+        for key in ('columns', 'metrics'):
+            children = [copy_detached(obj) for obj in getattr(self, key)]
+            backref = mapper.relationships[key].back_populates
+            for child in children:
+                set_committed_value(child, backref, datasource)
+            set_committed_value(datasource, key, children)
+        return datasource
+
+    def has_pending_changes(self):
+        """Whether datasources, columns or metrics have changes that weren't
+        flushed in the session of the datasource, which ``index_version``
+        doesn't reflect yet"""
+        session = object_session(self)
+        if session is None:
+            return False
+        classes = tuple(
+            cls for cls in (type(self), self.column_class, self.metric_class)
+            if cls is not None)
+        return any(
+            isinstance(obj, classes)
+            for obj in chain(session.new, session.dirty, session.deleted))
+
+    @property
+    def index(self):
+        """Returns a ``DatasourceIndex`` of the datasource
+
+        When ``share_index`` is set the index is built once per process and
+        version of the datasource, sparing further requests from loading
+        its columns and metrics. It's built from the live objects while the
+        session holds changes to them.
+        """
+        version = self.index_version
+        if (
+                not self.share_index or
+                self.id is None or
+                version is None or
+                self.has_pending_changes()):
+            return self.build_index()
+        index = _shared_indexes.get(self.uid)
+        if index is None or index.version != version:
+            index = _shared_indexes[self.uid] = self.build_index()
+        return index
+
     @property
     def column_names(self):
         return sorted([c.column_name for c in self.columns])
@@ -210,6 +340,22 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
             'select_star': self.select_star,
         }
 
+    @property
+    def data_json(self):
+        """``data`` serialized to JSON
+
+        The payload is serialized once per process and ``index_version`` of
+        the datasource, which changes with the datasource, its columns and
+        metrics.
+        """
+        version = self.index_version
+        if self.id is None or version is None:
+            return json.dumps(self.data)
+        payload = _data_payloads.get(self.uid)
+        if payload is None or payload[0] != version:
+            payload = _data_payloads[self.uid] = (version, json.dumps(self.data))
+        return payload[1]
+
     @staticmethod
     def filter_values_handler(
             values, target_column_is_numeric=False, is_list_target=False):
@@ -250,10 +396,17 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
         understand what is taking place behind the scene"""
         raise NotImplementedError()
 
-    def query(self, query_obj):
+    def format_query_str(self, query_str):
+        """Makes a query returned by ``get_query_str`` easier to read
+
+        Only called when the query is displayed to the user."""
+        return query_str
+
+    def query(self, query_obj, force=False):
         """Executes the query and returns a dataframe
 
         query_obj is a dictionary representing Superset's query interface.
+        ``force`` bypasses the results the datasource may have cached.
         Should return a ``superset.models.helpers.QueryResult``
         """
         raise NotImplementedError()
@@ -269,6 +422,12 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
     def default_query(qry):
         return qry
 
+    @classmethod
+    def eager_query(cls, qry):
+        """Adds to ``qry`` the options loading the relationships ``data``
+        goes through"""
+        return qry
+
     def get_column(self, column_name):
         for col in self.columns:
             if col.column_name == column_name:
@@ -1,4 +1,6 @@
 # pylint: disable=C,R,W
+from collections import defaultdict
+
 from sqlalchemy.orm import subqueryload
 
 
@@ -24,6 +26,29 @@ class ConnectorRegistry(object):
             .first()
         )
 
+    @classmethod
+    def get_datasources_by_ids(cls, session, datasource_ids):
+        """Fetches the datasources of ``(datasource_type, datasource_id)``
+        pairs with a query per type, along with what their ``data`` uses
+
+        Returns a dict keyed by these pairs, missing datasources are left
+        out.
+        """
+        ids_by_type = defaultdict(set)
+        for datasource_type, datasource_id in datasource_ids:
+            if datasource_type in cls.sources and datasource_id is not None:
+                ids_by_type[datasource_type].add(datasource_id)
+        datasources = {}
+        for datasource_type, ids in ids_by_type.items():
+            datasource_class = cls.sources[datasource_type]
+            qry = (
+                session.query(datasource_class)
+                .filter(datasource_class.id.in_(sorted(ids)))
+            )
+            for datasource in datasource_class.eager_query(qry):
+                datasources[(datasource_type, datasource.id)] = datasource
+        return datasources
+
     @classmethod
     def get_all_datasources(cls, session):
         datasources = []
@@ -28,15 +28,17 @@ import sqlalchemy as sa
 from sqlalchemy import (
     Boolean, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint,
 )
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, joinedload, relationship, subqueryload
 
-from superset import conf, db, security_manager
-from superset.connectors.base.models import BaseColumn, BaseDatasource, BaseMetric
+from superset import cache, conf, db, security_manager
+from superset.connectors.base.models import (
+    BaseColumn, BaseDatasource, BaseMetric, touch_datasources_on_flush,
+)
 from superset.exceptions import MetricPermException, SupersetException
 from superset.models.helpers import (
     AuditMixinNullable, ImportMixin, QueryResult,
 )
-from superset.utils import core as utils, import_datasource
+from superset.utils import core as utils, druid_query_cache, import_datasource
 from superset.utils.core import (
     DimSelector, DTTM_ALIAS, flasher,
 )
@@ -493,6 +495,15 @@ class DruidDatasource(Model, BaseDatasource):
     def database(self):
         return self.cluster
 
+    @property
+    def index_version(self):
+        cluster = self.cluster
+        return (
+            self.changed_on,
+            self.cluster_name,
+            cluster.changed_on if cluster else None,
+        )
+
     @property
     def connection(self):
         return str(self.database)
@@ -524,6 +535,15 @@ class DruidDatasource(Model, BaseDatasource):
             '[{obj.cluster_name}].[{obj.datasource_name}]'
             '(id:{obj.id})').format(obj=self)
 
+    @classmethod
+    def eager_query(cls, qry):
+        return qry.options(
+            subqueryload(cls.columns),
+            subqueryload(cls.metrics),
+            joinedload(cls.cluster),
+            joinedload(cls.owner),
+        )
+
     def update_from_object(self, obj):
         return NotImplementedError()
 
@@ -936,8 +956,23 @@ class DruidDatasource(Model, BaseDatasource):
         df = client.export_pandas()
         return [row[column_name] for row in df.to_records(index=False)]
 
-    def get_query_str(self, query_obj, phase=1, client=None):
-        return self.run_query(client=client, phase=phase, **query_obj)
+    def run_pydruid_query(self, client, query_type, qry, phase=2, force=False):
+        """Runs ``qry`` with ``client``, through the Druid query cache when
+        ``DRUID_QUERY_CACHE_TIMEOUT`` is set
+
+        ``phase`` is 1 for the queries finding the top values of two-phase
+        queries, 2 for the others. With ``force`` the query is sent to Druid
+        and its results replace the cached ones.
+        """
+        cache_timeout = conf.get('DRUID_QUERY_CACHE_TIMEOUT')
+        if not cache_timeout or not cache:
+            return getattr(client, query_type)(**qry)
+        return druid_query_cache.run_query(
+            client, query_type, qry, cache, cache_timeout,
+            phase=phase, namespace=self.cluster_name, force=force)
+
+    def get_query_str(self, query_obj, phase=1, client=None, force=False):
+        return self.run_query(client=client, phase=phase, force=force, **query_obj)
 
     def _add_filter_from_pre_query_data(self, df, dimensions, dim_filter):
         ret = dim_filter
@@ -1107,6 +1142,7 @@ class DruidDatasource(Model, BaseDatasource):
             order_desc=True,
             prequeries=None,
             is_prequery=False,
+            force=False,
         ):
         """Runs a query against Druid and returns a dataframe.
         """
@@ -1176,11 +1212,11 @@ class DruidDatasource(Model, BaseDatasource):
             qry['metrics'] = []
             qry['granularity'] = 'all'
             qry['limit'] = row_limit
-            client.scan(**qry)
+            self.run_pydruid_query(client, 'scan', qry, force=force)
         elif len(groupby) == 0 and not having_filters:
             logging.info('Running timeseries query for no groupby values')
             del qry['dimensions']
-            client.timeseries(**qry)
+            self.run_pydruid_query(client, 'timeseries', qry, force=force)
         elif (
                 not having_filters and
                 len(groupby) == 1 and
@@ -1210,7 +1246,8 @@ class DruidDatasource(Model, BaseDatasource):
             pre_qry['dimension'] = self._dimensions_to_values(qry.get('dimensions'))[0]
             del pre_qry['dimensions']
 
-            client.topn(**pre_qry)
+            self.run_pydruid_query(
+                client, 'topn', pre_qry, phase=1, force=force)
             logging.info('Phase 1 Complete')
             if phase == 2:
                 query_str += '// Two phase query\n// Phase 1\n'
@@ -1232,7 +1269,7 @@ class DruidDatasource(Model, BaseDatasource):
             qry['dimension'] = dim
             del qry['dimensions']
             qry['metric'] = list(qry['aggregations'].keys())[0]
-            client.topn(**qry)
+            self.run_pydruid_query(client, 'topn', qry, force=force)
             logging.info('Phase 2 Complete')
         elif len(groupby) > 0 or having_filters:
             # If grouping on multiple fields or using a having filter
@@ -1282,7 +1319,8 @@ class DruidDatasource(Model, BaseDatasource):
                         'direction': order_direction,
                     }],
                 }
-                client.groupby(**pre_qry)
+                self.run_pydruid_query(
+                    client, 'groupby', pre_qry, phase=1, force=force)
                 logging.info('Phase 1 Complete')
                 query_str += '// Two phase query\n// Phase 1\n'
                 query_str += json.dumps(
@@ -1313,7 +1351,7 @@ class DruidDatasource(Model, BaseDatasource):
                         'direction': order_direction,
                     }],
                 }
-            client.groupby(**qry)
+            self.run_pydruid_query(client, 'groupby', qry, force=force)
             logging.info('Query Complete')
         query_str += json.dumps(
             client.query_builder.last_query.query_dict, indent=2)
@@ -1334,11 +1372,11 @@ class DruidDatasource(Model, BaseDatasource):
             df[col] = df[col].fillna('<NULL>').astype('unicode')
         return df
 
-    def query(self, query_obj):
+    def query(self, query_obj, force=False):
         qry_start_dttm = datetime.now()
         client = self.cluster.get_pydruid_client()
         query_str = self.get_query_str(
-            client=client, query_obj=query_obj, phase=2)
+            client=client, query_obj=query_obj, phase=2, force=force)
         df = client.export_pandas()
 
         if df is None or df.size == 0:
@@ -1598,3 +1636,7 @@ class DruidDatasource(Model, BaseDatasource):
 
 sa.event.listen(DruidDatasource, 'after_insert', security_manager.set_perm)
 sa.event.listen(DruidDatasource, 'after_update', security_manager.set_perm)
+
+
+touch_datasources_on_flush(
+    DruidDatasource, (DruidColumn, DruidMetric), 'datasource_id')
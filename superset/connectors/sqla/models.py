@@ -1,4 +1,5 @@
 # pylint: disable=C,R,W
+from collections import OrderedDict
 from datetime import datetime
 import logging
 
@@ -12,14 +13,18 @@ from sqlalchemy import (
     select, String, Text,
 )
 from sqlalchemy.exc import CompileError
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import backref, joinedload, relationship, subqueryload
 from sqlalchemy.schema import UniqueConstraint
-from sqlalchemy.sql import column, literal_column, table, text
-from sqlalchemy.sql.expression import TextAsFrom
+from sqlalchemy.sql import column, literal, literal_column, table, text, tuple_
+from sqlalchemy.sql.expression import ColumnElement, TextAsFrom
 import sqlparse
 
 from superset import app, db, security_manager
-from superset.connectors.base.models import BaseColumn, BaseDatasource, BaseMetric
+from superset.connectors.base.models import (
+    BaseColumn, BaseDatasource, BaseMetric, DatasourceIndex,
+    touch_datasources_on_flush,
+)
 from superset.jinja_context import get_template_processor
 from superset.models.annotations import Annotation
 from superset.models.core import Database
@@ -29,6 +34,19 @@ from superset.utils import core as utils, import_datasource
 config = app.config
 
 
+class LiteralValues(ColumnElement):
+    """A ``VALUES`` list of literal rows, for ``(a, b) IN (VALUES ...)``"""
+
+    def __init__(self, rows):
+        self.rows = [tuple_(*[literal(v) for v in row]) for row in rows]
+
+
+@compiles(LiteralValues)
+def compile_literal_values(element, compiler, **kw):
+    return '(VALUES {})'.format(
+        ', '.join(compiler.process(row, **kw) for row in element.rows))
+
+
 class AnnotationDatasource(BaseDatasource):
     """ Dummy object so we can query annotations using 'Viz' objects just like
         regular datasources.
@@ -36,7 +54,7 @@ class AnnotationDatasource(BaseDatasource):
 
     cache_timeout = 0
 
-    def query(self, query_obj):
+    def query(self, query_obj, force=False):
         df = None
         error_message = None
         qry = db.session.query(Annotation)
@@ -107,13 +125,14 @@ class TableColumn(Model, BaseColumn):
     def datasource(self):
         return self.table
 
-    def get_time_filter(self, start_dttm, end_dttm):
+    def get_time_filter(self, start_dttm, end_dttm, end_inclusive=True):
         col = self.get_sqla_col(label='__time')
         l = []  # noqa: E741
         if start_dttm:
             l.append(col >= text(self.dttm_sql_literal(start_dttm)))
         if end_dttm:
-            l.append(col <= text(self.dttm_sql_literal(end_dttm)))
+            end = text(self.dttm_sql_literal(end_dttm))
+            l.append(col <= end if end_inclusive else col < end)
         return and_(*l)
 
     def get_timestamp_expression(self, time_grain):
@@ -290,6 +309,8 @@ class SqlaTable(Model, BaseDatasource):
     export_parent = 'database'
     export_children = ['metrics', 'columns']
 
+    share_index = True
+
     sqla_aggregations = {
         'COUNT_DISTINCT': lambda column_name: sa.func.COUNT(sa.distinct(column_name)),
         'COUNT': sa.func.COUNT,
@@ -347,7 +368,8 @@ class SqlaTable(Model, BaseDatasource):
 
     @property
     def dttm_cols(self):
-        l = [c.column_name for c in self.columns if c.is_dttm]  # noqa: E741
+        l = [  # noqa: E741
+            name for name, c in self.index.columns.items() if c.is_dttm]
         if self.main_dttm_col and self.main_dttm_col not in l:
             l.append(self.main_dttm_col)
         return l
@@ -400,11 +422,23 @@ class SqlaTable(Model, BaseDatasource):
         return self.database.select_star(
             self.name, show_cols=False, latest_partition=False)
 
+    @property
+    def index_version(self):
+        database = self.database
+        return (
+            self.changed_on,
+            database.id if database else None,
+            database.changed_on if database else None,
+        )
+
+    def build_index(self):
+        """Indexes detached copies of the columns, metrics, table and
+        database, which remain usable to build queries in other sessions"""
+        table = self.detached_copy()
+        return DatasourceIndex(self.index_version, table.columns, table.metrics)
+
     def get_col(self, col_name):
-        columns = self.columns
-        for col in columns:
-            if col_name == col.column_name:
-                return col
+        return self.index.columns.get(col_name)
 
     @property
     def data(self):
@@ -423,8 +457,7 @@ class SqlaTable(Model, BaseDatasource):
         """Runs query against sqla to retrieve some
         sample values for the given column.
         """
-        cols = {col.column_name: col for col in self.columns}
-        target_col = cols[column_name]
+        target_col = self.index.columns[column_name]
         tp = self.get_template_processor()
 
         qry = (
@@ -439,13 +472,12 @@ class SqlaTable(Model, BaseDatasource):
             tp = self.get_template_processor()
             qry = qry.where(tp.process_template(self.fetch_values_predicate))
 
-        engine = self.database.get_sqla_engine()
-        sql = '{}'.format(
-            qry.compile(engine, compile_kwargs={'literal_binds': True}),
-        )
+        sql = self.database.compile_sqla_query(qry)
         sql = self.mutate_query_from_config(sql)
 
-        df = pd.read_sql_query(sql=sql, con=engine)
+        # the percent signs aren't escaped anymore, the SQL has to go through
+        # a raw DBAPI cursor which doesn't format it with parameters
+        df = self.database.get_df(sql, None)
         return [row[0] for row in df.to_records(index=False)]
 
     def mutate_query_from_config(self, sql):
@@ -466,12 +498,14 @@ class SqlaTable(Model, BaseDatasource):
         qry = self.get_sqla_query(**query_obj)
         sql = self.database.compile_sqla_query(qry)
         logging.info(sql)
-        sql = sqlparse.format(sql, reindent=True)
         if query_obj['is_prequery']:
             query_obj['prequeries'].append(sql)
         sql = self.mutate_query_from_config(sql)
         return sql
 
+    def format_query_str(self, sql):
+        return sqlparse.format(sql, reindent=True)
+
     def get_sqla_table(self):
         tbl = table(self.table_name)
         if self.schema:
@@ -546,7 +580,7 @@ class SqlaTable(Model, BaseDatasource):
             'row_limit': row_limit,
             'to_dttm': to_dttm,
             'filter': filter,
-            'columns': {col.column_name: col for col in self.columns},
+            'columns': dict(self.index.columns),
         }
         template_kwargs.update(self.template_params_dict)
         template_processor = self.get_template_processor(**template_kwargs)
@@ -561,8 +595,9 @@ class SqlaTable(Model, BaseDatasource):
         # Database spec supports join-free timeslot grouping
         time_groupby_inline = db_engine_spec.time_groupby_inline
 
-        cols = {col.column_name: col for col in self.columns}
-        metrics_dict = {m.metric_name: m for m in self.metrics}
+        index = self.index
+        cols = index.columns
+        metrics_dict = index.metrics
 
         if not granularity and is_timeseries:
             raise Exception(_(
@@ -608,6 +643,10 @@ class SqlaTable(Model, BaseDatasource):
         if granularity:
             dttm_col = cols[granularity]
             time_grain = extras.get('time_grain_sqla')
+            # ('inclusive', 'exclusive') leaves out the rows at to_dttm
+            end_inclusive = (
+                extras.get('time_range_endpoints', [None, 'inclusive'])[1] !=
+                'exclusive')
             time_filters = []
 
             if is_timeseries:
@@ -619,9 +658,10 @@ class SqlaTable(Model, BaseDatasource):
             if db_engine_spec.time_secondary_columns and \
                     self.main_dttm_col in self.dttm_cols and \
                     self.main_dttm_col != dttm_col.column_name:
-                time_filters.append(cols[self.main_dttm_col].
-                                    get_time_filter(from_dttm, to_dttm))
-            time_filters.append(dttm_col.get_time_filter(from_dttm, to_dttm))
+                time_filters.append(cols[self.main_dttm_col].get_time_filter(
+                    from_dttm, to_dttm, end_inclusive))
+            time_filters.append(
+                dttm_col.get_time_filter(from_dttm, to_dttm, end_inclusive))
 
         select_exprs += metrics_exprs
         qry = sa.select(select_exprs)
@@ -758,7 +798,6 @@ class SqlaTable(Model, BaseDatasource):
                     'order_desc': True,
                 }
                 result = self.query(subquery_obj)
-                cols = {col.column_name: col for col in self.columns}
                 dimensions = [
                     c for c in result.df.columns
                     if c not in metrics and c in cols
@@ -769,18 +808,73 @@ class SqlaTable(Model, BaseDatasource):
         return qry.select_from(tbl)
 
     def _get_top_groups(self, df, dimensions):
-        cols = {col.column_name: col for col in self.columns}
+        """Returns a filter matching the combinations of ``dimensions`` found
+        in ``df``, the results of the top groups prequery
+
+        Depending on ``top_groups_filter`` of the engine spec, the groups are
+        matched at once with ``(a, b) IN ((1, 2), ...)`` (``tuple_in``) or
+        ``(a, b) IN (VALUES (1, 2), ...)`` (``values``), with an ``IN`` on
+        the last dimension per combination of the others,
+        ``a = 1 AND b IN (2, 3) OR ...`` (``nested_in``), otherwise with a
+        disjunction of equalities per group. A single dimension is always
+        matched with ``IN``, and groups holding NULLs with equalities since
+        NULL never matches ``IN``.
+        """
+        cols = self.index.columns
+        sqla_cols = [cols[dimension].get_sqla_col() for dimension in dimensions]
+        strategy = self.database.db_engine_spec.top_groups_filter
+        if len(dimensions) == 1 and strategy is None:
+            strategy = 'tuple_in'
+        if strategy is None or df.empty:
+            return self._get_top_groups_expanded(df, dimensions, sqla_cols)
+
+        groups_df = df[dimensions]
+        has_nulls = groups_df.isnull().any(axis=1)
+        values = [
+            groups_df[dimension][~has_nulls].astype(object).tolist()
+            for dimension in dimensions
+        ]
+        rows = list(zip(*values))
+        groups = []
+        if rows and len(dimensions) == 1:
+            groups.append(sqla_cols[0].in_([row[0] for row in rows]))
+        elif rows and strategy == 'values':
+            groups.append(tuple_(*sqla_cols).op('IN')(LiteralValues(rows)))
+        elif rows and strategy == 'nested_in':
+            groups.append(self._get_top_groups_nested(rows, sqla_cols))
+        elif rows:
+            groups.append(tuple_(*sqla_cols).in_(
+                [tuple_(*[literal(v) for v in row]) for row in rows]))
+        if has_nulls.any():
+            groups.append(self._get_top_groups_expanded(
+                df[has_nulls], dimensions, sqla_cols))
+        return or_(*groups)
+
+    def _get_top_groups_nested(self, rows, sqla_cols):
+        last_values = OrderedDict()
+        for row in rows:
+            last_values.setdefault(row[:-1], []).append(row[-1])
+
+        groups = []
+        for leading, values in last_values.items():
+            group = [
+                sqla_col == value for sqla_col, value in zip(sqla_cols, leading)]
+            group.append(sqla_cols[-1].in_(values))
+            groups.append(and_(*group))
+        return or_(*groups)
+
+    def _get_top_groups_expanded(self, df, dimensions, sqla_cols):
         groups = []
         for unused, row in df.iterrows():
             group = []
-            for dimension in dimensions:
-                col_obj = cols.get(dimension)
-                group.append(col_obj.get_sqla_col() == row[dimension])
+            for dimension, sqla_col in zip(dimensions, sqla_cols):
+                value = row[dimension]
+                group.append(sqla_col == (None if pd.isnull(value) else value))
             groups.append(and_(*group))
 
         return or_(*groups)
 
-    def query(self, query_obj):
+    def query(self, query_obj, force=False):
         qry_start_dttm = datetime.now()
         sql = self.get_query_str(query_obj)
         status = utils.QueryStatus.SUCCESS
@@ -807,6 +901,11 @@ class SqlaTable(Model, BaseDatasource):
             query=sql,
             error_message=error_message)
 
+    def query_chunks(self, query_obj, chunk_size=None):
+        """Yields the results of ``query_obj`` as DataFrames of ``chunk_size`` rows"""
+        sql = self.get_query_str(query_obj)
+        return self.database.get_df_chunks(sql, self.schema, chunk_size)
+
     def get_sqla_table_object(self):
         return self.database.get_table(self.table_name, schema=self.schema)
 
@@ -908,6 +1007,18 @@ class SqlaTable(Model, BaseDatasource):
     def default_query(qry):
         return qry.filter_by(is_sqllab_view=False)
 
+    @classmethod
+    def eager_query(cls, qry):
+        return qry.options(
+            subqueryload(cls.columns),
+            subqueryload(cls.metrics),
+            joinedload(cls.database),
+            joinedload(cls.owner),
+        )
+
 
 sa.event.listen(SqlaTable, 'after_insert', security_manager.set_perm)
 sa.event.listen(SqlaTable, 'after_update', security_manager.set_perm)
+
+
+touch_datasources_on_flush(SqlaTable, (TableColumn, SqlMetric), 'table_id')
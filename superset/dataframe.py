@@ -11,7 +11,6 @@ import logging
 
 import numpy as np
 import pandas as pd
-from pandas.core.common import _maybe_box_datetimelike
 from pandas.core.dtypes.dtypes import ExtensionDtype
 from past.builtins import basestring
 
@@ -45,6 +44,82 @@ def dedup(l, suffix='__', case_sensitive=True):
     return new_l
 
 
+def column_to_list(values):
+    """Converts a column into a list of JSON friendly python values
+
+    The conversion is done for the whole column at once: datetimes and
+    timedeltas are boxed into ``pd.Timestamp`` and ``pd.Timedelta`` (``NaT``
+    becoming ``None``) and integers too big for Java Script to handle are
+    turned into strings, using numpy masks to find them rather than checking
+    every cell.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        index = pd.DatetimeIndex(values)
+        boxed = np.array(index.astype(object), dtype=object)
+        if index.hasnans:
+            boxed[np.asarray(index.isna())] = None
+        return boxed.tolist()
+
+    if pd.api.types.is_timedelta64_dtype(values):
+        index = pd.TimedeltaIndex(values)
+        boxed = np.array(index.astype(object), dtype=object)
+        if index.hasnans:
+            boxed[np.asarray(index.isna())] = None
+        return boxed.tolist()
+
+    arr = np.asarray(values)
+    if arr.dtype.kind in 'iu':
+        mask = arr > JS_MAX_INTEGER
+        if arr.dtype.kind == 'i':
+            mask |= arr < -JS_MAX_INTEGER
+        if mask.any():
+            boxed = arr.astype(object)
+            boxed[mask] = arr[mask].astype(str)
+            return boxed.tolist()
+    elif arr.dtype.kind == 'O' and pd.api.types.infer_dtype(
+            arr, skipna=True) in ('integer', 'mixed-integer', 'mixed-integer-float'):
+        # python ints are unbounded, the ones that don't fit in an int64
+        # end up in object columns
+        return [
+            str(v) if isinstance(v, int) and abs(v) > JS_MAX_INTEGER else v
+            for v in arr.tolist()
+        ]
+    return arr.tolist()
+
+
+def df_to_records(df):
+    """Converts a DataFrame into a list of dicts, one column at a time"""
+    names = list(df.columns)
+    columns = [column_to_list(df.iloc[:, i]) for i in range(len(names))]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def df_from_batches(batches, columns):
+    """Builds a DataFrame from batches of DB-API rows
+
+    Each batch is transposed into per column buffers as it is fetched, so the
+    full result set is never held as a list of row tuples, and each buffer is
+    released as soon as its column is built. Decimals are coerced to floats,
+    as ``DataFrame.from_records(coerce_float=True)`` does.
+    """
+    buffers = [[] for _ in columns]
+    for batch in batches:
+        for buf, values in zip(buffers, zip(*batch)):
+            buf.extend(values)
+    series = []
+    for i in range(len(buffers)):
+        col = pd.Series(buffers[i])
+        buffers[i] = None
+        if (
+                col.dtype == np.object_ and
+                pd.api.types.infer_dtype(col, skipna=True) == 'decimal'):
+            col = col.astype(float)
+        series.append(col)
+    df = pd.concat(series, axis=1) if series else pd.DataFrame()
+    df.columns = columns
+    return df
+
+
 class SupersetDataFrame(object):
     # Mapping numpy dtype.char to generic database types
     type_map = {
@@ -69,9 +144,13 @@ class SupersetDataFrame(object):
 
         self.column_names = dedup(column_names)
 
-        data = data or []
-        self.df = (
-            pd.DataFrame(list(data), columns=self.column_names).infer_objects())
+        if isinstance(data, pd.DataFrame):
+            self.df = data
+        else:
+            data = data or []
+            self.df = (
+                pd.DataFrame(list(data), columns=self.column_names)
+                .infer_objects())
 
         self._type_dict = {}
         try:
@@ -84,24 +163,21 @@ class SupersetDataFrame(object):
         except Exception as e:
             logging.exception(e)
 
+    @classmethod
+    def from_batches(cls, batches, cursor_description, db_engine_spec):
+        """Builds the SupersetDataFrame of rows fetched in batches, see
+        ``df_from_batches``"""
+        column_names = dedup([col[0] for col in cursor_description or []])
+        df = df_from_batches(batches, column_names)
+        return cls(df, cursor_description, db_engine_spec)
+
     @property
     def size(self):
         return len(self.df.index)
 
     @property
     def data(self):
-        # work around for https://github.com/pandas-dev/pandas/issues/18372
-        data = [dict((k, _maybe_box_datetimelike(v))
-                for k, v in zip(self.df.columns, np.atleast_1d(row)))
-                for row in self.df.values]
-        for d in data:
-            for k, v in list(d.items()):
-                # if an int is too big for Java Script to handle
-                # convert it to a string
-                if isinstance(v, int):
-                    if abs(v) > JS_MAX_INTEGER:
-                        d[k] = str(v)
-        return data
+        return df_to_records(self.df)
 
     @classmethod
     def db_type(cls, dtype):
@@ -13,12 +13,18 @@ at all. The classes here will use a common interface to specify all this.
 The general idea is to use static classes and an inheritance scheme.
 """
 from collections import namedtuple
+import csv
+import functools
+import hashlib
 import inspect
+import io
+import json
 import logging
 import os
 import re
 import textwrap
 import time
+import uuid
 
 import boto3
 from flask import g
@@ -35,9 +41,11 @@ import sqlparse
 from tableschema import Table
 from werkzeug.utils import secure_filename
 
-from superset import app, conf, db, sql_parse
+from superset import app, conf, db, sql_parse, tables_cache
 from superset.exceptions import SupersetTemplateException
 from superset.utils import core as utils
+from superset.utils.concurrency import run_concurrently
+from superset.utils.query_channel import get_query_channel, ProgressReporter
 
 QueryStatus = utils.QueryStatus
 config = app.config
@@ -98,6 +106,12 @@ class BaseEngineSpec(object):
     allows_subquery = True
     force_column_alias_quotes = False
     arraysize = None
+    server_side_cursors = False
+    allows_connection_pooling = True
+    # How to filter on the top groups found by a prequery, only run when the
+    # engine doesn't support inner joins, see ``SqlaTable._get_top_groups``:
+    # 'tuple_in', 'values', 'nested_in' or None for a disjunction of equalities
+    top_groups_filter = None
 
     @classmethod
     def get_time_grains(cls):
@@ -117,6 +131,39 @@ class BaseEngineSpec(object):
             return cursor.fetchmany(limit)
         return cursor.fetchall()
 
+    @classmethod
+    def fetch_data_in_batches(cls, cursor, batch_size, limit=None):
+        """Yields the rows of ``cursor`` in lists of at most ``batch_size``
+
+        :param limit: stop after that many rows have been fetched
+        """
+        if cls.arraysize:
+            cursor.arraysize = cls.arraysize
+        fetched = 0
+        while not limit or fetched < limit:
+            size = batch_size if not limit else min(batch_size, limit - fetched)
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            fetched += len(rows)
+            yield rows
+
+    @classmethod
+    def get_cursor(cls, conn, server_side=False):
+        """Returns a cursor, a server-side one if supported and asked for
+
+        Server-side cursors stream the results from the database instead of
+        buffering the whole result set client-side, they are only used for
+        single ``SELECT`` statements.
+        """
+        if server_side and cls.server_side_cursors:
+            return cls.get_server_side_cursor(conn)
+        return conn.cursor()
+
+    @classmethod
+    def get_server_side_cursor(cls, conn):
+        raise NotImplementedError()
+
     @classmethod
     def epoch_to_dttm(cls):
         raise NotImplementedError()
@@ -164,27 +211,61 @@ class BaseEngineSpec(object):
         return parsed_query.get_query_with_new_limit(limit)
 
     @staticmethod
-    def csv_to_df(**kwargs):
+    def csv_to_df_chunks(**kwargs):
+        """Reads an uploaded CSV file into DataFrames of ``chunksize`` rows"""
         kwargs['filepath_or_buffer'] = \
             config['UPLOAD_FOLDER'] + kwargs['filepath_or_buffer']
         kwargs['encoding'] = 'utf-8'
         kwargs['iterator'] = True
-        chunks = pandas.read_csv(**kwargs)
-        df = pandas.DataFrame()
-        df = pandas.concat(chunk for chunk in chunks)
-        return df
-
-    @staticmethod
-    def df_to_db(df, table, **kwargs):
-        df.to_sql(**kwargs)
-        table.user_id = g.user.id
-        table.schema = kwargs['schema']
-        table.fetch_metadata()
-        db.session.add(table)
-        db.session.commit()
+        return pandas.read_csv(**kwargs)
 
     @staticmethod
-    def create_table_from_csv(form, table):
+    def create_table_from_df(df, name, con, schema=None, if_exists='fail',
+                             index=True, index_label=None):
+        """Creates the table ``df.to_sql`` would insert ``df`` into, without
+        inserting it"""
+        pandas_sql = pandas.io.sql.SQLDatabase(con, schema=schema)
+        table = pandas.io.sql.SQLTable(
+            name, pandas_sql, frame=df, index=index, if_exists=if_exists,
+            index_label=index_label, schema=schema)
+        table.create()
+
+    @classmethod
+    def insert_df(cls, df, name, con, schema=None, index=True, index_label=None):
+        """Appends the rows of ``df`` to an existing table"""
+        df.to_sql(
+            name, con, schema=schema, if_exists='append', index=index,
+            index_label=index_label)
+
+    @classmethod
+    def df_chunks_to_sql(cls, chunks, name, con, schema=None, if_exists='fail',
+                         index=True, index_label=None, progress=None):
+        """Creates the table ``name`` from the first of the ``chunks``
+        DataFrames and appends them all to it in a single transaction
+
+        Only one chunk is held in memory at a time. ``progress`` is called
+        with the number of rows inserted so far after each chunk. Returns
+        the number of rows inserted.
+        """
+        rows = 0
+        with con.begin() as connection:
+            for i, df in enumerate(chunks):
+                if i == 0:
+                    cls.create_table_from_df(
+                        df, name, connection, schema=schema,
+                        if_exists=if_exists, index=index,
+                        index_label=index_label)
+                cls.insert_df(
+                    df, name, connection, schema=schema, index=index,
+                    index_label=index_label)
+                rows += len(df)
+                logging.info('Inserted {} rows into {}'.format(rows, name))
+                if progress:
+                    progress(rows)
+        return rows
+
+    @classmethod
+    def create_table_from_csv(cls, form, table, progress=None):
         def _allowed_file(filename):
             # Only allow specific file extensions as specified in the config
             extension = os.path.splitext(filename)[1]
@@ -205,23 +286,31 @@ class BaseEngineSpec(object):
             'skip_blank_lines': form.skip_blank_lines.data,
             'parse_dates': form.parse_dates.data,
             'infer_datetime_format': form.infer_datetime_format.data,
-            'chunksize': 10000,
-        }
-        df = BaseEngineSpec.csv_to_df(**kwargs)
-
-        df_to_db_kwargs = {
-            'table': table,
-            'df': df,
-            'name': form.name.data,
-            'con': create_engine(form.con.data.sqlalchemy_uri_decrypted, echo=False),
-            'schema': form.schema.data,
-            'if_exists': form.if_exists.data,
-            'index': form.index.data,
-            'index_label': form.index_label.data,
-            'chunksize': 10000,
+            'chunksize': config.get('CSV_UPLOAD_CHUNK_SIZE'),
         }
+        chunks = cls.csv_to_df_chunks(**kwargs)
+        engine = create_engine(
+            form.con.data.sqlalchemy_uri_decrypted, echo=False)
+        try:
+            cls.df_chunks_to_sql(
+                chunks,
+                name=form.name.data,
+                con=engine,
+                schema=form.schema.data,
+                if_exists=form.if_exists.data,
+                index=form.index.data,
+                index_label=form.index_label.data,
+                progress=progress,
+            )
+        finally:
+            chunks.close()
+            engine.dispose()
 
-        BaseEngineSpec.df_to_db(**df_to_db_kwargs)
+        table.user_id = g.user.id
+        table.schema = form.schema.data
+        table.fetch_metadata()
+        db.session.add(table)
+        db.session.commit()
 
     @classmethod
     def convert_dttm(cls, target_type, dttm):
@@ -238,20 +327,27 @@ class BaseEngineSpec(object):
         schemas = db.all_schema_names(cache=db.schema_cache_enabled,
                                       cache_timeout=db.schema_cache_timeout,
                                       force=True)
+        if datasource_type == 'table':
+            fetch_names = db.all_table_names_in_schema
+        elif datasource_type == 'view':
+            fetch_names = db.all_view_names_in_schema
+        # schemas are listed concurrently, sharing one inspector on a pooled
+        # engine, each of them is cached as soon as it is listed
+        inspector = sqla.inspect(db.get_sqla_engine(nullpool=False))
+
+        def fetch_schema(schema):
+            names = fetch_names(
+                schema=schema, force=True,
+                cache=db.table_cache_enabled,
+                cache_timeout=db.table_cache_timeout,
+                inspector=inspector)
+            return ['{}.{}'.format(schema, t) for t in names]
+
         all_result_sets = []
-        for schema in schemas:
-            if datasource_type == 'table':
-                all_datasource_names = db.all_table_names_in_schema(
-                    schema=schema, force=True,
-                    cache=db.table_cache_enabled,
-                    cache_timeout=db.table_cache_timeout)
-            elif datasource_type == 'view':
-                all_datasource_names = db.all_view_names_in_schema(
-                    schema=schema, force=True,
-                    cache=db.table_cache_enabled,
-                    cache_timeout=db.table_cache_timeout)
-            all_result_sets += [
-                '{}.{}'.format(schema, t) for t in all_datasource_names]
+        for result_sets in run_concurrently(
+                [functools.partial(fetch_schema, schema) for schema in schemas],
+                conf.get('METADATA_FETCH_MAX_WORKERS')):
+            all_result_sets += result_sets
         return all_result_sets
 
     @classmethod
@@ -263,6 +359,12 @@ class BaseEngineSpec(object):
         query object"""
         pass
 
+    @classmethod
+    def get_progress_reporter(cls, query, session):
+        """Returns the object ``handle_cursor`` reports progress to and
+        checks for cancel signals with"""
+        return ProgressReporter(query, session, get_query_channel())
+
     @classmethod
     def extract_error_message(cls, e):
         """Extract error message for queries"""
@@ -310,6 +412,12 @@ class BaseEngineSpec(object):
             cls, table_name, schema, database, qry, columns=None):
         return False
 
+    @classmethod
+    def prefetch_partitions(cls, database, tables, max_workers=None):
+        """Caches the partition metadata of ``(schema, table_name)`` tuples
+        ahead of queries that will need it"""
+        pass
+
     @classmethod
     def _get_fields(cls, cols):
         return [sqla.column(c.get('name')) for c in cols]
@@ -325,7 +433,8 @@ class BaseEngineSpec(object):
 
         if show_cols:
             fields = cls._get_fields(cols)
-        quote = engine.dialect.identifier_preparer.quote
+        dialect = engine.dialect if engine else my_db.get_dialect()
+        quote = dialect.identifier_preparer.quote
         if schema:
             full_table_name = quote(schema) + '.' + quote(table_name)
         else:
@@ -415,6 +524,14 @@ class PostgresBaseEngineSpec(BaseEngineSpec):
             return cursor.fetchmany(limit)
         return cursor.fetchall()
 
+    @classmethod
+    def fetch_data_in_batches(cls, cursor, batch_size, limit=None):
+        # named cursors only get a description once the first row is fetched
+        if not cursor.description and not getattr(cursor, 'name', None):
+            return iter([])
+        return super(PostgresBaseEngineSpec, cls).fetch_data_in_batches(
+            cursor, batch_size, limit)
+
     @classmethod
     def epoch_to_dttm(cls):
         return "(timestamp 'epoch' + {col} * interval '1 second')"
@@ -426,6 +543,46 @@ class PostgresBaseEngineSpec(BaseEngineSpec):
 
 class PostgresEngineSpec(PostgresBaseEngineSpec):
     engine = 'postgresql'
+    server_side_cursors = True
+
+    @classmethod
+    def get_server_side_cursor(cls, conn):
+        # psycopg2 named cursors are server-side cursors
+        return conn.cursor(name='superset_{}'.format(uuid.uuid4().hex))
+
+    @classmethod
+    def insert_df(cls, df, name, con, schema=None, index=True, index_label=None):
+        """Appends the rows of ``df`` with ``COPY ... FROM STDIN``, which is
+        much faster than inserting them"""
+        cursor = con.connection.cursor()
+        if not hasattr(cursor, 'copy_expert'):
+            # not psycopg2
+            cursor.close()
+            return super(PostgresEngineSpec, cls).insert_df(
+                df, name, con, schema=schema, index=index,
+                index_label=index_label)
+        if index:
+            nlevels = df.index.nlevels
+            df = df.reset_index()
+            if index_label is not None:
+                if isinstance(index_label, basestring):
+                    index_label = [index_label]
+                df.columns = list(index_label) + list(df.columns[nlevels:])
+        preparer = con.dialect.identifier_preparer
+        full_name = preparer.quote(name)
+        if schema:
+            full_name = '{}.{}'.format(preparer.quote_schema(schema), full_name)
+        columns = ', '.join(preparer.quote(str(c)) for c in df.columns)
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        try:
+            cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH (FORMAT CSV)'.format(
+                    full_name, columns),
+                buf)
+        finally:
+            cursor.close()
 
     @classmethod
     def get_table_names(cls, inspector, schema):
@@ -542,6 +699,8 @@ class Db2EngineSpec(BaseEngineSpec):
 
 class SqliteEngineSpec(BaseEngineSpec):
     engine = 'sqlite'
+    # pysqlite connections can't be shared across threads
+    allows_connection_pooling = False
 
     time_grain_functions = {
         None: '{col}',
@@ -594,6 +753,7 @@ class SqliteEngineSpec(BaseEngineSpec):
 
 class MySQLEngineSpec(BaseEngineSpec):
     engine = 'mysql'
+    server_side_cursors = True
 
     time_grain_functions = {
         None: '{col}',
@@ -653,6 +813,15 @@ class MySQLEngineSpec(BaseEngineSpec):
     def epoch_to_dttm(cls):
         return 'from_unixtime({col})'
 
+    @classmethod
+    def get_server_side_cursor(cls, conn):
+        # the raw DB-API connection tells whether mysqlclient or pymysql is used
+        if type(conn.connection).__module__.startswith('pymysql'):
+            from pymysql.cursors import SSCursor
+        else:
+            from MySQLdb.cursors import SSCursor
+        return conn.cursor(SSCursor)
+
     @classmethod
     def extract_error_message(cls, e):
         """Extract error message for queries"""
@@ -667,6 +836,9 @@ class MySQLEngineSpec(BaseEngineSpec):
 
 class PrestoEngineSpec(BaseEngineSpec):
     engine = 'presto'
+    # the HTTP based DBAPI has no session worth keeping, pinging it would
+    # submit a query
+    allows_connection_pooling = False
 
     time_grain_functions = {
         None: '{col}',
@@ -759,12 +931,13 @@ class PrestoEngineSpec(BaseEngineSpec):
         # if the query is done
         # https://github.com/dropbox/PyHive/blob/
         # b34bdbf51378b3979eaf5eca9e956f06ddc36ca0/pyhive/presto.py#L178
+        reporter = cls.get_progress_reporter(query, session)
         while polled:
             # Update the object and wait for the kill signal.
             stats = polled.get('stats', {})
 
-            query = session.query(type(query)).filter_by(id=query.id).one()
-            if query.status in [QueryStatus.STOPPED, QueryStatus.TIMED_OUT]:
+            if reporter.is_stopped():
+                query.status = QueryStatus.STOPPED
                 cursor.cancel()
                 break
 
@@ -782,12 +955,11 @@ class PrestoEngineSpec(BaseEngineSpec):
                     logging.info(
                         'Query progress: {} / {} '
                         'splits'.format(completed_splits, total_splits))
-                    if progress > query.progress:
-                        query.progress = progress
-                    session.commit()
+                    reporter.update(progress)
             time.sleep(1)
             logging.info('Polling the cursor for progress')
             polled = cursor.poll()
+        reporter.flush()
 
     @classmethod
     def extract_error_message(cls, e):
@@ -886,19 +1058,23 @@ class PrestoEngineSpec(BaseEngineSpec):
         >>> latest_partition('foo_table')
         '2018-01-01'
         """
-        indexes = database.get_indexes(table_name, schema)
-        if len(indexes[0]['column_names']) < 1:
+        metadata = cls.get_partition_metadata(database, schema, table_name)
+        part_fields = metadata['part_fields']
+        if len(part_fields) < 1:
             raise SupersetTemplateException(
                 'The table should have one partitioned field')
-        elif not show_first and len(indexes[0]['column_names']) > 1:
+        elif not show_first and len(part_fields) > 1:
             raise SupersetTemplateException(
                 'The table should have a single partitioned field '
                 'to use this function. You may want to use '
                 '`presto.latest_sub_partition`')
-        part_field = indexes[0]['column_names'][0]
-        sql = cls._partition_query(table_name, 1, [(part_field, True)])
-        df = database.get_df(sql, schema)
-        return part_field, cls._latest_partition_from_df(df)
+
+        def get_latest():
+            sql = cls._partition_query(table_name, 1, [(part_fields[0], True)])
+            return cls._latest_partition_from_df(database.get_df(sql, schema))
+        latest = cls.get_partition_value(
+            database, schema, table_name, metadata, 'latest', get_latest)
+        return part_fields[0], latest
 
     @classmethod
     def latest_sub_partition(cls, table_name, schema, database, **kwargs):
@@ -927,8 +1103,8 @@ class PrestoEngineSpec(BaseEngineSpec):
         >>> latest_sub_partition('sub_partition_table', event_type='click')
         '2018-01-01'
         """
-        indexes = database.get_indexes(table_name, schema)
-        part_fields = indexes[0]['column_names']
+        metadata = cls.get_partition_metadata(database, schema, table_name)
+        part_fields = metadata['part_fields']
         for k in kwargs.keys():
             if k not in k in part_fields:
                 msg = 'Field [{k}] is not part of the portioning key'
@@ -944,12 +1120,108 @@ class PrestoEngineSpec(BaseEngineSpec):
             if field not in kwargs.keys():
                 field_to_return = field
 
-        sql = cls._partition_query(
-            table_name, 1, [(field_to_return, True)], kwargs)
-        df = database.get_df(sql, schema)
-        if df.empty:
-            return ''
-        return df.to_dict()[field_to_return][0]
+        def get_sub_partition():
+            sql = cls._partition_query(
+                table_name, 1, [(field_to_return, True)], kwargs)
+            df = database.get_df(sql, schema)
+            return '' if df.empty else df.to_dict()[field_to_return][0]
+        name = 'sub_partition:' + hashlib.md5(
+            json.dumps(kwargs, sort_keys=True).encode('utf-8')).hexdigest()
+        return cls.get_partition_value(
+            database, schema, table_name, metadata, name, get_sub_partition)
+
+    @classmethod
+    def _partition_cache_key(cls, database, schema, table_name):
+        if not schema and '.' in table_name:
+            schema, table_name = table_name.split('.', 1)
+        return 'partitions:{}:{}:{}'.format(database.id, schema, table_name)
+
+    @classmethod
+    def get_partition_metadata(cls, database, schema, table_name):
+        """Returns the partition fields of a table
+
+        The metadata is kept in the ``tables_cache`` for
+        ``PARTITION_METADATA_CACHE_TIMEOUT`` seconds, the partitioning
+        fields are read from the table indexes the first time. Its
+        ``generation`` identifies the values cached by
+        ``get_partition_value`` along with it.
+        """
+        metadata = None
+        if tables_cache:
+            metadata = tables_cache.get(
+                cls._partition_cache_key(database, schema, table_name))
+        if metadata is None:
+            indexes = database.get_indexes(table_name, schema)
+            metadata = {
+                'part_fields': indexes[0]['column_names'] if indexes else [],
+                'generation': uuid.uuid4().hex,
+            }
+            cls.set_partition_metadata(database, schema, table_name, metadata)
+        return metadata
+
+    @classmethod
+    def get_partition_value(
+            cls, database, schema, table_name, metadata, name, compute):
+        """Returns a value derived from the partitions of a table, such as
+        its latest partition, computing it with ``compute`` when missing
+
+        Each value is cached under its own key for
+        ``PARTITION_METADATA_CACHE_TIMEOUT`` seconds from the time it was
+        computed, so that looking up a value doesn't extend the life of the
+        others. The key includes the generation of the metadata, the values
+        are forgotten along with the metadata.
+        """
+        if not tables_cache:
+            return compute()
+        cache_key = '{}:{}:{}'.format(
+            cls._partition_cache_key(database, schema, table_name),
+            metadata.get('generation'),
+            name)
+        cached = tables_cache.get(cache_key)
+        if cached is not None:
+            return cached['value']
+        value = compute()
+        tables_cache.set(
+            cache_key,
+            {'value': value},
+            timeout=conf.get('PARTITION_METADATA_CACHE_TIMEOUT'))
+        return value
+
+    @classmethod
+    def set_partition_metadata(cls, database, schema, table_name, metadata):
+        if tables_cache:
+            tables_cache.set(
+                cls._partition_cache_key(database, schema, table_name),
+                metadata,
+                timeout=conf.get('PARTITION_METADATA_CACHE_TIMEOUT'))
+
+    @classmethod
+    def invalidate_partition_cache(cls, database, schema, table_name):
+        """Forgets the cached partitions of a table, to be called when new
+        partitions land
+
+        The values cached by ``get_partition_value`` are keyed on the
+        generation of the metadata, they are left to expire.
+        """
+        if tables_cache:
+            tables_cache.delete(
+                cls._partition_cache_key(database, schema, table_name))
+
+    @classmethod
+    def prefetch_partitions(cls, database, tables, max_workers=None):
+        """Loads the latest partition of many ``(schema, table_name)`` in the
+        cache at once, ignoring the tables that aren't partitioned"""
+        def prefetch(schema, table_name):
+            try:
+                cls.latest_partition(
+                    table_name, schema, database, show_first=True)
+            except Exception as e:
+                logging.info('No partition prefetched for {}: {}'.format(
+                    table_name, e))
+        run_concurrently(
+            [lambda s=schema, t=table_name: prefetch(s, t)
+             for schema, table_name in set(tables)],
+            max_workers or conf.get('VIZ_QUERIES_MAX_WORKERS'))
 
 
 class HiveEngineSpec(PrestoEngineSpec):
@@ -1000,8 +1272,17 @@ class HiveEngineSpec(PrestoEngineSpec):
             raise Exception('Query error', state.errorMessage)
         return super(HiveEngineSpec, cls).fetch_data(cursor, limit)
 
+    @classmethod
+    def fetch_data_in_batches(cls, cursor, batch_size, limit=None):
+        from TCLIService import ttypes
+        state = cursor.poll()
+        if state.operationState == ttypes.TOperationState.ERROR_STATE:
+            raise Exception('Query error', state.errorMessage)
+        return super(HiveEngineSpec, cls).fetch_data_in_batches(
+            cursor, batch_size, limit)
+
     @staticmethod
-    def create_table_from_csv(form, table):
+    def create_table_from_csv(form, table, progress=None):
         """Uploads a csv file and creates a superset datasource in Hive."""
         def convert_to_hive_type(col_type):
             """maps tableschema's types to hive types"""
@@ -1060,6 +1341,11 @@ class HiveEngineSpec(PrestoEngineSpec):
         s3.upload_file(
             upload_path, bucket_path,
             os.path.join(upload_prefix, table_name, filename))
+        if progress:
+            # the file is loaded as a whole, its rows are only known once
+            # it's uploaded. The header line is skipped by the table.
+            with open(upload_path, newline='') as csv_file:
+                progress(max(sum(1 for _ in csv.reader(csv_file)) - 1, 0))
         sql = """CREATE TABLE {full_table_name} ( {schema_definition} )
             ROW FORMAT DELIMITED FIELDS TERMINATED BY ',' STORED AS
             TEXTFILE LOCATION '{location}'
@@ -1144,9 +1430,10 @@ class HiveEngineSpec(PrestoEngineSpec):
         last_log_line = 0
         tracking_url = None
         job_id = None
+        reporter = cls.get_progress_reporter(query, session)
         while polled.operationState in unfinished_states:
-            query = session.query(type(query)).filter_by(id=query.id).one()
-            if query.status == QueryStatus.STOPPED:
+            if reporter.is_stopped():
+                query.status = QueryStatus.STOPPED
                 cursor.cancel()
                 break
 
@@ -1155,10 +1442,7 @@ class HiveEngineSpec(PrestoEngineSpec):
                 log_lines = log.splitlines()
                 progress = cls.progress(log_lines)
                 logging.info('Progress total: {}'.format(progress))
-                needs_commit = False
-                if progress > query.progress:
-                    query.progress = progress
-                    needs_commit = True
+                attributes = {}
                 if not tracking_url:
                     tracking_url = cls.get_tracking_url(log_lines)
                     if tracking_url:
@@ -1168,9 +1452,8 @@ class HiveEngineSpec(PrestoEngineSpec):
                         tracking_url = tracking_url_trans(tracking_url)
                         logging.info(
                             'Transformation applied: {}'.format(tracking_url))
-                        query.tracking_url = tracking_url
+                        attributes['tracking_url'] = tracking_url
                         logging.info('Job id: {}'.format(job_id))
-                        needs_commit = True
                 if job_id and len(log_lines) > last_log_line:
                     # Wait for job id before logging things out
                     # this allows for prefixing all log lines and becoming
@@ -1178,10 +1461,10 @@ class HiveEngineSpec(PrestoEngineSpec):
                     for l in log_lines[last_log_line:]:
                         logging.info('[{}] {}'.format(job_id, l))
                     last_log_line = len(log_lines)
-                if needs_commit:
-                    session.commit()
+                reporter.update(progress, **attributes)
             time.sleep(hive_poll_interval)
             polled = cursor.poll()
+        reporter.flush()
 
     @classmethod
     def where_latest_partition(
@@ -1388,6 +1671,15 @@ class BQEngineSpec(BaseEngineSpec):
             data = [r.values() for r in data]
         return data
 
+    @classmethod
+    def fetch_data_in_batches(cls, cursor, batch_size, limit=None):
+        batches = super(BQEngineSpec, cls).fetch_data_in_batches(
+            cursor, batch_size, limit)
+        for data in batches:
+            if type(data[0]).__name__ == 'Row':
+                data = [r.values() for r in data]
+            yield data
+
     @staticmethod
     def mutate_expression_label(label):
         mutated_label = re.sub('[^\w]+', '_', label)
@@ -1475,6 +1767,8 @@ class DruidEngineSpec(BaseEngineSpec):
     engine = 'druid'
     inner_joins = False
     allows_subquery = False
+    # Druid SQL has no row values, IN only takes a single column
+    top_groups_filter = 'nested_in'
 
     time_grain_functions = {
         None: '{col}',
@@ -0,0 +1,43 @@
+"""add csv_uploads table
+
+Revision ID: 3b1a7d4e9c2f
+Revises: 55e910a74826
+Create Date: 2018-10-18 11:20:43.218675
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3b1a7d4e9c2f'
+down_revision = '55e910a74826'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'csv_uploads',
+        sa.Column('created_on', sa.DateTime(), nullable=True),
+        sa.Column('changed_on', sa.DateTime(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('database_id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(length=250), nullable=False),
+        sa.Column('schema', sa.String(length=255), nullable=True),
+        sa.Column('filename', sa.String(length=500), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=True),
+        sa.Column('rows', sa.Integer(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('start_time', sa.DateTime(), nullable=True),
+        sa.Column('end_time', sa.DateTime(), nullable=True),
+        sa.Column('table_id', sa.Integer(), nullable=True),
+        sa.Column('created_by_fk', sa.Integer(), nullable=True),
+        sa.Column('changed_by_fk', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['changed_by_fk'], ['ab_user.id'], ),
+        sa.ForeignKeyConstraint(['created_by_fk'], ['ab_user.id'], ),
+        sa.ForeignKeyConstraint(['database_id'], ['dbs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('csv_uploads')
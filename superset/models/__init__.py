@@ -1,3 +1,4 @@
 from . import core  # noqa
+from . import csv_upload  # noqa
 from . import sql_lab  # noqa
 from . import user_attributes  # noqa
@@ -4,22 +4,22 @@ from contextlib import closing
 from copy import copy, deepcopy
 from datetime import datetime
 import functools
+import itertools
 import json
 import logging
 import textwrap
+import threading
 
 from flask import escape, g, Markup, request
 from flask_appbuilder import Model
 from flask_appbuilder.models.decorators import renders
 from flask_appbuilder.security.sqla.models import User
 import numpy
-import pandas as pd
 import sqlalchemy as sqla
 from sqlalchemy import (
     Boolean, Column, create_engine, DateTime, ForeignKey, Integer,
     MetaData, String, Table, Text,
 )
-from sqlalchemy.engine import url
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import relationship, sessionmaker, subqueryload
 from sqlalchemy.orm.session import make_transient
@@ -28,7 +28,9 @@ from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy_utils import EncryptedType
 import sqlparse
 
-from superset import app, db, db_engine_specs, security_manager
+from superset import (
+    app, dataframe, db, db_engine_specs, security_manager, tables_cache,
+)
 from superset.connectors.connector_registry import ConnectorRegistry
 from superset.legacy import update_time_range
 from superset.models.helpers import AuditMixinNullable, ImportMixin
@@ -36,7 +38,10 @@ from superset.models.user_attributes import UserAttribute
 from superset.utils import (
     cache as cache_util,
     core as utils,
+    sql_compile,
 )
+from superset.utils.concurrency import with_app_context
+from superset.utils.engine_pool import engine_registry
 from superset.viz import viz_types
 from urllib import parse  # noqa
 
@@ -207,14 +212,6 @@ class Slice(Model, AuditMixinNullable, ImportMixin):
     @property
     def data(self):
         """Data used to render slice in templates"""
-        d = {}
-        self.token = ''
-        try:
-            d = self.viz.data
-            self.token = d.get('token')
-        except Exception as e:
-            logging.exception(e)
-            d['error'] = str(e)
         return {
             'datasource': self.datasource_name,
             'description': self.description,
@@ -399,7 +396,11 @@ class Dashboard(Model, AuditMixinNullable, ImportMixin):
 
     @property
     def datasources(self):
-        return {slc.datasource for slc in self.slices}
+        """The datasources of the slices, fetched with a query per type"""
+        return set(ConnectorRegistry.get_datasources_by_ids(
+            db.session,
+            [(slc.datasource_type, slc.datasource_id) for slc in self.slices],
+        ).values())
 
     @property
     def sqla_metadata(self):
@@ -641,6 +642,7 @@ class Database(Model, AuditMixinNullable, ImportMixin):
     {
         "metadata_params": {},
         "engine_params": {},
+        "connection_pool": {},
         "metadata_cache_timeout": {},
         "schemas_allowed_for_csv_upload": []
     }
@@ -746,13 +748,43 @@ class Database(Model, AuditMixinNullable, ImportMixin):
                 effective_username = g.user.username
         return effective_username
 
-    @utils.memoized(
-        watch=('impersonate_user', 'sqlalchemy_uri_decrypted', 'extra'))
-    def get_sqla_engine(self, schema=None, nullpool=True, user_name=None):
-        extra = self.get_extra()
+    def get_pool_params(self):
+        """Returns the settings of the connection pool of this database
+
+        ``DEFAULT_DB_CONNECTION_POOL`` overridden by the ``connection_pool``
+        object of ``extra``. ``None`` if connections aren't pooled.
+        """
+        params = dict(config.get('DEFAULT_DB_CONNECTION_POOL') or {})
+        params.update(self.get_extra().get('connection_pool') or {})
+        enabled = params.pop('enabled', True)
+        if not enabled or not self.db_engine_spec.allows_connection_pooling:
+            return None
+        return params
+
+    def get_sqla_engine(self, schema=None, nullpool=None, user_name=None):
+        """Returns an engine connected as the effective user
+
+        Engines are reused across calls, unless ``nullpool`` is True their
+        connections are pooled according to ``get_pool_params``. With
+        pooling disabled, ``nullpool=False`` still gets the default pool of
+        SQLAlchemy.
+        """
         url = make_url(self.sqlalchemy_uri_decrypted)
         url = self.db_engine_spec.adjust_database_uri(url, schema)
         effective_username = self.get_effective_user(url, user_name)
+        pool_params = None if nullpool else self.get_pool_params()
+        # the engines are keyed on how they pool connections rather than on
+        # the value of nullpool, which leads to the same pool in most cases
+        nullpool = pool_params is None and nullpool is not False
+        version = (self.sqlalchemy_uri_decrypted, self.extra, self.impersonate_user)
+        key = (schema, effective_username, nullpool, pool_params is not None)
+        return engine_registry.get_engine(
+            self.id, version, key,
+            lambda: self._create_sqla_engine(
+                url, effective_username, nullpool, pool_params))
+
+    def _create_sqla_engine(self, url, effective_username, nullpool, pool_params):
+        extra = self.get_extra()
         # If using MySQL or Presto for example, will set url.username
         # If using Hive, will not do anything yet since that relies on a
         # configuration parameter instead.
@@ -764,8 +796,10 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         masked_url = self.get_password_masked_url(url)
         logging.info('Database.get_sqla_engine(). Masked URL: {0}'.format(masked_url))
 
-        params = extra.get('engine_params', {})
-        if nullpool:
+        params = dict(extra.get('engine_params', {}))
+        if pool_params is not None:
+            params.update(pool_params)
+        elif nullpool:
             params['poolclass'] = NullPool
 
         # If using Hive, this will set hive.server2.proxy.user=$effective_username
@@ -790,10 +824,8 @@ class Database(Model, AuditMixinNullable, ImportMixin):
     def get_quoter(self):
         return self.get_dialect().identifier_preparer.quote
 
-    def get_df(self, sql, schema):
-        sqls = [str(s).strip().strip(';') for s in sqlparse.parse(sql)]
-        engine = self.get_sqla_engine(schema=schema)
-
+    @staticmethod
+    def _convert_nested_columns(df):
         def needs_conversion(df_series):
             if df_series.empty:
                 return False
@@ -801,52 +833,93 @@ class Database(Model, AuditMixinNullable, ImportMixin):
                 return True
             return False
 
-        with closing(engine.raw_connection()) as conn:
-            with closing(conn.cursor()) as cursor:
-                for sql in sqls[:-1]:
-                    self.db_engine_spec.execute(cursor, sql)
-                    cursor.fetchall()
-
-                self.db_engine_spec.execute(cursor, sqls[-1])
-
-                if cursor.description is not None:
-                    columns = [col_desc[0] for col_desc in cursor.description]
-                else:
-                    columns = []
-
-                df = pd.DataFrame.from_records(
-                    data=list(cursor.fetchall()),
-                    columns=columns,
-                    coerce_float=True,
-                )
+        for k, v in df.dtypes.items():
+            if v.type == numpy.object_ and needs_conversion(df[k]):
+                df[k] = df[k].apply(utils.json_dumps_w_dates)
+        return df
 
-                for k, v in df.dtypes.items():
-                    if v.type == numpy.object_ and needs_conversion(df[k]):
-                        df[k] = df[k].apply(utils.json_dumps_w_dates)
-                return df
+    def _execute_sql(self, conn, sql, server_side=False):
+        """Runs all the statements in ``sql``, returns the cursor to fetch from
 
-    def compile_sqla_query(self, qry, schema=None):
+        Results of all but the last statement are discarded. When
+        ``server_side`` is set and the last statement is a ``SELECT``, its
+        results are read through a server-side cursor if the engine
+        supports it.
+        """
+        statements = sqlparse.parse(sql)
+        sqls = [str(s).strip().strip(';') for s in statements]
+        cursor = conn.cursor()
+        for statement in sqls[:-1]:
+            self.db_engine_spec.execute(cursor, statement)
+            cursor.fetchall()
+
+        if server_side and statements[-1].get_type() == 'SELECT':
+            cursor.close()
+            cursor = self.db_engine_spec.get_cursor(conn, server_side=True)
+        self.db_engine_spec.execute(cursor, sqls[-1])
+        return cursor
+
+    def _fetch_batches(self, cursor, batch_size):
+        """Returns the result's column names and an iterator of row batches"""
+        batches = iter(
+            self.db_engine_spec.fetch_data_in_batches(cursor, batch_size))
+        # some server-side cursors only get a description once rows are fetched
+        first_batch = next(batches, None)
+        columns = []
+        if cursor.description is not None:
+            columns = [col_desc[0] for col_desc in cursor.description]
+        if first_batch is None:
+            return columns, iter([])
+        return columns, itertools.chain([first_batch], batches)
+
+    def get_df(self, sql, schema):
+        """Runs ``sql`` and returns its results as a DataFrame
+
+        Rows are fetched ``SQL_FETCH_BATCH_SIZE`` at a time and accumulated
+        in column buffers, through a server-side cursor if the engine
+        supports it, to limit peak memory on large results.
+        """
         engine = self.get_sqla_engine(schema=schema)
+        batch_size = config.get('SQL_FETCH_BATCH_SIZE')
+        with closing(engine.raw_connection()) as conn:
+            with closing(self._execute_sql(conn, sql, server_side=True)) as cursor:
+                columns, batches = self._fetch_batches(cursor, batch_size)
+                df = dataframe.df_from_batches(batches, columns)
+                return self._convert_nested_columns(df)
 
-        sql = str(
-            qry.compile(
-                engine,
-                compile_kwargs={'literal_binds': True},
-            ),
-        )
+    def get_df_chunks(self, sql, schema, chunk_size=None):
+        """Yields the results of ``sql`` as DataFrames of ``chunk_size`` rows
 
-        if engine.dialect.identifier_preparer._double_percents:
-            sql = sql.replace('%%', '%')
+        Only one chunk is held in memory at a time, an empty DataFrame is
+        yielded if the query returns no rows.
+        """
+        chunk_size = chunk_size or config.get('CSV_STREAMING_CHUNK_SIZE')
+        engine = self.get_sqla_engine(schema=schema)
+        with closing(engine.raw_connection()) as conn:
+            with closing(self._execute_sql(conn, sql, server_side=True)) as cursor:
+                columns, batches = self._fetch_batches(cursor, chunk_size)
+                has_rows = False
+                for data in batches:
+                    has_rows = True
+                    yield self._convert_nested_columns(
+                        dataframe.df_from_batches([data], columns))
+                if not has_rows:
+                    yield dataframe.df_from_batches([], columns)
 
-        return sql
+    def compile_sqla_query(self, qry, schema=None):
+        """Compiles ``qry`` into a SQL string in the dialect of this database
+
+        ``schema`` is only kept for backward compatibility, the dialect
+        doesn't depend on it.
+        """
+        return sql_compile.compile_query(qry, self.get_dialect())
 
     def select_star(
             self, table_name, schema=None, limit=100, show_cols=False,
             indent=True, latest_partition=False, cols=None):
         """Generates a ``select *`` statement in the proper dialect"""
-        eng = self.get_sqla_engine(schema=schema)
         return self.db_engine_spec.select_star(
-            self, table_name, schema=schema, engine=eng,
+            self, table_name, schema=schema, engine=None,
             limit=limit, show_cols=show_cols,
             indent=indent, latest_partition=latest_partition, cols=cols)
 
@@ -881,12 +954,76 @@ class Database(Model, AuditMixinNullable, ImportMixin):
             return []
         return self.db_engine_spec.fetch_result_sets(self, 'view')
 
+    def all_result_sets_in_database(self, datasource_type, cache_timeout=None):
+        """Returns the names of all the tables or views of the database, and
+        whether the list is complete
+
+        When the list isn't cached yet, the database is crawled in a
+        background thread and the names found in the schemas listed so far
+        are returned, the next calls return more of them until the crawl
+        completes.
+        """
+        fetch_names = (
+            self.all_table_names_in_database if datasource_type == 'table'
+            else self.all_view_names_in_database)
+        if not tables_cache or not self.allow_multi_schema_metadata_fetch:
+            return fetch_names(
+                cache=True, force=False, cache_timeout=cache_timeout), True
+
+        names = tables_cache.get(
+            'db:{}:schema:None:{}_list'.format(self.id, datasource_type))
+        if names is not None:
+            return names, True
+
+        # the crawl marker expires shortly unless the crawl keeps refreshing
+        # it, so that a crawl dying with its process is started over
+        crawl_key = 'db:{}:crawl:{}'.format(self.id, datasource_type)
+        crawl_timeout = config.get('METADATA_CRAWL_HEARTBEAT_TIMEOUT')
+        if tables_cache.add(crawl_key, True, timeout=crawl_timeout):
+            database_id = self.id
+            done = threading.Event()
+
+            def heartbeat():
+                while not done.wait(crawl_timeout / 2.0):
+                    tables_cache.set(crawl_key, True, timeout=crawl_timeout)
+
+            def crawl():
+                try:
+                    database = db.session.query(Database).get(database_id)
+                    fetch = (
+                        database.all_table_names_in_database
+                        if datasource_type == 'table'
+                        else database.all_view_names_in_database)
+                    fetch(cache=True, force=True, cache_timeout=cache_timeout)
+                except Exception as e:
+                    logging.exception(e)
+                finally:
+                    done.set()
+                    tables_cache.delete(crawl_key)
+            for target in (heartbeat, with_app_context(crawl)):
+                thread = threading.Thread(target=target)
+                # the crawl doesn't hold up the shutdown of the server
+                thread.daemon = True
+                thread.start()
+
+        names = []
+        schemas = tables_cache.get('db:{}:schema_list'.format(self.id)) or []
+        keys = [
+            'db:{}:schema:{}:{}_list'.format(self.id, schema, datasource_type)
+            for schema in schemas
+        ]
+        if keys:
+            for schema, schema_names in zip(schemas, tables_cache.get_many(*keys)):
+                names += ['{}.{}'.format(schema, n) for n in schema_names or []]
+        return names, False
+
     @cache_util.memoized_func(
         key=lambda *args, **kwargs: 'db:{{}}:schema:{}:table_list'.format(
             kwargs.get('schema')),
         attribute_in_key='id')
     def all_table_names_in_schema(self, schema, cache=False,
-                                  cache_timeout=None, force=False):
+                                  cache_timeout=None, force=False,
+                                  inspector=None):
         """Parameters need to be passed as keyword arguments.
 
         For unused parameters, they are referenced in
@@ -900,23 +1037,25 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         :type cache_timeout: int
         :param force: whether to force refresh the cache
         :type force: bool
+        :param inspector: inspector to use instead of creating one
         :return: table list
         :rtype: list
         """
         tables = []
         try:
             tables = self.db_engine_spec.get_table_names(
-                inspector=self.inspector, schema=schema)
+                inspector=inspector or self.inspector, schema=schema)
         except Exception as e:
             logging.exception(e)
         return tables
 
     @cache_util.memoized_func(
-        key=lambda *args, **kwargs: 'db:{{}}:schema:{}:table_list'.format(
+        key=lambda *args, **kwargs: 'db:{{}}:schema:{}:view_list'.format(
             kwargs.get('schema')),
         attribute_in_key='id')
     def all_view_names_in_schema(self, schema, cache=False,
-                                 cache_timeout=None, force=False):
+                                 cache_timeout=None, force=False,
+                                 inspector=None):
         """Parameters need to be passed as keyword arguments.
 
         For unused parameters, they are referenced in
@@ -930,13 +1069,14 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         :type cache_timeout: int
         :param force: whether to force refresh the cache
         :type force: bool
+        :param inspector: inspector to use instead of creating one
         :return: view list
         :rtype: list
         """
         views = []
         try:
             views = self.db_engine_spec.get_view_names(
-                inspector=self.inspector, schema=schema)
+                inspector=inspector or self.inspector, schema=schema)
         except Exception as e:
             logging.exception(e)
         return views
@@ -1045,10 +1185,10 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         return engine.has_table(
             table.table_name, table.schema or None)
 
-    @utils.memoized
     def get_dialect(self):
-        sqla_url = url.make_url(self.sqlalchemy_uri_decrypted)
-        return sqla_url.get_dialect()()
+        return sql_compile.get_dialect(
+            self.sqlalchemy_uri_decrypted,
+            self.get_extra().get('engine_params'))
 
 
 sqla.event.listen(Database, 'after_insert', security_manager.set_perm)
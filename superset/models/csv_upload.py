@@ -0,0 +1,65 @@
+# pylint: disable=C,R,W
+"""ORM model tracking the CSV files ingested in the background"""
+from datetime import datetime
+
+from flask_appbuilder import Model
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy.orm import relationship
+
+from superset.models.helpers import AuditMixinNullable
+from superset.utils.core import QueryStatus
+
+
+class CsvUpload(Model, AuditMixinNullable):
+    """A CSV file staged in ``UPLOAD_FOLDER``, waiting for or being
+    ingested into a table by a Celery worker"""
+
+    __tablename__ = 'csv_uploads'
+    id = Column(Integer, primary_key=True)
+    database_id = Column(Integer, ForeignKey('dbs.id'), nullable=False)
+    table_name = Column(String(250), nullable=False)
+    schema = Column(String(255))
+    # name of the staged file in UPLOAD_FOLDER
+    filename = Column(String(500), nullable=False)
+    status = Column(String(16), default=QueryStatus.PENDING)
+    # rows inserted so far
+    rows = Column(Integer, default=0)
+    error_message = Column(Text)
+    start_time = Column(DateTime)
+    end_time = Column(DateTime)
+    # the SqlaTable created once the upload succeeded
+    table_id = Column(Integer)
+
+    database = relationship('Database', foreign_keys=[database_id])
+
+    @property
+    def duration(self):
+        """Seconds spent ingesting the file so far"""
+        if not self.start_time:
+            return None
+        end_time = self.end_time or datetime.now()
+        return (end_time - self.start_time).total_seconds()
+
+    @property
+    def throughput(self):
+        """Rows inserted per second"""
+        duration = self.duration
+        if not duration:
+            return None
+        return (self.rows or 0) / duration
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'database_id': self.database_id,
+            'table_name': self.table_name,
+            'schema': self.schema,
+            'status': self.status,
+            'rows': self.rows or 0,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'error_message': self.error_message,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'table_id': self.table_id,
+        }
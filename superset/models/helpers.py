@@ -12,12 +12,27 @@ import humanize
 import sqlalchemy as sa
 from sqlalchemy import and_, or_, UniqueConstraint
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.exc import MultipleResultsFound
 import yaml
 
 from superset.utils.core import QueryStatus
 
 
+def copy_detached(obj):
+    """Returns a copy of the column attributes of an ORM object
+
+    The copy doesn't belong to any session, it never expires nor gets
+    flushed, and can be shared across threads as long as it isn't altered.
+    Relationships can be set with ``set_committed_value``.
+    """
+    mapper = sa.inspect(type(obj))
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        set_committed_value(copy, attr.key, getattr(obj, attr.key))
+    return copy
+
+
 def json_to_dict(json_str):
     if json_str:
         val = re.sub(',[ \t\r\n]+}', '}', json_str)
@@ -1,11 +1,15 @@
 # pylint: disable=C,R,W
 """A set of constants and methods to manage permissions and security"""
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
+import time
 
 from flask import g
 from flask_appbuilder.security.sqla import models as ab_models
 from flask_appbuilder.security.sqla.manager import SecurityManager
-from sqlalchemy import or_
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 
 from superset import sql_parse
 from superset.connectors.connector_registry import ConnectorRegistry
@@ -76,6 +80,22 @@ OBJECT_SPEC_PERMISSIONS = set([
     'metric_access',
 ])
 
+# Number of ids in the IN clauses of the bulk deletes, SQLite caps the
+# number of parameters of a statement
+BULK_DELETE_BATCH_SIZE = 500
+
+
+@contextmanager
+def log_timing(phase, timings=None):
+    """Logs the seconds spent in the block, also storing them in
+    ``timings[phase]`` when given"""
+    start = time.time()
+    yield
+    duration = time.time() - start
+    if timings is not None:
+        timings[phase] = duration
+    logging.info('{} took {:.2f}s'.format(phase, duration))
+
 
 class SupersetSecurityManager(SecurityManager):
 
@@ -253,42 +273,89 @@ class SupersetSecurityManager(SecurityManager):
         self.merge_perm('all_datasource_access', 'all_datasource_access')
         self.merge_perm('all_database_access', 'all_database_access')
 
-    def create_missing_perms(self):
-        """Creates missing perms for datasources, schemas and metrics"""
+    def get_pv_names(self):
+        """Returns the (permission name, view menu name) pairs of the
+        existing permission views"""
+        return set(
+            self.get_session.query(
+                self.permission_model.name, self.viewmenu_model.name)
+            .select_from(self.permissionview_model)
+            .join(self.permissionview_model.permission)
+            .join(self.permissionview_model.view_menu)
+            .all(),
+        )
+
+    def get_name_ids(self, model, names):
+        """Maps ``names`` to the ids of the permissions or view menus named
+        after them, inserting the missing ones at once"""
+        sesh = self.get_session
+        ids = dict(sesh.query(model.name, model.id).all())
+        missing = [{'name': name} for name in names if name not in ids]
+        if missing:
+            sesh.execute(model.__table__.insert(), missing)
+            ids = dict(sesh.query(model.name, model.id).all())
+        return {name: ids[name] for name in names}
+
+    def add_pv_names(self, pv_names):
+        """Creates the permission views of the (permission name, view menu
+        name) pairs ``pv_names`` with one insert per table, where
+        ``merge_perm`` takes a few queries and a commit per pair"""
+        if not pv_names:
+            return 0
+        sesh = self.get_session
+        pv_model = self.permissionview_model
+        permission_ids = self.get_name_ids(
+            self.permission_model, {p for p, _ in pv_names})
+        view_menu_ids = self.get_name_ids(
+            self.viewmenu_model, {v for _, v in pv_names})
+        existing = set(
+            sesh.query(pv_model.permission_id, pv_model.view_menu_id).all())
+        rows = []
+        for permission_name, view_menu_name in sorted(pv_names):
+            ids = (
+                permission_ids[permission_name], view_menu_ids[view_menu_name])
+            if ids not in existing:
+                existing.add(ids)
+                rows.append({'permission_id': ids[0], 'view_menu_id': ids[1]})
+        if rows:
+            sesh.execute(pv_model.__table__.insert(), rows)
+        return len(rows)
+
+    def create_missing_perms(self, timings=None):
+        """Creates missing perms for datasources, schemas and metrics
+
+        The permissions every object should have are listed in memory and
+        the missing ones inserted in bulk."""
         from superset import db
         from superset.models import core as models
 
-        logging.info(
-            'Fetching a set of all perms to lookup which ones are missing')
-        all_pvs = set()
-        for pv in self.get_session.query(self.permissionview_model).all():
-            if pv.permission and pv.view_menu:
-                all_pvs.add((pv.permission.name, pv.view_menu.name))
-
-        def merge_pv(view_menu, perm):
-            """Create permission view menu only if it doesn't exist"""
-            if view_menu and perm and (view_menu, perm) not in all_pvs:
-                self.merge_perm(view_menu, perm)
-
-        logging.info('Creating missing datasource permissions.')
-        datasources = ConnectorRegistry.get_all_datasources(db.session)
-        for datasource in datasources:
-            merge_pv('datasource_access', datasource.get_perm())
-            merge_pv('schema_access', datasource.schema_perm)
-
-        logging.info('Creating missing database permissions.')
-        databases = db.session.query(models.Database).all()
-        for database in databases:
-            merge_pv('database_access', database.perm)
-
-        logging.info('Creating missing metrics permissions')
-        metrics = []
-        for datasource_class in ConnectorRegistry.sources.values():
-            metrics += list(db.session.query(datasource_class.metric_class).all())
+        pv_names = set()
+        with log_timing('Listing datasource permissions', timings):
+            for datasource in ConnectorRegistry.get_all_datasources(db.session):
+                pv_names.add(('datasource_access', datasource.get_perm()))
+                pv_names.add(('schema_access', datasource.schema_perm))
+
+        with log_timing('Listing database permissions', timings):
+            for database in db.session.query(models.Database).all():
+                pv_names.add(('database_access', database.perm))
+
+        with log_timing('Listing metric permissions', timings):
+            for datasource_class in ConnectorRegistry.sources.values():
+                metric_class = datasource_class.metric_class
+                metrics = (
+                    db.session.query(metric_class)
+                    .filter(metric_class.is_restricted == True)  # noqa
+                    .all()
+                )
+                for metric in metrics:
+                    pv_names.add(('metric_access', metric.perm))
 
-        for metric in metrics:
-            if metric.is_restricted:
-                merge_pv('metric_access', metric.perm)
+        with log_timing('Creating missing permissions', timings):
+            pv_names = {(p, v) for p, v in pv_names if v}
+            created_count = self.add_pv_names(pv_names - self.get_pv_names())
+            self.get_session.commit()
+        if created_count:
+            logging.info('Created {} missing permissions'.format(created_count))
 
     def clean_perms(self):
         """FAB leaves faulty permissions that need to be cleaned up"""
@@ -307,37 +374,89 @@ class SupersetSecurityManager(SecurityManager):
             logging.info('Deleted {} faulty permissions'.format(deleted_count))
 
     def sync_role_definitions(self):
-        """Inits the Superset application with security roles and such"""
+        """Inits the Superset application with security roles and such
+
+        Returns the seconds spent in each phase."""
         from superset import conf
         logging.info('Syncing role definition')
+        timings = OrderedDict()
 
-        self.create_custom_permissions()
+        with log_timing('Creating custom permissions', timings):
+            self.create_custom_permissions()
 
         # Creating default roles
-        self.set_role('Admin', self.is_admin_pvm)
-        self.set_role('Alpha', self.is_alpha_pvm)
-        self.set_role('Gamma', self.is_gamma_pvm)
-        self.set_role('granter', self.is_granter_pvm)
-        self.set_role('sql_lab', self.is_sql_lab_pvm)
-
+        roles = [
+            ('Admin', self.is_admin_pvm),
+            ('Alpha', self.is_alpha_pvm),
+            ('Gamma', self.is_gamma_pvm),
+            ('granter', self.is_granter_pvm),
+            ('sql_lab', self.is_sql_lab_pvm),
+        ]
         if conf.get('PUBLIC_ROLE_LIKE_GAMMA', False):
-            self.set_role('Public', self.is_gamma_pvm)
-
-        self.create_missing_perms()
+            roles.append(('Public', self.is_gamma_pvm))
+
+        # the permission views are loaded once, and checked before the
+        # commits of the roles expire them
+        with log_timing('Computing role permissions', timings):
+            pvms = self.get_pvms()
+            role_pv_ids = [
+                (role_name, {p.id for p in pvms if pvm_check(p)})
+                for role_name, pvm_check in roles
+            ]
+        with log_timing('Syncing roles', timings):
+            for role_name, pv_ids in role_pv_ids:
+                self.set_role_pv_ids(role_name, pv_ids)
+
+        self.create_missing_perms(timings)
 
         # commit role and view menu updates
         self.get_session.commit()
-        self.clean_perms()
+        with log_timing('Cleaning faulty permissions', timings):
+            self.clean_perms()
+        return timings
+
+    def get_pvms(self):
+        """Loads the permission views along with their permission and view
+        menu"""
+        pvms = (
+            self.get_session.query(ab_models.PermissionView)
+            .options(
+                joinedload(ab_models.PermissionView.permission),
+                joinedload(ab_models.PermissionView.view_menu),
+            )
+            .all()
+        )
+        return [p for p in pvms if p.permission and p.view_menu]
 
     def set_role(self, role_name, pvm_check):
+        pvms = self.get_pvms()
+        self.set_role_pv_ids(role_name, {p.id for p in pvms if pvm_check(p)})
+
+    def set_role_pv_ids(self, role_name, role_pv_ids):
+        """Grants ``role_name`` the permission views of ids ``role_pv_ids``
+        and revokes the others, only touching the links that change"""
         logging.info('Syncing {} perms'.format(role_name))
         sesh = self.get_session
-        pvms = sesh.query(ab_models.PermissionView).all()
-        pvms = [p for p in pvms if p.permission and p.view_menu]
         role = self.add_role(role_name)
-        role_pvms = [p for p in pvms if pvm_check(p)]
-        role.permissions = role_pvms
-        sesh.merge(role)
+
+        link_table = ab_models.assoc_permissionview_role
+        current_pv_ids = {
+            pv_id for pv_id, in sesh.query(link_table.c.permission_view_id)
+            .filter(link_table.c.role_id == role.id)
+        }
+        revoked = sorted(current_pv_ids - role_pv_ids)
+        for i in range(0, len(revoked), BULK_DELETE_BATCH_SIZE):
+            sesh.execute(link_table.delete().where(and_(
+                link_table.c.role_id == role.id,
+                link_table.c.permission_view_id.in_(
+                    revoked[i:i + BULK_DELETE_BATCH_SIZE]),
+            )))
+        granted = sorted(role_pv_ids - current_pv_ids)
+        if granted:
+            sesh.execute(link_table.insert(), [
+                {'role_id': role.id, 'permission_view_id': pv_id}
+                for pv_id in granted
+            ])
         sesh.commit()
 
     def is_admin_only(self, pvm):
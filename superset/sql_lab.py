@@ -6,21 +6,21 @@ import uuid
 
 from celery.exceptions import SoftTimeLimitExceeded
 from contextlib2 import contextmanager
-import simplejson as json
 import sqlalchemy
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
 from superset import app, dataframe, db, results_backend, security_manager
+from superset.db_engine_specs import LimitMethod
 from superset.models.sql_lab import Query
 from superset.sql_parse import SupersetQuery
 from superset.utils.core import (
     get_celery_app,
-    json_iso_dttm_ser,
     now_as_float,
     QueryStatus,
-    zlib_compress,
 )
+from superset.utils.query_channel import clear_query, publish_query
+from superset.utils.results_serialization import serialize_results
 
 config = app.config
 celery_app = get_celery_app(config)
@@ -95,7 +95,10 @@ def get_sql_results(
             query.status = QueryStatus.FAILED
             query.tmp_table_name = None
             session.commit()
+            publish_query(query)
             raise
+        finally:
+            clear_query(query_id)
 
 
 def execute_sql(
@@ -121,6 +124,7 @@ def execute_sql(
         query.status = QueryStatus.FAILED
         query.tmp_table_name = None
         session.commit()
+        publish_query(query)
         payload.update({
             'status': query.status,
             'error': msg,
@@ -167,9 +171,12 @@ def execute_sql(
     query.start_running_time = now_as_float()
     session.merge(query)
     session.commit()
+    publish_query(query)
     logging.info("Set query to 'running'")
     conn = None
     try:
+        # SQL Lab queries can leave state on their connection (temporary
+        # tables, session variables, ...), they aren't pooled
         engine = database.get_sqla_engine(
             schema=query.schema,
             nullpool=True,
@@ -188,7 +195,14 @@ def execute_sql(
             'sqllab.query.time_executing_query',
             now_as_float() - query_start_time)
         fetching_start_time = now_as_float()
-        data = db_engine_spec.fetch_data(cursor, query.limit)
+        # the rows are accumulated column by column as they're fetched
+        fetch_limit = (
+            query.limit
+            if db_engine_spec.limit_method == LimitMethod.FETCH_MANY else None)
+        batches = db_engine_spec.fetch_data_in_batches(
+            cursor, config.get('SQL_FETCH_BATCH_SIZE'), fetch_limit)
+        cdf = dataframe.SupersetDataFrame.from_batches(
+            batches, cursor.description, db_engine_spec)
         stats_logger.timing(
             'sqllab.query.time_fetching_results',
             now_as_float() - fetching_start_time)
@@ -205,8 +219,6 @@ def execute_sql(
             conn.close()
         return handle_error(db_engine_spec.extract_error_message(e))
 
-    logging.info('Fetching cursor description')
-    cursor_description = cursor.description
     if conn is not None:
         conn.commit()
         conn.close()
@@ -214,8 +226,6 @@ def execute_sql(
     if query.status == QueryStatus.STOPPED:
         return handle_error('The query has been stopped')
 
-    cdf = dataframe.SupersetDataFrame(data, cursor_description, db_engine_spec)
-
     query.rows = cdf.size
     query.progress = 100
     query.status = QueryStatus.SUCCESS
@@ -233,7 +243,6 @@ def execute_sql(
 
     payload.update({
         'status': query.status,
-        'data': cdf.data if cdf.data else [],
         'columns': cdf.columns if cdf.columns else [],
         'query': query.to_dict(),
     })
@@ -241,18 +250,20 @@ def execute_sql(
         key = '{}'.format(uuid.uuid4())
         logging.info('Storing results in results backend, key: {}'.format(key))
         write_to_results_backend_start = now_as_float()
-        json_payload = json.dumps(
-            payload, default=json_iso_dttm_ser, ignore_nan=True)
+        blob = serialize_results(
+            payload, cdf, config.get('RESULTS_BACKEND_SERIALIZATION'))
         cache_timeout = database.cache_timeout
         if cache_timeout is None:
             cache_timeout = config.get('CACHE_DEFAULT_TIMEOUT', 0)
-        results_backend.set(key, zlib_compress(json_payload), cache_timeout)
+        results_backend.set(key, blob, cache_timeout)
         query.results_key = key
         stats_logger.timing(
             'sqllab.query.results_backend_write',
             now_as_float() - write_to_results_backend_start)
     session.merge(query)
     session.commit()
+    publish_query(query)
 
     if return_results:
+        payload['data'] = cdf.data or []
         return payload
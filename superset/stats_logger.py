@@ -26,7 +26,7 @@ class BaseStatsLogger(object):
     def timing(self, key, value):
         raise NotImplementedError()
 
-    def gauge(self, key):
+    def gauge(self, key, value):
         """Setup a gauge"""
         raise NotImplementedError()
 
@@ -68,9 +68,8 @@ try:
         def timing(self, key, value):
             self.client.timing(key, value)
 
-        def gauge(self, key):
-            # pylint: disable=no-value-for-parameter
-            self.client.gauge(key)
+        def gauge(self, key, value):
+            self.client.gauge(key, value)
 
 except Exception as e:
     pass
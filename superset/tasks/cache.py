@@ -0,0 +1,280 @@
+# pylint: disable=C,R,W
+"""Celery tasks keeping the chart cache warm"""
+import json
+import logging
+import time
+
+from flask import g
+from sqlalchemy import and_, func
+
+from superset import app, db, security_manager
+from superset.connectors.connector_registry import ConnectorRegistry
+from superset.models.core import Dashboard, Database, Log, Slice
+from superset.utils.concurrency import run_concurrently
+from superset.utils.core import (
+    error_msg_from_exception,
+    get_celery_app,
+    parse_human_datetime,
+    QueryStatus,
+)
+
+config = app.config
+celery_app = get_celery_app(config)
+stats_logger = config.get('STATS_LOGGER')
+
+
+def get_viz(datasource_type, datasource_id, form_data, force=False):
+    from superset import viz
+    datasource = ConnectorRegistry.get_datasource(
+        datasource_type, datasource_id, db.session)
+    viz_type = form_data.get('viz_type', 'table')
+    return viz.viz_types[viz_type](datasource, form_data=form_data, force=force)
+
+
+def chart_request_context(form_data):
+    """Returns a request context posting ``form_data`` as the requests of
+    the chart do, for the ``url_param`` calls of its templated SQL to find
+    the URL parameters the chart was saved with"""
+    form_data = dict(form_data, url_params=form_data.get('url_params') or {})
+    return app.test_request_context(
+        '/superset/explore_json/',
+        method='POST',
+        data={'form_data': json.dumps(form_data)},
+    )
+
+
+@celery_app.task(name='cache.refresh_chart')
+def refresh_chart(datasource_type, datasource_id, form_data, user_name=None):
+    """Runs the queries of a chart and caches their results"""
+    with app.app_context(), chart_request_context(form_data):
+        g.user = (
+            security_manager.find_user(username=user_name)
+            if user_name else None)
+        try:
+            viz_obj = get_viz(
+                datasource_type, datasource_id, form_data, force=True)
+            viz_obj.get_payload()
+            stats_logger.incr('chart_cache_refreshed')
+        except Exception as e:
+            logging.exception(e)
+            stats_logger.incr('chart_cache_refresh_failed')
+        finally:
+            db.session.remove()
+
+
+class Strategy(object):
+    """Selects the charts to warm up
+
+    Subclasses implement ``get_slice_ids``, the keyword arguments of the
+    constructor are the options of the strategy, as passed from the command
+    line or the Celery beat schedule.
+    """
+
+    name = None
+
+    def get_slice_ids(self, session):
+        raise NotImplementedError()
+
+
+class TopNSlicesStrategy(Strategy):
+    """The ``top_n`` charts most viewed ``since`` a given time"""
+
+    name = 'top_n_slices'
+
+    def __init__(self, top_n=10, since='7 days ago'):
+        self.top_n = int(top_n)
+        self.since = since
+
+    def get_slice_ids(self, session):
+        count = func.count(Log.id)
+        qry = (
+            session.query(Log.slice_id)
+            .filter(and_(
+                Log.slice_id > 0,
+                Log.dttm >= parse_human_datetime(self.since)))
+            .group_by(Log.slice_id)
+            .order_by(count.desc())
+            .limit(self.top_n)
+        )
+        return [slice_id for slice_id, in qry]
+
+
+class TopNDashboardsStrategy(Strategy):
+    """The charts of the ``top_n`` dashboards most viewed ``since`` a given
+    time"""
+
+    name = 'top_n_dashboards'
+
+    def __init__(self, top_n=5, since='7 days ago'):
+        self.top_n = int(top_n)
+        self.since = since
+
+    def get_slice_ids(self, session):
+        count = func.count(Log.id)
+        qry = (
+            session.query(Log.dashboard_id)
+            .filter(and_(
+                Log.action == 'dashboard',
+                Log.dashboard_id > 0,
+                Log.dttm >= parse_human_datetime(self.since)))
+            .group_by(Log.dashboard_id)
+            .order_by(count.desc())
+            .limit(self.top_n)
+        )
+        dashboard_ids = [dashboard_id for dashboard_id, in qry]
+        return DashboardStrategy(dashboard_ids).get_slice_ids(session)
+
+
+class DashboardStrategy(Strategy):
+    """The charts of the given dashboards"""
+
+    name = 'dashboard'
+
+    def __init__(self, dashboard_ids=None):
+        self.dashboard_ids = [int(i) for i in dashboard_ids or []]
+
+    def get_slice_ids(self, session):
+        if not self.dashboard_ids:
+            return []
+        dashboards = (
+            session.query(Dashboard)
+            .filter(Dashboard.id.in_(self.dashboard_ids))
+        )
+        slice_ids = []
+        for dash in dashboards:
+            slice_ids.extend(
+                slc.id for slc in dash.slices if slc.id not in slice_ids)
+        return slice_ids
+
+
+class DatasourceStrategy(Strategy):
+    """The charts built on a datasource, either from its id and type or from
+    a table and database name"""
+
+    name = 'datasource'
+
+    def __init__(
+            self, datasource_id=None, datasource_type='table',
+            table_name=None, db_name=None):
+        self.datasource_id = datasource_id
+        self.datasource_type = datasource_type
+        self.table_name = table_name
+        self.db_name = db_name
+
+    def get_datasource_id(self, session):
+        """The id of the datasource, None when the table isn't found"""
+        if self.datasource_id or not (self.table_name and self.db_name):
+            return self.datasource_id
+        SqlaTable = ConnectorRegistry.sources['table']
+        table = (
+            session.query(SqlaTable)
+            .join(Database)
+            .filter(and_(
+                Database.database_name == self.db_name,
+                SqlaTable.table_name == self.table_name))
+        ).first()
+        return table.id if table else None
+
+    def get_slice_ids(self, session):
+        datasource_id = self.get_datasource_id(session)
+        if not datasource_id:
+            return []
+        qry = (
+            session.query(Slice.id)
+            .filter_by(
+                datasource_id=int(datasource_id),
+                datasource_type=self.datasource_type)
+        )
+        return [slice_id for slice_id, in qry]
+
+
+class SliceStrategy(Strategy):
+    """The given charts"""
+
+    name = 'slice'
+
+    def __init__(self, slice_ids=None):
+        self.slice_ids = [int(i) for i in slice_ids or []]
+
+    def get_slice_ids(self, session):
+        qry = session.query(Slice.id).filter(Slice.id.in_(self.slice_ids))
+        found = {slice_id for slice_id, in qry}
+        return [i for i in self.slice_ids if i in found]
+
+
+strategies = {
+    s.name: s for s in (
+        TopNSlicesStrategy,
+        TopNDashboardsStrategy,
+        DashboardStrategy,
+        DatasourceStrategy,
+        SliceStrategy,
+    )
+}
+
+
+def get_strategy(strategy_name, **kwargs):
+    if strategy_name not in strategies:
+        raise Exception('Unknown cache warm up strategy `{}`'.format(
+            strategy_name))
+    return strategies[strategy_name](**kwargs)
+
+
+def warm_up_slice(slice_id):
+    """Runs the queries of a chart, bypassing the cache, and caches them
+
+    Returns the name of the chart, how long it took and the error if any.
+    """
+    start = time.time()
+    result = {'slice_id': slice_id, 'slice_name': None, 'error': None}
+    try:
+        slc = db.session.query(Slice).filter_by(id=slice_id).one()
+        result['slice_name'] = slc.slice_name
+        with chart_request_context(slc.form_data):
+            payload = slc.get_viz(force=True).get_payload()
+        if payload.get('status') == QueryStatus.FAILED:
+            result['error'] = payload.get('error')
+    except Exception as e:
+        logging.exception(e)
+        result['error'] = error_msg_from_exception(e)
+    result['duration'] = round(time.time() - start, 3)
+    stats_logger.timing('cache_warm_up.slice', result['duration'])
+    if result['error']:
+        stats_logger.incr('cache_warm_up.slice_failed')
+    return result
+
+
+def warm_up_slices(slice_ids, max_workers=None):
+    """Warms up the charts on a pool of ``max_workers`` threads
+
+    Each chart is loaded in its own thread from its id, failures don't stop
+    the others from being warmed up.
+    """
+    if max_workers is None:
+        max_workers = config.get('CACHE_WARMUP_MAX_WORKERS')
+    return run_concurrently(
+        [lambda slice_id=slice_id: warm_up_slice(slice_id)
+         for slice_id in slice_ids],
+        max_workers,
+    )
+
+
+@celery_app.task(name='cache.warm_up')
+def warm_up_cache(strategy_name, max_workers=None, **kwargs):
+    """Warms up the charts selected by a strategy
+
+    Meant to be scheduled with Celery beat, see ``CELERYBEAT_SCHEDULE``.
+    """
+    with app.app_context():
+        try:
+            strategy = get_strategy(strategy_name, **kwargs)
+            slice_ids = strategy.get_slice_ids(db.session)
+            logging.info('Warming up {} charts with the {} strategy'.format(
+                len(slice_ids), strategy_name))
+            results = warm_up_slices(slice_ids, max_workers=max_workers)
+        finally:
+            db.session.remove()
+    failed = [r for r in results if r['error']]
+    logging.info('Warmed up {} charts, {} failed'.format(
+        len(results), len(failed)))
+    return results
@@ -0,0 +1,124 @@
+# pylint: disable=C,R,W
+"""Celery task ingesting the CSV files staged by the upload form"""
+from collections import namedtuple
+from datetime import datetime
+import logging
+import os
+
+from flask import g
+
+from superset import app, db, security_manager
+from superset.connectors.sqla.models import SqlaTable
+from superset.models.csv_upload import CsvUpload
+from superset.utils.core import (
+    error_msg_from_exception,
+    get_celery_app,
+    QueryStatus,
+)
+
+config = app.config
+celery_app = get_celery_app(config)
+stats_logger = config.get('STATS_LOGGER')
+
+# Fields of the CsvToDatabaseForm passed on to the worker, the database and
+# the file are passed separately
+FORM_FIELDS = (
+    'name',
+    'schema',
+    'sep',
+    'if_exists',
+    'header',
+    'index_col',
+    'mangle_dupe_cols',
+    'skipinitialspace',
+    'skiprows',
+    'nrows',
+    'skip_blank_lines',
+    'parse_dates',
+    'infer_datetime_format',
+    'decimal',
+    'index',
+    'index_label',
+)
+
+StagedFile = namedtuple('StagedFile', ['filename'])
+
+
+class StagedField(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+class StagedCsvForm(object):
+    """Stands in for the CsvToDatabaseForm that was posted, giving the
+    engine specs access to the values the same way"""
+
+    def __init__(self, values, database, filename):
+        for name in FORM_FIELDS:
+            setattr(self, name, StagedField(values.get(name)))
+        self.con = StagedField(database)
+        self.csv_file = StagedField(StagedFile(filename))
+
+
+def get_form_values(form):
+    return {name: getattr(form, name).data for name in FORM_FIELDS}
+
+
+@celery_app.task(name='csv_upload.ingest_csv')
+def ingest_csv(upload_id, form_values, user_name=None):
+    """Creates the table of a staged CSV file, reporting the rows inserted
+    so far on the ``CsvUpload`` record"""
+    with app.app_context():
+        g.user = (
+            security_manager.find_user(username=user_name)
+            if user_name else None)
+        session = db.session
+        upload = session.query(CsvUpload).filter_by(id=upload_id).one()
+        upload.status = QueryStatus.RUNNING
+        upload.start_time = datetime.now()
+        session.commit()
+
+        uploads_table = CsvUpload.__table__
+        ingested = {'rows': 0}
+
+        def progress(rows):
+            # the session holds the new dataset until the whole file is
+            # ingested, the progress is written apart from it
+            ingested['rows'] = rows
+            try:
+                db.engine.execute(
+                    uploads_table.update()
+                    .where(uploads_table.c.id == upload_id)
+                    .values(rows=rows))
+            except Exception as e:
+                logging.warning(
+                    'Could not report the progress of CSV upload {}: {}'.format(
+                        upload_id, e))
+
+        try:
+            database = upload.database
+            form = StagedCsvForm(form_values, database, upload.filename)
+            table = SqlaTable(table_name=upload.table_name)
+            table.database = database
+            table.database_id = database.id
+            database.db_engine_spec.create_table_from_csv(
+                form, table, progress=progress)
+            upload.table_id = table.id
+            upload.rows = ingested['rows']
+            upload.status = QueryStatus.SUCCESS
+            stats_logger.incr('successful_csv_upload')
+        except Exception as e:
+            logging.exception(e)
+            session.rollback()
+            upload.status = QueryStatus.FAILED
+            upload.error_message = error_msg_from_exception(e)
+            stats_logger.incr('failed_csv_upload')
+        finally:
+            upload.end_time = datetime.now()
+            session.commit()
+            try:
+                os.remove(os.path.join(config['UPLOAD_FOLDER'], upload.filename))
+            except OSError:
+                pass
+            db.session.remove()
@@ -1,4 +1,8 @@
 # pylint: disable=C,R,W
+import logging
+import threading
+import uuid
+
 from flask import request
 
 from superset import tables_cache
@@ -49,3 +53,85 @@ def memoized_func(key=view_cache_key, attribute_in_key=None):
                 return f(self, *args, **kwargs)
         return wrapped_f
     return wrap
+
+
+class InProcessLock(object):
+    """A lock on a cache key shared by the threads of the current process
+
+    Used with caches that live in the process memory (``SimpleCache``),
+    where other processes can't see what is cached anyway.
+    """
+    _keys = set()
+    _keys_lock = threading.Lock()
+
+    def __init__(self, key, timeout=None):
+        self.key = key
+
+    def acquire(self):
+        with self._keys_lock:
+            if self.key in self._keys:
+                return False
+            self._keys.add(self.key)
+            return True
+
+    def release(self):
+        with self._keys_lock:
+            self._keys.discard(self.key)
+
+
+class RedisLock(object):
+    """A lock on a cache key shared by all the processes using a Redis cache"""
+
+    def __init__(self, key, timeout, client):
+        self.lock = client.lock(key, timeout=timeout)
+
+    def acquire(self):
+        return self.lock.acquire(blocking=False)
+
+    def release(self):
+        try:
+            self.lock.release()
+        except Exception as e:
+            # the lock expired while the query was running
+            logging.warning('Could not release lock: {}'.format(e))
+
+
+class CacheLock(object):
+    """A lock on a cache key stored in the cache itself
+
+    Relies on ``add`` being atomic, which is the case for memcached. The
+    lock expires after ``timeout`` seconds so that a dead worker can't hold
+    it forever.
+    """
+
+    def __init__(self, key, timeout, cache):
+        self.key = key
+        self.timeout = timeout
+        self.cache = cache
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return bool(self.cache.add(self.key, self.token, timeout=self.timeout))
+
+    def release(self):
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+
+
+def get_cache_lock(cache, key, timeout):
+    """Returns a lock for ``key`` suited to the backend of ``cache``
+
+    The lock is used to make sure a single worker computes the value of a
+    key missing from the cache while the others poll the cache for it.
+    ``acquire`` doesn't block, it returns whether the lock was taken. Locks
+    expire after ``timeout`` seconds.
+    """
+    lock_key = 'lock_' + key
+    backend = cache.cache
+    client = getattr(backend, '_client', None)
+    if client is not None and hasattr(client, 'lock'):
+        prefix = getattr(backend, 'key_prefix', '') or ''
+        return RedisLock(prefix + lock_key, timeout, client)
+    if type(backend).__name__ == 'SimpleCache':
+        return InProcessLock(lock_key, timeout)
+    return CacheLock(lock_key, timeout, cache)
@@ -0,0 +1,89 @@
+# pylint: disable=C,R,W
+"""Helpers to run work concurrently from within the web application"""
+from concurrent.futures import as_completed, ThreadPoolExecutor
+import threading
+
+from contextlib2 import contextmanager
+from flask import (
+    _request_ctx_stack, current_app, g, has_app_context, has_request_context,
+)
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_semaphore(key, limit):
+    """Returns the process wide semaphore for ``key``"""
+    with _semaphores_lock:
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(limit)
+        return _semaphores[key]
+
+
+@contextmanager
+def concurrency_limit(key, limit):
+    """Blocks until less than ``limit`` threads are holding ``key``
+
+    A falsy ``key`` or ``limit`` means no limit.
+    """
+    if not key or not limit:
+        yield
+        return
+    with get_semaphore(key, limit):
+        yield
+
+
+def with_app_context(f):
+    """Wraps ``f`` to run in a copy of the current app and request contexts
+
+    The current user is carried over so that permission checks and user
+    impersonation behave as they do in the calling thread. Each thread gets
+    its own scoped SQLAlchemy session, removed when the app context pops.
+    """
+    if has_app_context():
+        app = current_app._get_current_object()
+    else:
+        from superset import app
+    user = getattr(g, 'user', None) if has_app_context() else None
+    request_ctx = (
+        _request_ctx_stack.top.copy() if has_request_context() else None)
+
+    def wrapped(*args, **kwargs):
+        with app.app_context():
+            g.user = user
+            if request_ctx is None:
+                return f(*args, **kwargs)
+            with request_ctx:
+                return f(*args, **kwargs)
+    return wrapped
+
+
+def run_concurrently(funcs, max_workers):
+    """Calls ``funcs`` on a bounded thread pool, returns their results in order
+
+    The first exception raised by any of the callables is re-raised. With
+    ``max_workers`` lower than 2 or a single callable everything runs in the
+    calling thread.
+    """
+    funcs = list(funcs)
+    if not max_workers or max_workers < 2 or len(funcs) < 2:
+        return [f() for f in funcs]
+    funcs = [with_app_context(f) for f in funcs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(funcs))) as executor:
+        futures = [executor.submit(f) for f in funcs]
+        return [future.result() for future in futures]
+
+
+def iter_concurrently(funcs, max_workers):
+    """Like ``run_concurrently`` but yields ``(index, result)`` tuples as
+    soon as each callable returns, in completion order"""
+    funcs = list(funcs)
+    if not max_workers or max_workers < 2 or len(funcs) < 2:
+        for i, f in enumerate(funcs):
+            yield i, f()
+        return
+    funcs = [with_app_context(f) for f in funcs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(funcs))) as executor:
+        futures = {executor.submit(f): i for i, f in enumerate(funcs)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
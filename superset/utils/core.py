@@ -699,6 +699,34 @@ def zlib_decompress_to_string(blob):
     return zlib.decompress(blob)
 
 
+def df_chunks_to_csv(df_chunks, **kwargs):
+    """Renders an iterable of DataFrames as CSV, one chunk at a time
+
+    The header is only written for the first chunk, ``kwargs`` are passed
+    to ``DataFrame.to_csv``.
+    >>> chunks = [pd.DataFrame({'a': [1]}), pd.DataFrame({'a': [2]})]
+    >>> ''.join(df_chunks_to_csv(chunks, index=False))
+    'a\\n1\\n2\\n'
+    """
+    header = kwargs.pop('header', True)
+    for df in df_chunks:
+        yield df.to_csv(header=header, **kwargs)
+        header = False
+
+
+def gzip_chunks(chunks, encoding='utf-8'):
+    """Gzips an iterable of strings or bytes on the fly"""
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode(encoding)
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 _celery_app = None
 
 
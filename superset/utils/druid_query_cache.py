@@ -0,0 +1,54 @@
+# pylint: disable=C,R,W
+"""Caches the results of the queries sent to Druid brokers
+
+Results are keyed by the JSON of the query as built by pydruid, so the
+phase 1 query finding the top dimension values of a two-phase query is
+cached on its own. The phase 2 queries of ``query=true`` previews or of
+charts only changing the post-processing reuse its results.
+"""
+import hashlib
+import json
+import logging
+
+from superset import app
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+
+
+def get_cache_key(query_dict, namespace=None):
+    json_data = json.dumps(query_dict, sort_keys=True, default=str)
+    return 'druid_query_{}_{}'.format(
+        namespace or '',
+        hashlib.md5(json_data.encode('utf-8')).hexdigest())
+
+
+def run_query(client, query_type, qry, cache, cache_timeout, phase=2,
+              namespace=None, force=False):
+    """Runs ``qry`` like ``getattr(client, query_type)(**qry)`` does,
+    parsing the results from cache when they're there
+
+    ``namespace`` keeps apart queries with the same JSON sent to different
+    clusters, ``phase`` is only used to report hits and misses. With
+    ``force`` the cache isn't read, only refreshed with the new results.
+    """
+    query = getattr(client.query_builder, query_type)(qry)
+    cache_key = get_cache_key(query.query_dict, namespace)
+    result_json = None
+    try:
+        if not force:
+            result_json = cache.get(cache_key)
+    except Exception as e:
+        logging.exception(e)
+    if result_json is not None:
+        stats_logger.incr('druid_query_cache.phase_{}.hit'.format(phase))
+        query.parse(result_json)
+        return query
+
+    stats_logger.incr('druid_query_cache.phase_{}.miss'.format(phase))
+    client._post(query)
+    try:
+        cache.set(cache_key, query.result_json, timeout=cache_timeout)
+    except Exception as e:
+        logging.exception(e)
+    return query
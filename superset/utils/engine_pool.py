@@ -0,0 +1,160 @@
+# pylint: disable=C,R,W
+"""A registry of the SQLAlchemy engines connecting to analytics databases
+
+Engines are kept per database, schema and effective user so that their
+connection pools stay warm across requests. Engines that haven't been used
+for a while are disposed of, which closes their idle connections.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+from superset import app
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+
+
+class EngineEntry(object):
+
+    def __init__(self, engine, database_id, version):
+        self.engine = engine
+        self.database_id = database_id
+        self.version = version
+        self.last_used = time.time()
+
+
+class EngineRegistry(object):
+    """Creates engines on demand and keeps them until they go idle
+
+    ``version`` identifies the settings an engine was created with (URI,
+    ``extra``, ...): getting an engine for a database with a new version
+    disposes of the engines created with the previous ones.
+    """
+
+    def __init__(self, idle_timeout=None, eviction_interval=60):
+        self.engines = {}
+        self.lock = threading.Lock()
+        self.idle_timeout = idle_timeout
+        self.eviction_interval = eviction_interval
+        self.last_eviction = time.time()
+
+    def get_engine(self, database_id, version, key, create_engine):
+        """Returns the engine registered for ``key`` or the one returned by
+        ``create_engine``
+
+        ``create_engine`` is called without holding the lock of the registry,
+        which would block every other database meanwhile. When two threads
+        create the same engine at once, the first one registered is kept.
+        """
+        key = (database_id, version) + tuple(key)
+        with self.lock:
+            entry = self.engines.get(key)
+            if entry is not None:
+                disposed = self.use(entry, time.time())
+        if entry is not None:
+            self.dispose(disposed)
+            return entry.engine
+
+        engine = create_engine()
+        disposed = []
+        with self.lock:
+            entry = self.engines.get(key)
+            if entry is None:
+                for k, e in list(self.engines.items()):
+                    if e.database_id == database_id and e.version != version:
+                        disposed.append(self.engines.pop(k))
+                self.instrument(engine)
+                entry = self.engines[key] = EngineEntry(
+                    engine, database_id, version)
+                stats_logger.incr('engine_pool.create')
+                stats_logger.gauge('engine_pool.engines', len(self.engines))
+            else:
+                # another thread registered it in the meantime
+                disposed.append(EngineEntry(engine, database_id, version))
+            disposed += self.use(entry, time.time())
+        self.dispose(disposed)
+        return entry.engine
+
+    def use(self, entry, now):
+        """Marks ``entry`` as used, returns the entries to dispose of if
+        it's time to look for idle ones"""
+        entry.last_used = now
+        if now - self.last_eviction >= self.eviction_interval:
+            return self.pop_idle(now)
+        return []
+
+    def pop_idle(self, now):
+        self.last_eviction = now
+        idle_timeout = self.idle_timeout
+        if idle_timeout is None:
+            idle_timeout = config.get('DB_POOL_IDLE_TIMEOUT')
+        if not idle_timeout:
+            return []
+        idle = [
+            k for k, e in self.engines.items()
+            if now - e.last_used > idle_timeout
+        ]
+        return [self.engines.pop(k) for k in idle]
+
+    def evict_idle(self):
+        """Disposes of the engines that haven't been used for
+        ``DB_POOL_IDLE_TIMEOUT`` seconds"""
+        with self.lock:
+            disposed = self.pop_idle(time.time())
+        self.dispose(disposed)
+        return len(disposed)
+
+    def dispose(self, entries):
+        for entry in entries:
+            try:
+                entry.engine.dispose()
+            except Exception as e:
+                logging.exception(e)
+            stats_logger.incr('engine_pool.dispose')
+        if entries:
+            stats_logger.gauge('engine_pool.engines', len(self.engines))
+
+    def clear(self, database_id=None):
+        """Disposes of all the engines, or those of a database"""
+        with self.lock:
+            keys = [
+                k for k, e in self.engines.items()
+                if database_id is None or e.database_id == database_id
+            ]
+            disposed = [self.engines.pop(k) for k in keys]
+        self.dispose(disposed)
+
+    def instrument(self, engine):
+        """Reports the activity of the engine's pool to the stats logger"""
+        pool = engine.pool
+
+        @event.listens_for(pool, 'connect')
+        def connect(dbapi_connection, connection_record):
+            stats_logger.incr('engine_pool.connect')
+
+        @event.listens_for(pool, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            stats_logger.incr('engine_pool.checkout')
+            checkedout = getattr(pool, 'checkedout', None)
+            if checkedout:
+                stats_logger.gauge('engine_pool.checkedout', checkedout())
+
+    def status(self):
+        """Describes the pools of the registered engines"""
+        with self.lock:
+            entries = list(self.engines.items())
+        return [
+            {
+                'database_id': e.database_id,
+                'key': k[2:],
+                'idle': time.time() - e.last_used,
+                'pool': e.engine.pool.status(),
+            }
+            for k, e in entries
+        ]
+
+
+engine_registry = EngineRegistry()
@@ -0,0 +1,224 @@
+# pylint: disable=C,R,W
+"""Cancel signals, progress and status updates of SQL Lab queries
+
+Web servers and the workers running async queries exchange them through a
+cache shared by all processes (Redis, memcached, ...) instead of the
+metadata database, which workers would otherwise have to read on every
+poll of the cursor and SQL Lab clients on every refresh.
+
+Status updates are published as a numbered stream of events per user: a
+counter holds the number of the last event and each event is stored under
+its own key, so that subscribers only read the events they haven't seen.
+"""
+import logging
+import time
+
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import app
+
+config = app.config
+
+
+class QueryChannel(object):
+    """Cancel signals and progress of queries stored in a werkzeug cache
+
+    Entries expire after ``timeout`` seconds, which should exceed the
+    maximum duration of a query.
+    """
+
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+
+    def _key(self, kind, query_id):
+        return 'query_channel:{}:{}'.format(kind, query_id)
+
+    def cancel(self, query_id):
+        self.backend.set(self._key('cancel', query_id), True, timeout=self.timeout)
+
+    def is_cancelled(self, query_id):
+        return bool(self.backend.get(self._key('cancel', query_id)))
+
+    def set_progress(self, query_id, progress):
+        self.backend.set(
+            self._key('progress', query_id), progress, timeout=self.timeout)
+
+    def get_progress(self, query_ids):
+        """Returns the progress of the queries that reported one, by id"""
+        query_ids = list(query_ids)
+        if not query_ids:
+            return {}
+        values = self.backend.get_many(
+            *[self._key('progress', i) for i in query_ids])
+        return {i: v for i, v in zip(query_ids, values) if v is not None}
+
+    def clear(self, query_id):
+        self.backend.delete_many(
+            self._key('cancel', query_id), self._key('progress', query_id))
+
+    def _seq_key(self, user_id):
+        return self._key('seq', user_id)
+
+    def _event_key(self, user_id, seq):
+        return self._key('event', '{}:{}'.format(user_id, seq))
+
+    def get_seq(self, user_id):
+        """Returns the number of the last event published for the user"""
+        return int(self.backend.get(self._seq_key(user_id)) or 0)
+
+    def publish(self, user_id, query_dict):
+        """Appends the state of a query to the events of its user"""
+        seq = self.backend.inc(self._seq_key(user_id))
+        if seq is None:
+            # memcached doesn't increment missing keys
+            self.backend.add(self._seq_key(user_id), 0, timeout=0)
+            seq = self.backend.inc(self._seq_key(user_id))
+        self.backend.set(
+            self._event_key(user_id, seq), query_dict, timeout=self.timeout)
+        return seq
+
+    def get_updates(self, user_id, since, max_events=None):
+        """Returns the queries updated after the event number ``since``
+
+        Returns a ``(seq, queries, complete)`` tuple where ``queries`` maps
+        client ids to the latest state of each query. ``complete`` is False
+        when the events can't be trusted to hold all updates: the subscriber
+        is too far behind, some events expired or the counter was reset.
+        """
+        if max_events is None:
+            max_events = config.get('SQLLAB_QUERY_UPDATES_MAX_EVENTS')
+        seq = self.get_seq(user_id)
+        if since is None or since > seq or seq - since > max_events:
+            return seq, {}, False
+        if since == seq:
+            return seq, {}, True
+        events = self.backend.get_many(*[
+            self._event_key(user_id, i) for i in range(since + 1, seq + 1)])
+        if any(event is None for event in events):
+            return seq, {}, False
+        return seq, {event['id']: event for event in events}, True
+
+    def wait_for_updates(self, user_id, since, timeout, interval=0.5):
+        """Like ``get_updates`` but waits up to ``timeout`` seconds for
+        something to happen"""
+        deadline = time.time() + timeout
+        while True:
+            seq, queries, complete = self.get_updates(user_id, since)
+            if queries or not complete or time.time() >= deadline:
+                return seq, queries, complete
+            time.sleep(interval)
+
+
+class InMemoryQueryChannel(QueryChannel):
+    """A channel living in the memory of the current process
+
+    Only suited to tests and to setups where queries run in the web server
+    processes.
+    """
+
+    def __init__(self, timeout=None):
+        super(InMemoryQueryChannel, self).__init__(SimpleCache(), timeout)
+
+
+_channel = None
+
+
+def get_query_channel():
+    """Returns the channel configured with ``SQLLAB_QUERY_CHANNEL_BACKEND``,
+    falling back on ``RESULTS_BACKEND``, or ``None`` if neither is set"""
+    global _channel
+    if _channel is None:
+        backend = (
+            config.get('SQLLAB_QUERY_CHANNEL_BACKEND') or
+            config.get('RESULTS_BACKEND'))
+        if backend is not None:
+            _channel = QueryChannel(
+                backend, timeout=config.get('SQLLAB_ASYNC_TIME_LIMIT_SEC'))
+    return _channel
+
+
+def publish_query(query, channel=None):
+    """Publishes the current state of ``query`` to the SQL Lab clients of its
+    user, if a query channel is configured"""
+    channel = channel or get_query_channel()
+    if channel is None:
+        return
+    try:
+        channel.publish(query.user_id, query.to_dict())
+    except Exception as e:
+        # clients fall back on polling the metadata database
+        logging.exception(e)
+
+
+def clear_query(query_id, channel=None):
+    """Forgets the cancel signal and progress of a query that finished, if a
+    query channel is configured"""
+    channel = channel or get_query_channel()
+    if channel is None:
+        return
+    try:
+        channel.clear(query_id)
+    except Exception as e:
+        # the entries expire on their own
+        logging.exception(e)
+
+
+class ProgressReporter(object):
+    """Coalesces the progress updates of a running query
+
+    Progress is published on the channel, when there's one, as soon as it
+    changes, while the query row is only committed to the metadata database
+    once every ``commit_interval`` seconds, and when ``flush`` is called.
+    """
+
+    def __init__(self, query, session, channel=None, commit_interval=None):
+        self.query = query
+        self.session = session
+        self.channel = channel
+        if commit_interval is None:
+            commit_interval = config.get('SQLLAB_PROGRESS_COMMIT_INTERVAL')
+        self.commit_interval = commit_interval or 0
+        self.last_commit = time.time()
+        self.dirty = False
+
+    def is_stopped(self):
+        """Whether the query was stopped by the user or timed out
+
+        With a channel, both send it a cancel signal, see ``stop_query`` and
+        ``queries`` in the views.
+        """
+        from superset.utils.core import QueryStatus
+        if self.channel:
+            return self.channel.is_cancelled(self.query.id)
+        model = type(self.query)
+        status = (
+            self.session.query(model.status)
+            .filter_by(id=self.query.id)
+            .scalar()
+        )
+        return status in (QueryStatus.STOPPED, QueryStatus.TIMED_OUT)
+
+    def update(self, progress=None, **attributes):
+        """Sets the progress, only if it moved forward, and any other
+        attribute of the query"""
+        changed = bool(attributes)
+        if progress is not None and progress > (self.query.progress or 0):
+            self.query.progress = progress
+            changed = True
+            if self.channel:
+                self.channel.set_progress(self.query.id, progress)
+        for k, v in attributes.items():
+            setattr(self.query, k, v)
+        if changed:
+            self.dirty = True
+            if self.channel:
+                publish_query(self.query, self.channel)
+        if self.dirty and time.time() - self.last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        if self.dirty:
+            self.session.commit()
+            self.dirty = False
+        self.last_commit = time.time()
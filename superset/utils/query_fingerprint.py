@@ -0,0 +1,118 @@
+# pylint: disable=C,R,W
+"""Canonical fingerprint of the queries sent to datasources
+
+Charts built differently can end up running the very same query: filters
+listed in another order, adhoc metrics carrying front-end only attributes
+like their ``optionId``, empty extras left out or set to ``''``. The
+fingerprint is computed on a normalized version of the query object so
+that these queries share a cache key.
+"""
+import hashlib
+
+import simplejson as json
+
+from superset.utils.core import (
+    get_metric_name,
+    is_adhoc_metric,
+    parse_human_timedelta,
+    pessimistic_json_iso_dttm_ser,
+)
+
+# Keys of the query object that don't change the results, the time bounds
+# are replaced by the time range they were computed from
+IGNORED_KEYS = (
+    'from_dttm',
+    'to_dttm',
+    'inner_from_dttm',
+    'inner_to_dttm',
+    'prequeries',
+)
+
+# Attributes of an adhoc metric that define what it computes
+ADHOC_METRIC_KEYS = ('expressionType', 'aggregate', 'sqlExpression')
+
+# Filter operators for which the order of the values doesn't matter
+SET_OPERATORS = ('in', 'not in')
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == [] or value == {}
+
+
+def _sort_key(value):
+    return json.dumps(value, sort_keys=True, default=pessimistic_json_iso_dttm_ser)
+
+
+def normalize_metric(metric):
+    """Reduces an adhoc metric to its label and what it computes"""
+    if not is_adhoc_metric(metric):
+        return metric
+    normalized = {k: metric.get(k) for k in ADHOC_METRIC_KEYS if metric.get(k)}
+    column = metric.get('column')
+    if column:
+        normalized['column'] = column.get('column_name')
+    normalized['label'] = get_metric_name(metric)
+    return normalized
+
+
+def normalize_filter(flt):
+    flt = {k: v for k, v in flt.items() if not _is_empty(v) or k == 'val'}
+    if flt.get('op') in SET_OPERATORS and isinstance(flt.get('val'), list):
+        flt['val'] = sorted(flt['val'], key=_sort_key)
+    return flt
+
+
+def normalize_query_obj(query_obj):
+    """Returns a canonical copy of ``query_obj``
+
+    Filters are sorted, adhoc metrics reduced to their label and
+    definition, and empty values dropped. The order of the metrics, group
+    by and columns is kept as it defines the order of the columns of the
+    results.
+    """
+    normalized = {}
+    for k, v in query_obj.items():
+        if k in IGNORED_KEYS or _is_empty(v):
+            continue
+        if k == 'metrics':
+            v = [normalize_metric(m) for m in v]
+        elif k == 'timeseries_limit_metric':
+            v = normalize_metric(v)
+        elif k == 'filter':
+            v = sorted((normalize_filter(f) for f in v), key=_sort_key)
+        elif k == 'extras':
+            v = {ek: ev for ek, ev in v.items() if not _is_empty(ev)}
+        if not _is_empty(v):
+            normalized[k] = v
+    return normalized
+
+
+def normalize_time_range(time_range=None, since=None, until=None, time_shift=None):
+    """Returns the user provided, possibly relative, time bounds of a query"""
+    normalized = {}
+    if time_range and time_range.strip():
+        normalized['time_range'] = ' '.join(time_range.split())
+    elif since or until:
+        normalized['since'] = since
+        normalized['until'] = until
+    if time_shift:
+        seconds = parse_human_timedelta(time_shift).total_seconds()
+        if seconds:
+            normalized['time_shift'] = seconds
+    return normalized
+
+
+def query_fingerprint(query_obj, datasource, time_range=None, **extra):
+    """Hashes the normalized query object along with the datasource uid,
+    the normalized time range and any ``extra`` key/values"""
+    fingerprint = normalize_query_obj(query_obj)
+    fingerprint.update(time_range or {})
+    fingerprint.update(extra)
+    fingerprint['datasource'] = datasource
+    json_data = json.dumps(
+        fingerprint,
+        default=pessimistic_json_iso_dttm_ser,
+        ignore_nan=True,
+        sort_keys=True,
+    )
+    return hashlib.md5(json_data.encode('utf-8')).hexdigest()
@@ -0,0 +1,329 @@
+# pylint: disable=C,R,W
+"""Serialization of SQL Lab result sets stored in the results backend
+
+Two formats are supported:
+
+* ``json``: the historical format, the whole payload (including a list of
+  per-row dicts) dumped to JSON and zlib compressed.
+* ``msgpack``: a columnar format written straight from the
+  ``SupersetDataFrame.df``. Numeric and datetime columns are stored as raw
+  numpy buffers, other columns as msgpack arrays, each column compressed
+  independently so that readers only decode what they need.
+
+Readers detect the format from the blob itself, so blobs written with
+either format remain readable whatever ``RESULTS_BACKEND_SERIALIZATION``
+is currently set to.
+"""
+import zlib
+
+import msgpack
+import numpy as np
+import pandas as pd
+import simplejson as json
+
+from superset.dataframe import column_to_list
+from superset.utils.core import (
+    JS_MAX_INTEGER,
+    json_iso_dttm_ser,
+    pessimistic_json_iso_dttm_ser,
+    zlib_compress,
+    zlib_decompress_to_string,
+)
+
+MSGPACK_MAGIC = b'SSRB\x01'
+
+# Column encodings used by the msgpack format
+NUMPY_COLUMN = 'numpy'
+DATETIME_COLUMN = 'datetime'
+OBJECT_COLUMN = 'object'
+
+# Bytes of a column decompressed at a time when streaming the result set
+DECOMPRESS_SIZE = 1024 * 1024
+
+
+def _msgpack_default(obj):
+    return pessimistic_json_iso_dttm_ser(obj)
+
+
+def _fix_int_overflow(values):
+    """Turns ints too big for msgpack (and Java Script) into strings"""
+    return [
+        str(v) if isinstance(v, int) and abs(v) > JS_MAX_INTEGER else v
+        for v in values
+    ]
+
+
+def encode_column(series):
+    """Encodes a pandas Series into a msgpack friendly dict"""
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        return {
+            'kind': NUMPY_COLUMN,
+            'dtype': dtype.str,
+            'data': zlib.compress(np.ascontiguousarray(series.values).tobytes()),
+        }
+    if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+        values = series.values.astype('datetime64[ns]').view('i8')
+        return {
+            'kind': DATETIME_COLUMN,
+            'dtype': '<i8',
+            'data': zlib.compress(np.ascontiguousarray(values).tobytes()),
+        }
+    values = series.astype(object).where(series.notnull(), None).tolist()
+    try:
+        packed = msgpack.packb(
+            values, use_bin_type=True, default=_msgpack_default)
+    except OverflowError:
+        packed = msgpack.packb(
+            _fix_int_overflow(values), use_bin_type=True,
+            default=_msgpack_default)
+    return {
+        'kind': OBJECT_COLUMN,
+        'dtype': None,
+        'data': zlib.compress(packed),
+    }
+
+
+def decode_column(column):
+    """Decodes a column encoded with ``encode_column`` into a numpy array"""
+    data = zlib.decompress(column['data'])
+    if column['kind'] == NUMPY_COLUMN:
+        return np.frombuffer(data, dtype=np.dtype(column['dtype']))
+    if column['kind'] == DATETIME_COLUMN:
+        return np.frombuffer(data, dtype='<i8').view('datetime64[ns]')
+    values = msgpack.unpackb(data, raw=False)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _iter_decompressed(data, size=DECOMPRESS_SIZE):
+    """Yields the zlib compressed ``data`` decompressed about ``size``
+    bytes at a time"""
+    decompressor = zlib.decompressobj()
+    while data:
+        out = decompressor.decompress(data, size)
+        data = decompressor.unconsumed_tail
+        if out:
+            yield out
+    out = decompressor.flush()
+    if out:
+        yield out
+
+
+def iter_decode_column(column, chunk_size):
+    """Decodes a column encoded with ``encode_column`` into numpy arrays of
+    ``chunk_size`` values, never decompressing the whole column"""
+    if column['kind'] == OBJECT_COLUMN:
+        unpacker = msgpack.Unpacker(raw=False)
+        values = None
+        for data in _iter_decompressed(column['data']):
+            unpacker.feed(data)
+            if values is None:
+                try:
+                    unpacker.read_array_header()
+                except msgpack.OutOfData:
+                    continue
+                values = []
+            for value in unpacker:
+                values.append(value)
+                if len(values) == chunk_size:
+                    arr = np.empty(chunk_size, dtype=object)
+                    arr[:] = values
+                    yield arr
+                    values = []
+        if values:
+            arr = np.empty(len(values), dtype=object)
+            arr[:] = values
+            yield arr
+        return
+
+    dtype = np.dtype(column['dtype'])
+    chunk_bytes = chunk_size * dtype.itemsize
+    buf = b''
+    for data in _iter_decompressed(column['data'], chunk_bytes):
+        buf += data
+        while len(buf) >= chunk_bytes:
+            arr = np.frombuffer(buf[:chunk_bytes], dtype=dtype)
+            buf = buf[chunk_bytes:]
+            yield _view_column(column, arr)
+    if buf:
+        yield _view_column(column, np.frombuffer(buf, dtype=dtype))
+
+
+def _view_column(column, arr):
+    if column['kind'] == DATETIME_COLUMN:
+        return arr.view('datetime64[ns]')
+    return arr
+
+
+class ResultsPayload(object):
+    """A SQL Lab result set read back from the results backend
+
+    Subclasses expose the same interface so that callers don't need to know
+    how the blob was serialized.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    @property
+    def column_names(self):
+        return [c['name'] for c in self.metadata.get('columns') or []]
+
+    def records(self, limit=None):
+        raise NotImplementedError()
+
+    def to_dataframe(self):
+        raise NotImplementedError()
+
+    def iter_dataframes(self, chunk_size=None):
+        """Yields the result set as DataFrames of ``chunk_size`` rows"""
+        df = self.to_dataframe()
+        if not chunk_size or len(df.index) <= chunk_size:
+            yield df
+            return
+        for start in range(0, len(df.index), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+    def to_dict(self, limit=None):
+        """Returns the payload as it was before being serialized"""
+        payload = dict(self.metadata)
+        payload['data'] = self.records(limit)
+        return payload
+
+
+class JsonResultsPayload(ResultsPayload):
+
+    def __init__(self, payload):
+        data = payload.pop('data', None) or []
+        super(JsonResultsPayload, self).__init__(payload)
+        self._data = data
+
+    def records(self, limit=None):
+        if limit:
+            return self._data[:limit]
+        return self._data
+
+    def to_dataframe(self):
+        return pd.DataFrame.from_records(self._data, columns=self.column_names)
+
+    def iter_dataframes(self, chunk_size=None):
+        if not chunk_size or len(self._data) <= chunk_size:
+            yield self.to_dataframe()
+            return
+        for start in range(0, len(self._data), chunk_size):
+            yield pd.DataFrame.from_records(
+                self._data[start:start + chunk_size],
+                columns=self.column_names)
+
+
+class MsgpackResultsPayload(ResultsPayload):
+
+    def __init__(self, envelope):
+        super(MsgpackResultsPayload, self).__init__(envelope['metadata'])
+        self.names = envelope['names']
+        self.nrows = envelope['nrows']
+        self._columns = envelope['columns']
+        self._decoded = {}
+
+    def column(self, i):
+        """Decodes the i-th column, only once"""
+        if i not in self._decoded:
+            self._decoded[i] = decode_column(self._columns[i])
+        return self._decoded[i]
+
+    def records(self, limit=None):
+        nrows = min(limit, self.nrows) if limit else self.nrows
+        columns = [
+            column_to_list(self.column(i)[:nrows])
+            for i in range(len(self.names))
+        ]
+        return [dict(zip(self.names, row)) for row in zip(*columns)]
+
+    def to_dataframe(self):
+        data = {name: self.column(i) for i, name in enumerate(self.names)}
+        return pd.DataFrame(data, columns=self.names)
+
+    def iter_dataframes(self, chunk_size=None):
+        """Decodes the columns ``chunk_size`` rows at a time, only one chunk
+        of the result set is held decompressed in memory"""
+        if not chunk_size or self.nrows <= chunk_size or not self.names:
+            yield self.to_dataframe()
+            return
+        column_chunks = [
+            iter_decode_column(column, chunk_size) for column in self._columns]
+        for arrays in zip(*column_chunks):
+            yield pd.DataFrame(dict(zip(self.names, arrays)), columns=self.names)
+
+
+class BaseResultsSerializer(object):
+    """Turns a SQL Lab payload and its SupersetDataFrame into a blob"""
+
+    name = None
+
+    def serialize(self, payload, cdf):
+        raise NotImplementedError()
+
+    def deserialize(self, blob):
+        raise NotImplementedError()
+
+
+class JsonResultsSerializer(BaseResultsSerializer):
+
+    name = 'json'
+
+    def serialize(self, payload, cdf):
+        payload = dict(payload)
+        payload['data'] = cdf.data or []
+        json_payload = json.dumps(
+            payload, default=json_iso_dttm_ser, ignore_nan=True)
+        return zlib_compress(json_payload)
+
+    def deserialize(self, blob):
+        return JsonResultsPayload(json.loads(zlib_decompress_to_string(blob)))
+
+
+class MsgpackResultsSerializer(BaseResultsSerializer):
+
+    name = 'msgpack'
+
+    def serialize(self, payload, cdf):
+        df = cdf.df
+        metadata = dict(payload)
+        metadata.pop('data', None)
+        envelope = {
+            'metadata': metadata,
+            'names': [str(c) for c in df.columns],
+            'nrows': len(df.index),
+            'columns': [encode_column(df.iloc[:, i]) for i in range(len(df.columns))],
+        }
+        return MSGPACK_MAGIC + msgpack.packb(
+            envelope, use_bin_type=True, default=_msgpack_default)
+
+    def deserialize(self, blob):
+        envelope = msgpack.unpackb(blob[len(MSGPACK_MAGIC):], raw=False)
+        return MsgpackResultsPayload(envelope)
+
+
+serializers = {
+    s.name: s() for s in (JsonResultsSerializer, MsgpackResultsSerializer)
+}
+
+
+def get_serializer(name):
+    if name not in serializers:
+        raise Exception(
+            'Unknown results backend serialization `{}`'.format(name))
+    return serializers[name]
+
+
+def serialize_results(payload, cdf, name='json'):
+    return get_serializer(name).serialize(payload, cdf)
+
+
+def deserialize_results(blob):
+    """Reads a blob written with any of the supported formats"""
+    if isinstance(blob, bytes) and blob.startswith(MSGPACK_MAGIC):
+        return serializers[MsgpackResultsSerializer.name].deserialize(blob)
+    return serializers[JsonResultsSerializer.name].deserialize(blob)
@@ -0,0 +1,58 @@
+# pylint: disable=C,R,W
+"""Compiles SQLAlchemy queries into SQL strings without creating engines
+
+Compiling a query only needs the dialect of the target database, which is
+the same for all the databases using a given driver and dialect options.
+Dialects are created once per driver and set of options, loading its DBAPI
+module when it's installed so that the generated SQL matches what an engine
+would produce.
+"""
+import logging
+import threading
+
+from sqlalchemy import util
+from sqlalchemy.engine.url import make_url
+
+_dialects = {}
+_dialects_lock = threading.Lock()
+
+
+def get_dialect_params(dialect_cls, engine_params):
+    """Returns the ``engine_params`` that ``create_engine`` passes on to the
+    dialect, such as ``label_length`` or ``implicit_returning``"""
+    names = util.get_cls_kwargs(dialect_cls)
+    return {k: v for k, v in (engine_params or {}).items() if k in names}
+
+
+def create_dialect(sqla_url, params):
+    dialect_cls = sqla_url.get_dialect()
+    try:
+        dbapi = dialect_cls.dbapi()
+    except Exception as e:
+        # the driver isn't installed, compiling works all the same
+        logging.info('No DBAPI module for {}: {}'.format(sqla_url.drivername, e))
+        return dialect_cls(**params)
+    return dialect_cls(dbapi=dbapi, **params)
+
+
+def get_dialect(sqla_url, engine_params=None):
+    """Returns the dialect shared by the databases using the same driver and
+    the same dialect options in their ``engine_params``"""
+    sqla_url = make_url(sqla_url)
+    params = get_dialect_params(sqla_url.get_dialect(), engine_params)
+    key = (sqla_url.drivername, repr(sorted(params.items())))
+    dialect = _dialects.get(key)
+    if dialect is None:
+        with _dialects_lock:
+            dialect = _dialects.get(key)
+            if dialect is None:
+                dialect = _dialects[key] = create_dialect(sqla_url, params)
+    return dialect
+
+
+def compile_query(qry, dialect):
+    """Compiles ``qry`` with its parameters rendered inline"""
+    sql = str(qry.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.identifier_preparer._double_percents:
+        sql = sql.replace('%%', '%')
+    return sql
@@ -0,0 +1,182 @@
+# pylint: disable=C,R,W
+"""Incremental caching of the results of time series queries
+
+The time range of a query is split into chunks, one per day, whose results
+are cached separately under a key that leaves the time bounds out. Running
+the same query over another time range only queries the chunks that aren't
+in cache, merging consecutive ones into a single query, and stitches the
+results together. Chunks that may still receive data are always queried.
+
+This is only correct when the rows of a time bucket don't depend on the
+other buckets, which rules out series limits and time grains coarser than
+a day whose buckets could straddle chunks.
+"""
+from datetime import datetime, timedelta
+import logging
+
+import pandas as pd
+
+from superset.models.helpers import QueryResult
+from superset.utils.core import DTTM_ALIAS, EPOCH, QueryStatus
+from superset.utils.query_fingerprint import query_fingerprint
+
+CHUNK_SIZE = timedelta(days=1)
+
+# Time grains whose buckets never straddle two chunks
+SUPPORTED_TIME_GRAINS = (None, 'PT1S', 'PT1M', 'PT1H', 'P1D')
+
+
+def get_chunks(from_dttm, to_dttm, chunk_size=CHUNK_SIZE):
+    """Splits the time range at the multiples of ``chunk_size``"""
+    chunks = []
+    start = from_dttm
+    while start < to_dttm:
+        end = EPOCH + ((start - EPOCH) // chunk_size + 1) * chunk_size
+        end = min(end, to_dttm)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def is_cacheable(datasource, query_obj):
+    """Whether the results of ``query_obj`` can be cached incrementally"""
+    if datasource.type != 'table':
+        return False
+    if not query_obj.get('is_timeseries') or not query_obj.get('granularity'):
+        return False
+    if not query_obj.get('from_dttm') or not query_obj.get('to_dttm'):
+        return False
+    if query_obj.get('groupby') and query_obj.get('timeseries_limit'):
+        return False
+    time_grain = (query_obj.get('extras') or {}).get('time_grain_sqla')
+    if time_grain:
+        grain = datasource.database.grains_dict().get(time_grain)
+        if not grain or grain.duration not in SUPPORTED_TIME_GRAINS:
+            return False
+    return True
+
+
+def chunk_key(base_key, start, end, end_inclusive):
+    return 'timeseries_chunk_{}_{}_{}{}'.format(
+        base_key, start.isoformat(), end.isoformat(),
+        '_inclusive' if end_inclusive else '')
+
+
+def get_chunk_query_obj(query_obj, start, end, end_inclusive):
+    chunk_query_obj = dict(query_obj)
+    extras = dict(query_obj.get('extras') or {})
+    if not end_inclusive:
+        extras['time_range_endpoints'] = ['inclusive', 'exclusive']
+    chunk_query_obj.update({
+        'from_dttm': start,
+        'to_dttm': end,
+        'inner_from_dttm': start,
+        'inner_to_dttm': end,
+        'extras': extras,
+        'prequeries': [],
+        'is_prequery': False,
+    })
+    return chunk_query_obj
+
+
+def split_df(df, chunks, timestamp_format=None):
+    """Splits ``df`` by the chunk its timestamps fall in, returns None
+    when they can't be compared to the chunk bounds"""
+    try:
+        if timestamp_format in ('epoch_s', 'epoch_ms'):
+            timestamps = df[DTTM_ALIAS].apply(pd.Timestamp)
+        else:
+            timestamps = pd.to_datetime(
+                df[DTTM_ALIAS], utc=False, format=timestamp_format)
+        starts = pd.Series([pd.Timestamp(start) for start, _ in chunks])
+        positions = starts.searchsorted(timestamps, side='right') - 1
+    except Exception as e:
+        logging.warning('Could not split the results by day: {}'.format(e))
+        return None
+    positions = positions.clip(0)
+    return [
+        df[positions == i].reset_index(drop=True) for i in range(len(chunks))]
+
+
+def get_runs(indexes):
+    """Groups sorted indexes into runs of consecutive ones"""
+    runs = []
+    for i in indexes:
+        if runs and runs[-1][-1] == i - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    return runs
+
+
+def query(datasource, query_obj, cache, cache_timeout=None, settle_time=0,
+          timestamp_format=None, force=False, now=None):
+    """Runs ``query_obj`` against ``datasource`` one day at a time, reusing
+    the days in ``cache``
+
+    Returns a ``QueryResult`` or None when the stitched results may differ
+    from those of the whole query, which should then be run instead.
+    """
+    from_dttm = query_obj['from_dttm']
+    to_dttm = query_obj['to_dttm']
+    chunks = get_chunks(from_dttm, to_dttm)
+    if not chunks:
+        return None
+    base_key = query_fingerprint(query_obj, datasource.uid)
+    keys = [
+        chunk_key(base_key, start, end, end == to_dttm)
+        for start, end in chunks
+    ]
+    settled_before = (now or datetime.now()) - timedelta(seconds=settle_time)
+
+    dfs = [None] * len(chunks)
+    if not force:
+        dfs = list(cache.get_many(*keys))
+    missing = [
+        i for i, (_, end) in enumerate(chunks)
+        if dfs[i] is None or end > settled_before
+    ]
+    row_limit = query_obj.get('row_limit')
+    queries = []
+    duration = timedelta(0)
+    for run in get_runs(missing):
+        start = chunks[run[0]][0]
+        end = chunks[run[-1]][1]
+        result = datasource.query(
+            get_chunk_query_obj(query_obj, start, end, end == to_dttm),
+            force=force)
+        queries.append(result.query)
+        duration += result.duration or timedelta(0)
+        if result.status == QueryStatus.FAILED or result.df is None:
+            return result
+        df = result.df
+        if row_limit and len(df) >= row_limit:
+            # the rows that made the cut depend on the time range
+            return None
+        if len(run) == 1:
+            run_dfs = [df]
+        else:
+            run_dfs = split_df(df, chunks[run[0]:run[-1] + 1], timestamp_format)
+        if run_dfs is None:
+            # the results are used as they are but not cached
+            for i in run:
+                dfs[i] = None
+            dfs[run[0]] = df
+            continue
+        for i, chunk_df in zip(run, run_dfs):
+            dfs[i] = chunk_df
+            if chunks[i][1] <= settled_before:
+                cache.set(keys[i], chunk_df, timeout=cache_timeout)
+
+    dfs = [df for df in dfs if df is not None]
+    df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+    if row_limit and len(df) > row_limit:
+        return None
+    logging.info('Served {} of {} days from the timeseries cache'.format(
+        len(chunks) - len(missing), len(chunks)))
+    return QueryResult(
+        df=df,
+        query=';\n\n'.join(queries) or '-- served from the timeseries cache',
+        duration=duration,
+        status=QueryStatus.SUCCESS,
+    )
@@ -1,10 +1,13 @@
 # pylint: disable=C,R,W
 from datetime import datetime
 import functools
+import itertools
 import logging
 import traceback
 
-from flask import abort, flash, g, get_flashed_messages, redirect, Response
+from flask import (
+    abort, flash, g, get_flashed_messages, redirect, Response, stream_with_context,
+)
 from flask_appbuilder import BaseView, ModelView
 from flask_appbuilder.actions import action
 from flask_appbuilder.models.sqla.filters import BaseFilter
@@ -306,6 +309,30 @@ class CsvResponse(Response):
     charset = conf.get('CSV_EXPORT').get('encoding', 'utf-8')
 
 
+def csv_stream_response(
+        csv_chunks, filename=None, gzip=False, mimetype='application/csv'):
+    """Streams CSV chunks to the client, optionally gzipped on the fly
+
+    The first chunk is rendered before the response is returned so that
+    errors running the query surface as a regular error response instead
+    of a truncated download.
+    """
+    csv_chunks = iter(csv_chunks)
+    first_chunk = next(csv_chunks, '')
+    csv_chunks = stream_with_context(itertools.chain([first_chunk], csv_chunks))
+    if gzip:
+        return Response(
+            utils.gzip_chunks(csv_chunks, CsvResponse.charset),
+            status=200,
+            headers=generate_download_headers('csv.gz', filename),
+            mimetype='application/gzip')
+    return CsvResponse(
+        csv_chunks,
+        status=200,
+        headers=generate_download_headers('csv', filename),
+        mimetype=mimetype)
+
+
 def check_ownership(obj, raise_if_false=True):
     """Meant to be used in `pre_update` hooks on models to enforce ownership
 
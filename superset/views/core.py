@@ -6,11 +6,13 @@ import os
 import re
 import time
 import traceback
+import uuid
 from flask import session
 from urllib import parse
 
 from flask import (
-    abort, flash, g, Markup, redirect, render_template, request, Response, url_for,
+    abort, flash, g, Markup, redirect, render_template, request, Response,
+    stream_with_context, url_for,
 )
 from flask_appbuilder import expose, SimpleFormView
 from flask_appbuilder.actions import action
@@ -18,12 +20,12 @@ from flask_appbuilder.models.sqla.interface import SQLAInterface
 from flask_appbuilder.security.decorators import has_access, has_access_api
 from flask_babel import gettext as __
 from flask_babel import lazy_gettext as _
-import pandas as pd
 import simplejson as json
 import sqlalchemy as sqla
-from sqlalchemy import and_, create_engine, MetaData, or_, update
+from sqlalchemy import create_engine, MetaData, or_
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import subqueryload
 from unidecode import unidecode
 from werkzeug.routing import BaseConverter
 from werkzeug.utils import secure_filename
@@ -38,15 +40,19 @@ from superset.forms import CsvToDatabaseForm
 from superset.jinja_context import get_template_processor
 from superset.legacy import cast_form_data, update_time_range
 import superset.models.core as models
+from superset.models.csv_upload import CsvUpload
 from superset.models.sql_lab import Query
 from superset.models.user_attributes import UserAttribute
 from superset.sql_parse import SupersetQuery
 from superset.utils import core as utils
 from superset.utils import dashboard_import_export
+from superset.utils.query_channel import get_query_channel, publish_query
+from superset.utils.results_serialization import deserialize_results
 from .base import (
     api, BaseSupersetView,
     check_ownership,
-    CsvResponse, data_payload_response, DeleteMixin, generate_download_headers,
+    csv_stream_response, data_payload_response, DeleteMixin,
+    generate_download_headers,
     get_error_msg, handle_api_exception, json_error_response, json_success,
     SupersetFilter, SupersetModelView, YamlExportMixin,
 )
@@ -212,7 +218,13 @@ class DatabaseView(SupersetModelView, DeleteMixin, YamlExportMixin):  # noqa
             'Specify it as **"schemas_allowed_for_csv_upload": '
             '["public", "csv_upload"]**. '
             'If database flavor does not support schema or any schema is allowed '
-            'to be accessed, just leave the list empty', True),
+            'to be accessed, just leave the list empty.<br/>'
+            '4. The ``connection_pool`` object overrides the '
+            '``DEFAULT_DB_CONNECTION_POOL`` settings of the pool of '
+            'connections kept for each schema and user, for instance '
+            '**"connection_pool": {"pool_size": 10, "pool_pre_ping": true}**. '
+            'Set **"enabled": false** to open a new connection for every query.',
+            True),
         'impersonate_user': _(
             'If Presto, all the queries in SQL Lab are going to be executed as the '
             'currently logged on user who must have permission to run them.<br/>'
@@ -348,6 +360,9 @@ class CsvToDatabaseView(SimpleFormView):
             flash(message, 'danger')
             return redirect('/csvtodatabaseview/form')
 
+        if config.get('CSV_UPLOAD_ASYNC'):
+            return self.stage_csv(form)
+
         csv_file = form.csv_file.data
         form.csv_file.data.filename = secure_filename(form.csv_file.data.filename)
         csv_filename = form.csv_file.data.filename
@@ -383,6 +398,47 @@ class CsvToDatabaseView(SimpleFormView):
         stats_logger.incr('successful_csv_upload')
         return redirect('/tablemodelview/list/')
 
+    def stage_csv(self, form):
+        """Saves the file in ``UPLOAD_FOLDER`` and leaves the creation of
+        the table to a Celery worker"""
+        from superset.tasks.csv_upload import get_form_values, ingest_csv
+        csv_filename = secure_filename(form.csv_file.data.filename)
+        # the staged files of concurrent uploads must not collide
+        staged_filename = '{}_{}'.format(uuid.uuid4().hex, csv_filename)
+        path = os.path.join(config['UPLOAD_FOLDER'], staged_filename)
+        try:
+            utils.ensure_path_exists(config['UPLOAD_FOLDER'])
+            form.csv_file.data.save(path)
+            upload = CsvUpload(
+                database_id=form.con.data.id,
+                table_name=form.name.data,
+                schema=form.schema.data,
+                filename=staged_filename,
+                status=utils.QueryStatus.PENDING,
+            )
+            db.session.add(upload)
+            db.session.commit()
+            ingest_csv.delay(
+                upload.id, get_form_values(form), g.user.username)
+        except Exception as e:
+            logging.exception(e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            flash(utils.error_msg_from_exception(e), 'danger')
+            stats_logger.incr('failed_csv_upload')
+            return redirect('/csvtodatabaseview/form')
+
+        message = _(
+            'CSV file "{0}" is being uploaded to table "{1}", its progress '
+            'is reported at {2}'.format(
+                csv_filename,
+                form.name.data,
+                '/superset/csv_upload_status/{}/'.format(upload.id)))
+        flash(message, 'info')
+        return redirect('/tablemodelview/list/')
+
     def is_schema_allowed(self, database, schema):
         if not database.allow_csv_upload:
             return False
@@ -1090,7 +1146,11 @@ class Superset(BaseSupersetView):
 
         if query_obj and query_obj['prequeries']:
             query_obj['prequeries'].append(query)
-            query = ';\n\n'.join(query_obj['prequeries'])
+            query = ';\n\n'.join(
+                viz_obj.datasource.format_query_str(q)
+                for q in query_obj['prequeries'])
+        elif query:
+            query = viz_obj.datasource.format_query_str(query)
         if query:
             query += ';'
         else:
@@ -1125,11 +1185,9 @@ class Superset(BaseSupersetView):
         security_manager.assert_datasource_permission(viz_obj.datasource, g.user)
 
         if csv:
-            return CsvResponse(
-                viz_obj.get_csv(),
-                status=200,
-                headers=generate_download_headers('csv'),
-                mimetype='application/csv')
+            return csv_stream_response(
+                viz_obj.get_csv_chunks(),
+                gzip=request.args.get('gzip') == 'true')
 
         if query:
             return self.get_query_string_response(viz_obj)
@@ -1212,6 +1270,144 @@ class Superset(BaseSupersetView):
             samples=samples,
         )
 
+    def get_batch_form_data(self, dashboard_id=None):
+        """Returns the list of form_data of the charts requested in a batch
+
+        Either all the charts of a dashboard, with the ``form_data`` of the
+        request applied on top of each of them (extra filters for instance),
+        or the list of form_data posted. Form data holding only a
+        ``slice_id`` are completed with the saved chart's params.
+        """
+        request_data = request.form.get('form_data') or request.args.get('form_data')
+        request_data = json.loads(request_data) if request_data else None
+        session = db.session()
+        if dashboard_id is not None:
+            qry = session.query(models.Dashboard)
+            if dashboard_id.isdigit():
+                qry = qry.filter_by(id=int(dashboard_id))
+            else:
+                qry = qry.filter_by(slug=dashboard_id)
+            dash = qry.one_or_none()
+            if not dash:
+                abort(404)
+            overrides = request_data if isinstance(request_data, dict) else {}
+            form_datas = []
+            for slc in dash.slices:
+                form_data = slc.form_data.copy()
+                form_data.update(overrides)
+                form_datas.append(form_data)
+        else:
+            form_datas = request_data if isinstance(request_data, list) else []
+            slice_ids = [
+                fd['slice_id'] for fd in form_datas
+                if fd.get('slice_id') and set(fd) == {'slice_id'}]
+            slices = {}
+            if slice_ids:
+                slices = {
+                    slc.id: slc for slc in
+                    session.query(models.Slice)
+                    .filter(models.Slice.id.in_(slice_ids))
+                }
+            form_datas = [
+                slices[fd['slice_id']].form_data.copy()
+                if fd.get('slice_id') in slices and set(fd) == {'slice_id'}
+                else fd
+                for fd in form_datas
+            ]
+        for form_data in form_datas:
+            update_time_range(form_data)
+        return form_datas
+
+    def get_batch_viz_objs(self, form_datas, force=False):
+        """Builds the viz objects for a batch of form_data
+
+        Datasources are only resolved and checked for access once. Returns
+        the list of viz objects, ``None`` for the charts that can't be
+        built, and a dict of error payloads keyed by index.
+        """
+        datasources = {}
+        viz_objs = []
+        errors = {}
+        for i, form_data in enumerate(form_datas):
+            viz_obj = None
+            try:
+                datasource_id, datasource_type = self.datasource_info(
+                    None, None, form_data)
+                key = (datasource_type, datasource_id)
+                if key not in datasources:
+                    try:
+                        datasource = ConnectorRegistry.get_datasource(
+                            datasource_type, datasource_id, db.session)
+                        security_manager.assert_datasource_permission(
+                            datasource, g.user)
+                        datasources[key] = datasource
+                    except Exception as e:
+                        datasources[key] = e
+                if isinstance(datasources[key], Exception):
+                    raise datasources[key]
+                viz_obj = viz.viz_types[form_data.get('viz_type', 'table')](
+                    datasources[key],
+                    form_data=form_data,
+                    force=force,
+                )
+            except Exception as e:
+                logging.exception(e)
+                errors[i] = {
+                    'error': utils.error_msg_from_exception(e),
+                    'form_data': form_data,
+                    'status': QueryStatus.FAILED,
+                }
+            viz_objs.append(viz_obj)
+        return viz_objs, errors
+
+    @log_this
+    @api
+    @has_access_api
+    @handle_api_exception
+    @expose('/explore_json_batch/<dashboard_id>/', methods=['GET', 'POST'])
+    @expose('/explore_json_batch/', methods=['GET', 'POST'])
+    def explore_json_batch(self, dashboard_id=None):
+        """Returns the payloads of many charts at once
+
+        Takes either a dashboard id or slug, or a list of form_data posted
+        as ``form_data``. Permissions are checked once per datasource, the
+        cache is queried for all the charts in one round trip and the charts
+        not in cache are computed concurrently.
+
+        The payloads are returned as a JSON list in the order of the
+        request, or streamed as newline delimited JSON as soon as each one
+        is ready when ``ndjson=true``. Each payload carries the ``index``
+        of its chart in the request.
+        """
+        force = request.args.get('force') == 'true'
+        ndjson = request.args.get('ndjson') == 'true'
+        form_datas = self.get_batch_form_data(dashboard_id)
+        viz_objs, errors = self.get_batch_viz_objs(form_datas, force=force)
+
+        def iter_payloads():
+            for i, payload in errors.items():
+                payload['index'] = i
+                yield i, json.dumps(
+                    payload, default=utils.json_iso_dttm_ser, ignore_nan=True)
+            indexes = [i for i, viz_obj in enumerate(viz_objs) if viz_obj]
+            payloads = viz.get_viz_payloads([viz_objs[i] for i in indexes])
+            for j, payload in payloads:
+                i = indexes[j]
+                payload['index'] = i
+                yield i, viz_objs[i].json_dumps(payload)
+
+        if ndjson:
+            return Response(
+                stream_with_context(
+                    payload_json + '\n' for _, payload_json in iter_payloads()),
+                status=200,
+                mimetype='application/x-ndjson')
+
+        payloads = [None] * len(form_datas)
+        for i, payload_json in iter_payloads():
+            payloads[i] = payload_json
+        return json_success('[{}]'.format(','.join(payloads)))
+
     @log_this
     @has_access
     @expose('/import_dashboards', methods=['GET', 'POST'])
@@ -1331,7 +1527,7 @@ class Superset(BaseSupersetView):
             'can_add': slice_add_perm,
             'can_download': slice_download_perm,
             'can_overwrite': slice_overwrite_perm,
-            'datasource': datasource.data,
+            'datasource': json.RawJSON(datasource.data_json),
             'form_data': form_data,
             'datasource_id': datasource_id,
             'datasource_type': datasource_type,
@@ -1527,6 +1723,7 @@ class Superset(BaseSupersetView):
         """Endpoint to fetch the list of tables for given database"""
         db_id = int(db_id)
         force_refresh = force_refresh.lower() == 'true'
+        partial = False
         schema = utils.js_string_to_python(schema)
         substr = utils.js_string_to_python(substr)
         database = db.session.query(models.Database).filter_by(id=db_id).one()
@@ -1541,10 +1738,11 @@ class Superset(BaseSupersetView):
                 cache=database.table_cache_enabled,
                 cache_timeout=database.table_cache_timeout)
         else:
-            table_names = database.all_table_names_in_database(
-                cache=True, force=False, cache_timeout=24 * 60 * 60)
-            view_names = database.all_view_names_in_database(
-                cache=True, force=False, cache_timeout=24 * 60 * 60)
+            table_names, tables_complete = database.all_result_sets_in_database(
+                'table', cache_timeout=24 * 60 * 60)
+            view_names, views_complete = database.all_result_sets_in_database(
+                'view', cache_timeout=24 * 60 * 60)
+            partial = not (tables_complete and views_complete)
         table_names = security_manager.accessible_by_user(database, table_names, schema)
         view_names = security_manager.accessible_by_user(database, view_names, schema)
 
@@ -1567,6 +1765,7 @@ class Superset(BaseSupersetView):
         payload = {
             'tableLength': len(table_names) + len(view_names),
             'options': table_options,
+            'partial': partial,
         }
         return json_success(json.dumps(payload))
 
@@ -2019,9 +2218,11 @@ class Superset(BaseSupersetView):
     def warm_up_cache(self):
         """Warms up the cache for the slice or table.
 
-        Note for slices a force refresh occurs.
+        Note for slices a force refresh occurs. The charts are warmed up
+        concurrently, the timing and error of each of them is returned.
+        With ``async=true`` the work is handed to a Celery worker instead.
         """
-        slices = None
+        from superset.tasks import cache as cache_tasks
         session = db.session()
         slice_id = request.args.get('slice_id')
         table_name = request.args.get('table_name')
@@ -2032,36 +2233,30 @@ class Superset(BaseSupersetView):
                 'Malformed request. slice_id or table_name and db_name '
                 'arguments are expected'), status=400)
         if slice_id:
-            slices = session.query(models.Slice).filter_by(id=slice_id).all()
-            if not slices:
+            strategy_name = cache_tasks.SliceStrategy.name
+            kwargs = {'slice_ids': [slice_id]}
+            slice_ids = cache_tasks.SliceStrategy(**kwargs).get_slice_ids(session)
+            if not slice_ids:
                 return json_error_response(__(
                     'Chart %(id)s not found', id=slice_id), status=404)
-        elif table_name and db_name:
-            SqlaTable = ConnectorRegistry.sources['table']
-            table = (
-                session.query(SqlaTable)
-                .join(models.Database)
-                .filter(
-                    models.Database.database_name == db_name or
-                    SqlaTable.table_name == table_name)
-            ).first()
-            if not table:
+        else:
+            strategy_name = cache_tasks.DatasourceStrategy.name
+            kwargs = {'table_name': table_name, 'db_name': db_name}
+            strategy = cache_tasks.DatasourceStrategy(**kwargs)
+            if not strategy.get_datasource_id(session):
                 return json_error_response(__(
                     "Table %(t)s wasn't found in the database %(d)s",
-                    t=table_name, s=db_name), status=404)
-            slices = session.query(models.Slice).filter_by(
-                datasource_id=table.id,
-                datasource_type=table.type).all()
+                    t=table_name, d=db_name), status=404)
+            # a table without charts has nothing to warm up
+            slice_ids = strategy.get_slice_ids(session)
 
-        for slc in slices:
-            try:
-                obj = slc.get_viz(force=True)
-                obj.get_json()
-            except Exception as e:
-                return json_error_response(utils.error_msg_from_exception(e))
-        return json_success(json.dumps(
-            [{'slice_id': slc.id, 'slice_name': slc.slice_name}
-             for slc in slices]))
+        if request.args.get('async') == 'true':
+            cache_tasks.warm_up_cache.delay(strategy_name, **kwargs)
+            return json_success(
+                json.dumps([{'slice_id': i} for i in slice_ids]), status=202)
+
+        results = cache_tasks.warm_up_slices(slice_ids)
+        return json_success(json.dumps(results))
 
     @expose('/favstar/<class_name>/<obj_id>/<action>/')
     def favstar(self, class_name, obj_id, action):
@@ -2096,7 +2291,10 @@ class Superset(BaseSupersetView):
     def dashboard(self, dashboard_id):
         """Server side rendering for a dashboard"""
         session = db.session()
-        qry = session.query(models.Dashboard)
+        qry = (
+            session.query(models.Dashboard)
+            .options(subqueryload(models.Dashboard.slices))
+        )
         if dashboard_id.isdigit():
             qry = qry.filter_by(id=int(dashboard_id))
         else:
@@ -2105,11 +2303,7 @@ class Superset(BaseSupersetView):
         dash = qry.one_or_none()
         if not dash:
             abort(404)
-        datasources = set()
-        for slc in dash.slices:
-            datasource = slc.datasource
-            if datasource:
-                datasources.add(datasource)
+        datasources = dash.datasources
 
         if config.get('ENABLE_ACCESS_REQUEST'):
             for datasource in datasources:
@@ -2152,7 +2346,8 @@ class Superset(BaseSupersetView):
         bootstrap_data = {
             'user_id': g.user.get_id(),
             'dashboard_data': dashboard_data,
-            'datasources': {ds.uid: ds.data for ds in datasources},
+            'datasources': {
+                ds.uid: json.RawJSON(ds.data_json) for ds in datasources},
             'common': self.common_bootsrap_payload(),
             'editMode': edit_mode,
         }
@@ -2408,14 +2603,11 @@ class Superset(BaseSupersetView):
             return json_error_response(security_manager.get_table_access_error_msg(
                 '{}'.format(rejected_tables)), status=403)
 
-        payload = utils.zlib_decompress_to_string(blob)
+        results = deserialize_results(blob)
         display_limit = app.config.get('DEFAULT_SQLLAB_LIMIT', None)
-        if display_limit:
-            payload_json = json.loads(payload)
-            payload_json['data'] = payload_json['data'][:display_limit]
         return json_success(
             json.dumps(
-                payload_json,
+                results.to_dict(limit=display_limit),
                 default=utils.json_iso_dttm_ser,
                 ignore_nan=True,
             ),
@@ -2433,6 +2625,10 @@ class Superset(BaseSupersetView):
             )
             query.status = QueryStatus.STOPPED
             db.session.commit()
+            channel = get_query_channel()
+            if channel:
+                channel.cancel(query.id)
+                publish_query(query, channel)
         except Exception:
             pass
         return self.json_response('OK')
@@ -2593,25 +2789,23 @@ class Superset(BaseSupersetView):
                 'Fetching CSV from results backend '
                 '[{}]'.format(query.results_key))
             blob = results_backend.get(query.results_key)
+        chunk_size = config.get('CSV_STREAMING_CHUNK_SIZE')
         if blob:
             logging.info('Decompressing')
-            json_payload = utils.zlib_decompress_to_string(blob)
-            obj = json.loads(json_payload)
-            columns = [c['name'] for c in obj['columns']]
-            df = pd.DataFrame.from_records(obj['data'], columns=columns)
-            logging.info('Using pandas to convert to CSV')
-            csv = df.to_csv(index=False, **config.get('CSV_EXPORT'))
+            df_chunks = deserialize_results(blob).iter_dataframes(chunk_size)
         else:
             logging.info('Running a query to turn into CSV')
             sql = query.select_sql or query.executed_sql
-            df = query.database.get_df(sql, query.schema)
-            # TODO(bkyryliuk): add compression=gzip for big files.
-            csv = df.to_csv(index=False, **config.get('CSV_EXPORT'))
-        response = Response(csv, mimetype='text/csv')
-        response.headers['Content-Disposition'] = (
-            'attachment; filename={}.csv'.format(unidecode(query.name)))
-        logging.info('Ready to return response')
-        return response
+            df_chunks = query.database.get_df_chunks(
+                sql, query.schema, chunk_size)
+        logging.info('Streaming CSV')
+        csv_chunks = utils.df_chunks_to_csv(
+            df_chunks, index=False, **config.get('CSV_EXPORT'))
+        return csv_stream_response(
+            csv_chunks,
+            filename=unidecode(query.name),
+            gzip=request.args.get('gzip') == 'true',
+            mimetype='text/csv')
 
     @api
     @handle_api_exception
@@ -2629,7 +2823,20 @@ class Superset(BaseSupersetView):
 
         # Check permission for datasource
         security_manager.assert_datasource_permission(datasource)
-        return json_success(json.dumps(datasource.data))
+        return json_success(datasource.data_json)
+
+    @api
+    @handle_api_exception
+    @has_access_api
+    @expose('/csv_upload_status/<upload_id>/')
+    def csv_upload_status(self, upload_id):
+        """Progress of a CSV file ingested in the background"""
+        upload = db.session.query(CsvUpload).filter_by(id=int(upload_id)).first()
+        if not upload:
+            return json_error_response(
+                'CSV upload {} not found'.format(upload_id), status=404)
+        check_ownership(upload)
+        return json_success(json.dumps(upload.to_dict()))
 
     @expose('/queries/<last_updated_ms>')
     def queries(self, last_updated_ms):
@@ -2673,19 +2880,58 @@ class Superset(BaseSupersetView):
         ]
 
         if queries_to_timeout:
-            update(Query).where(
-                and_(
+            (
+                db.session.query(Query)
+                .filter(
                     Query.user_id == g.user.get_id(),
-                    Query.client_id in queries_to_timeout,
-                ),
-            ).values(state=QueryStatus.TIMED_OUT)
+                    Query.client_id.in_(queries_to_timeout),
+                )
+                .update(
+                    {Query.status: QueryStatus.TIMED_OUT},
+                    synchronize_session=False)
+            )
+            db.session.commit()
 
+            channel = get_query_channel()
             for client_id in queries_to_timeout:
-                dict_queries[client_id]['status'] = QueryStatus.TIMED_OUT
+                dict_queries[client_id]['state'] = QueryStatus.TIMED_OUT
+                if channel:
+                    # the workers stop the queries they're still running
+                    channel.cancel(dict_queries[client_id]['serverId'])
 
         return json_success(
             json.dumps(dict_queries, default=utils.json_int_dttm_ser))
 
+    @expose('/query_updates/')
+    def query_updates(self):
+        """Long polls the status updates of the queries of the current user
+
+        Updates are read from the query channel fed by the workers, the
+        metadata database is never queried. The ``seq`` argument is the
+        number of the last update seen by the client, the response holds
+        the queries updated since then keyed by client id, and the number to
+        pass on the next call. ``resync`` tells the client that updates may
+        have been missed and that it should fall back on ``/queries/`` once.
+        """
+        user_id = g.user.get_id()
+        if not user_id:
+            return json_error_response(
+                'Please login to access the queries.', status=403)
+        channel = get_query_channel()
+        if channel is None:
+            return json_error_response(
+                'The query channel is not configured', status=404)
+        stats_logger.incr('query_updates')
+        seq = request.args.get('seq')
+        seq = int(seq) if seq else None
+        wait = min(
+            float(request.args.get('wait') or 0),
+            config.get('SQLLAB_QUERY_UPDATES_MAX_WAIT'))
+        seq, queries, complete = channel.wait_for_updates(user_id, seq, wait)
+        return json_success(json.dumps(
+            {'seq': seq, 'queries': queries, 'resync': not complete},
+            default=utils.json_int_dttm_ser))
+
     @has_access
     @expose('/search_queries')
     @log_this
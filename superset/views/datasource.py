@@ -30,9 +30,10 @@ class Datasource(BaseSupersetView):
                 status='401',
             )
         orm_datasource.update_from_object(datasource)
-        data = orm_datasource.data
+        # the payload reflects the committed datasource, as read from the
+        # shared index of its new version
         db.session.commit()
-        return self.json_response(data)
+        return self.json_response(orm_datasource.data)
 
     @expose('/external_metadata/<datasource_type>/<datasource_id>/')
     def external_metadata(self, datasource_type=None, datasource_id=None):
@@ -7,19 +7,20 @@ Superset can render.
 from collections import defaultdict, OrderedDict
 import copy
 from datetime import datetime, timedelta
+import functools
 from functools import reduce
-import hashlib
 import inspect
-from itertools import product
+from itertools import chain, product
 import logging
 import math
 import pickle as pkl
 import re
+import time
 import traceback
 import uuid
 
 from dateutil import relativedelta as rdelta
-from flask import request
+from flask import g, request
 from flask_babel import lazy_gettext as _
 import geohash
 from geopy.point import Point
@@ -35,6 +36,11 @@ from bs4 import BeautifulSoup
 from superset import app, cache, get_css_manifest_files
 from superset.exceptions import NullValueException, SpatialException
 from superset.utils import core as utils
+from superset.utils import query_fingerprint, timeseries_cache
+from superset.utils.cache import get_cache_lock
+from superset.utils.concurrency import (
+    concurrency_limit, iter_concurrently, run_concurrently,
+)
 from superset.utils.core import (
     DTTM_ALIAS,
     JS_MAX_INTEGER,
@@ -63,6 +69,9 @@ class BaseViz(object):
     default_fillna = 0
     cache_type = 'df'
     enforce_numerical_metrics = True
+    # whether the results can be cached one day at a time, see
+    # TIMESERIES_INCREMENTAL_CACHE
+    incremental_cache = False
 
     def __init__(self, datasource, form_data, force=False):
         if not datasource:
@@ -92,6 +101,8 @@ class BaseViz(object):
         self._any_cache_key = None
         self._any_cached_dttm = None
         self._extra_chart_data = []
+        # cache values fetched ahead of time by ``get_viz_payloads``
+        self._prefetched_cache = {}
 
         self.process_metrics()
 
@@ -176,7 +187,7 @@ class BaseViz(object):
         """Returns a dict or scalar that can be passed to DataFrame.fillna"""
         if columns is None:
             return self.default_fillna
-        columns_dict = {col.column_name: col for col in self.datasource.columns}
+        columns_dict = self.datasource.index.columns
         fillna = {
             c: self.get_fillna_for_col(columns_dict.get(c))
             for c in columns
@@ -203,19 +214,47 @@ class BaseViz(object):
 
         self.error_msg = ''
 
-        timestamp_format = None
-        if self.datasource.type == 'table':
-            dttm_col = self.datasource.get_col(query_obj['granularity'])
-            if dttm_col:
-                timestamp_format = dttm_col.python_date_format
+        timestamp_format = self.get_timestamp_format(query_obj)
 
         # The datasource here can be different backend but the interface is common
-        self.results = self.datasource.query(query_obj)
+        with concurrency_limit(
+                self.datasource.connection,
+                config.get('MAX_CONCURRENT_QUERIES_PER_DATABASE')):
+            self.results = self.query_datasource(query_obj, timestamp_format)
         self.query = self.results.query
         self.status = self.results.status
         self.error_message = self.results.error_message
 
-        df = self.results.df
+        return self.process_df(self.results.df, timestamp_format)
+
+    def query_datasource(self, query_obj, timestamp_format=None):
+        """Runs the query, through the incremental cache when possible"""
+        if (
+                self.incremental_cache and
+                cache and
+                config.get('TIMESERIES_INCREMENTAL_CACHE') and
+                timeseries_cache.is_cacheable(self.datasource, query_obj)):
+            results = timeseries_cache.query(
+                self.datasource,
+                query_obj,
+                cache,
+                cache_timeout=self.cache_timeout,
+                settle_time=config.get('TIMESERIES_INCREMENTAL_CACHE_SETTLE_TIME'),
+                timestamp_format=timestamp_format,
+                force=self.force,
+            )
+            if results is not None:
+                return results
+        return self.datasource.query(query_obj, force=self.force)
+
+    def get_timestamp_format(self, query_obj):
+        if self.datasource.type == 'table':
+            dttm_col = self.datasource.get_col(query_obj['granularity'])
+            if dttm_col:
+                return dttm_col.python_date_format
+
+    def process_df(self, df, timestamp_format=None):
+        """Normalizes a DataFrame as returned by the datasource"""
         # Transform the timestamp we received from database to pandas supported
         # datetime format. If no python_date_format is specified, the pattern will
         # be considered as the default ISO date format
@@ -340,8 +379,8 @@ class BaseViz(object):
 
     def cache_key(self, query_obj, **extra):
         """
-        The cache key is made out of the key/values in `query_obj`, plus any
-        other key/values in `extra`.
+        The cache key is a fingerprint of the normalized `query_obj`, plus
+        any other key/values in `extra`.
 
         We remove datetime bounds that are hard values, and replace them with
         the use-provided inputs to bounds, which may be time-relative (as in
@@ -351,16 +390,14 @@ class BaseViz(object):
         different time shifts wil differ only in the `from_dttm` and `to_dttm`
         values which are stripped.
         """
-        cache_dict = copy.copy(query_obj)
-        cache_dict.update(extra)
-
-        for k in ['from_dttm', 'to_dttm']:
-            del cache_dict[k]
-
-        cache_dict['time_range'] = self.form_data.get('time_range')
-        cache_dict['datasource'] = self.datasource.uid
-        json_data = self.json_dumps(cache_dict, sort_keys=True)
-        return hashlib.md5(json_data.encode('utf-8')).hexdigest()
+        time_range = query_fingerprint.normalize_time_range(
+            self.form_data.get('time_range'),
+            self.form_data.get('since'),
+            self.form_data.get('until'),
+            self.form_data.get('time_shift'),
+        )
+        return query_fingerprint.query_fingerprint(
+            query_obj, self.datasource.uid, time_range, **extra)
 
     def get_payload(self, query_obj=None):
         """Returns a payload of metadata and data"""
@@ -384,27 +421,131 @@ class BaseViz(object):
         cache_key = self.cache_key(query_obj, **kwargs) if query_obj else None
         logging.info('Cache key: {}'.format(cache_key))
         is_loaded = False
-        stacktrace = None
         df = None
         cached_dttm = datetime.utcnow().isoformat().split('.')[0]
         if cache_key and cache and not self.force:
-            cache_value = cache.get(cache_key)
-            if cache_value:
-                stats_logger.incr('loaded_from_cache')
-                try:
-                    cache_value = pkl.loads(cache_value)
-                    df = cache_value['df']
-                    self.query = cache_value['query']
-                    self._any_cached_dttm = cache_value['dttm']
-                    self._any_cache_key = cache_key
-                    self.status = utils.QueryStatus.SUCCESS
-                    is_loaded = True
-                except Exception as e:
-                    logging.exception(e)
-                    logging.error('Error reading cache: ' +
-                                  utils.error_msg_from_exception(e))
-                logging.info('Serving from cache')
+            if cache_key in self._prefetched_cache:
+                cache_value = self._prefetched_cache.pop(cache_key)
+            else:
+                cache_value = cache.get(cache_key)
+            df, is_loaded = self.load_cache_value(cache_key, cache_value)
+
+        lock = None
+        wait_timeout = config.get('CACHE_SINGLE_FLIGHT_WAIT_TIMEOUT')
+        if (
+                query_obj and
+                not is_loaded and
+                cache_key and
+                cache and
+                not self.force and
+                wait_timeout):
+            # only one worker runs a given query, the others poll the cache
+            # for its results, or run it themselves if it takes too long
+            lock = get_cache_lock(
+                cache, cache_key, config.get('CACHE_SINGLE_FLIGHT_LOCK_TIMEOUT'))
+            df, is_loaded, lock = self.wait_for_cache(cache_key, lock, wait_timeout)
+
+        try:
+            df, is_loaded, stacktrace = self.load_df(
+                query_obj, cache_key, cached_dttm, df, is_loaded)
+        finally:
+            if lock:
+                lock.release()
+        return {
+            'cache_key': self._any_cache_key,
+            'cached_dttm': self._any_cached_dttm,
+            'cache_timeout': self.cache_timeout,
+            'df': df,
+            'error': self.error_message,
+            'form_data': self.form_data,
+            'is_cached': self._any_cache_key is not None,
+            'query': self.query,
+            'status': self.status,
+            'stacktrace': stacktrace,
+            'rowcount': len(df.index) if df is not None else 0,
+        }
+
+    def wait_for_cache(self, cache_key, lock, wait_timeout):
+        """Takes ``lock`` or waits for its holder to cache ``cache_key``
+
+        The cache is polled every ``CACHE_SINGLE_FLIGHT_POLL_INTERVAL``
+        seconds without holding anything, so that the waiters all get the
+        results as soon as they are cached. Returns the DataFrame, whether
+        it was loaded from cache and the lock if it was taken, in which case
+        the caller runs the query and releases it.
+        """
+        poll_interval = config.get('CACHE_SINGLE_FLIGHT_POLL_INTERVAL')
+        deadline = time.time() + wait_timeout
+        while not lock.acquire():
+            if time.time() >= deadline:
+                stats_logger.incr('single_flight_wait_timeout')
+                return None, False, None
+            time.sleep(poll_interval)
+            df, is_loaded = self.load_cache_value(cache_key, cache.get(cache_key))
+            if is_loaded:
+                return df, is_loaded, None
+        # the previous holder may have cached the results before releasing it
+        df, is_loaded = self.load_cache_value(cache_key, cache.get(cache_key))
+        return df, is_loaded, lock
+
+    def load_cache_value(self, cache_key, cache_value):
+        """Loads a pickled payload read from the cache
+
+        Returns the DataFrame and whether it could be loaded."""
+        df = None
+        is_loaded = False
+        if cache_value:
+            stats_logger.incr('loaded_from_cache')
+            try:
+                cache_value = pkl.loads(cache_value)
+                df = cache_value['df']
+                self.query = cache_value['query']
+                self._any_cached_dttm = cache_value['dttm']
+                self._any_cache_key = cache_key
+                self.status = utils.QueryStatus.SUCCESS
+                is_loaded = True
+            except Exception as e:
+                logging.exception(e)
+                logging.error('Error reading cache: ' +
+                              utils.error_msg_from_exception(e))
+            logging.info('Serving from cache')
+            soft_expiry = cache_value.get('soft_expiry') if is_loaded else None
+            if soft_expiry and time.time() > soft_expiry:
+                stats_logger.incr('loaded_stale_from_cache')
+                self.refresh_cache(cache_key)
+        return df, is_loaded
+
+    @property
+    def stale_timeout(self):
+        """Seconds during which an expired payload is still served"""
+        if not self.cache_timeout:
+            return 0
+        return config.get('CACHE_STALE_WHILE_REVALIDATE_TIMEOUT') or 0
 
+    def refresh_cache(self, cache_key):
+        """Refreshes the cached payloads of the chart in the background
+
+        Only one refresh is scheduled per cache key while it is running.
+        """
+        from superset.tasks.cache import refresh_chart
+        if not cache.add('refresh_' + cache_key, True, timeout=self.stale_timeout):
+            return
+        user = getattr(g, 'user', None)
+        try:
+            refresh_chart.delay(
+                self.datasource.type,
+                self.datasource.id,
+                self.form_data,
+                user_name=getattr(user, 'username', None),
+            )
+        except Exception as e:
+            logging.warning('Could not schedule the refresh of {}'.format(cache_key))
+            logging.exception(e)
+            cache.delete('refresh_' + cache_key)
+
+    def load_df(self, query_obj, cache_key, cached_dttm, df, is_loaded):
+        """Runs the query unless the df was loaded from cache, and caches it"""
+        stacktrace = None
         if query_obj and not is_loaded:
             try:
                 df = self.get_df(query_obj)
@@ -429,6 +570,13 @@ class BaseViz(object):
                         df=df if df is not None else None,
                         query=self.query,
                     )
+                    timeout = self.cache_timeout
+                    if self.stale_timeout:
+                        # the payload goes stale after the cache timeout, it
+                        # is then served while being refreshed in the
+                        # background for stale_timeout seconds
+                        cache_value['soft_expiry'] = time.time() + timeout
+                        timeout += self.stale_timeout
                     cache_value = pkl.dumps(
                         cache_value, protocol=pkl.HIGHEST_PROTOCOL)
 
@@ -439,26 +587,47 @@ class BaseViz(object):
                     cache.set(
                         cache_key,
                         cache_value,
-                        timeout=self.cache_timeout)
+                        timeout=timeout)
+                    if self.stale_timeout:
+                        cache.delete('refresh_' + cache_key)
                 except Exception as e:
                     # cache.set call can fail if the backend is down or if
                     # the key is too large or whatever other reasons
                     logging.warning('Could not cache key {}'.format(cache_key))
                     logging.exception(e)
                     cache.delete(cache_key)
-        return {
-            'cache_key': self._any_cache_key,
-            'cached_dttm': self._any_cached_dttm,
-            'cache_timeout': self.cache_timeout,
-            'df': df,
-            'error': self.error_message,
-            'form_data': self.form_data,
-            'is_cached': self._any_cache_key is not None,
-            'query': self.query,
-            'status': self.status,
-            'stacktrace': stacktrace,
-            'rowcount': len(df.index) if df is not None else 0,
-        }
+        return df, is_loaded, stacktrace
+
+    def get_df_payloads(self, queries):
+        """Runs ``get_df_payload`` for a list of ``(query_obj, kwargs)``
+
+        The queries run concurrently on a pool of ``VIZ_QUERIES_MAX_WORKERS``
+        threads. Each one runs against a shallow copy of the viz object so
+        that they don't step on each other's state, pointing to a detached
+        copy of the datasource (see ``detach_datasources``). The cache
+        metadata is then merged back so that the main payload reflects
+        whether any of the queries was served from cache or failed, as when
+        they run serially.
+        """
+        if not queries:
+            return []
+        max_workers = config.get('VIZ_QUERIES_MAX_WORKERS')
+        viz_objs = [copy.copy(self) for _ in queries]
+        if not detach_datasources(viz_objs, max_workers):
+            max_workers = None
+        tasks = [
+            functools.partial(viz_obj.get_df_payload, query_obj, **kwargs)
+            for viz_obj, (query_obj, kwargs) in zip(viz_objs, queries)
+        ]
+        payloads = run_concurrently(tasks, max_workers)
+        for viz_obj in viz_objs:
+            if viz_obj._any_cache_key:
+                self._any_cache_key = viz_obj._any_cache_key
+                self._any_cached_dttm = viz_obj._any_cached_dttm
+            if viz_obj.status == utils.QueryStatus.FAILED:
+                self.status = viz_obj.status
+                self.error_message = self.error_message or viz_obj.error_message
+        return payloads
 
     def json_dumps(self, obj, sort_keys=False):
         return json.dumps(
@@ -489,6 +658,30 @@ class BaseViz(object):
         include_index = not isinstance(df.index, pd.RangeIndex)
         return df.to_csv(index=include_index, **config.get('CSV_EXPORT'))
 
+    def get_csv_chunks(self, chunk_size=None):
+        """Yields the CSV export in chunks
+
+        Datasources that can stream their results (``query_chunks``) are
+        read ``chunk_size`` rows at a time so that large exports don't have
+        to fit in memory, others fall back to ``get_csv``.
+        """
+        query_obj = self.query_obj()
+        if not query_obj or not hasattr(self.datasource, 'query_chunks'):
+            yield self.get_csv()
+            return
+        timestamp_format = self.get_timestamp_format(query_obj)
+        df_chunks = (
+            self.process_df(df, timestamp_format)
+            for df in self.datasource.query_chunks(query_obj, chunk_size)
+        )
+        # the index is kept when it carries data, as in get_csv
+        first_df = next(df_chunks)
+        include_index = not isinstance(first_df.index, pd.RangeIndex)
+        for csv in utils.df_chunks_to_csv(
+                chain([first_df], df_chunks),
+                index=include_index, **config.get('CSV_EXPORT')):
+            yield csv
+
     def get_data(self, df):
         return df.to_dict(orient='records')
 
@@ -796,6 +989,10 @@ class PivotTableViz(BaseViz):
             df = self.read(df_dict)
             return df.to_csv(index=False, header=False, **config.get('CSV_EXPORT'))
 
+    def get_csv_chunks(self, chunk_size=None):
+        yield self.get_csv()
+
+
 class ReportGeneratorUI(BaseViz):
 
 
@@ -1280,6 +1477,7 @@ class NVD3TimeSeriesViz(NVD3Viz):
     verbose_name = _('Time Series - Line Chart')
     sort_series = False
     is_timeseries = True
+    incremental_cache = True
 
     def to_series(self, df, classed='', title_suffix=''):
         cols = []
@@ -1402,6 +1600,7 @@ class NVD3TimeSeriesViz(NVD3Viz):
         if not isinstance(time_compare, list):
             time_compare = [time_compare]
 
+        queries = []
         for option in time_compare:
             query_object = self.query_obj()
             delta = utils.parse_human_timedelta(option)
@@ -1414,8 +1613,12 @@ class NVD3TimeSeriesViz(NVD3Viz):
                     'when using the `Time Shift` feature.'))
             query_object['from_dttm'] -= delta
             query_object['to_dttm'] -= delta
+            queries.append((query_object, {'time_compare': option}))
 
-            df2 = self.get_df_payload(query_object, time_compare=option).get('df')
+        payloads = self.get_df_payloads(queries)
+        for option, payload in zip(time_compare, payloads):
+            delta = utils.parse_human_timedelta(option)
+            df2 = payload.get('df')
             if df2 is not None and DTTM_ALIAS in df2:
                 label = '{} offset'. format(option)
                 df2[DTTM_ALIAS] += delta
@@ -1993,11 +2196,15 @@ class FilterBoxViz(BaseViz):
     def run_extra_queries(self):
         qry = self.filter_query_obj()
         filters = [g for g in self.form_data['groupby']]
-        self.dataframes = {}
+        queries = []
         for flt in filters:
-            qry['groupby'] = [flt]
-            df = self.get_df_payload(query_obj=qry).get('df')
-            self.dataframes[flt] = df
+            # the datasource mutates the query object, each filter needs its own
+            query_obj = copy.deepcopy(qry)
+            query_obj['groupby'] = [flt]
+            queries.append((query_obj, {}))
+        payloads = self.get_df_payloads(queries)
+        self.dataframes = {
+            flt: payload.get('df') for flt, payload in zip(filters, payloads)}
 
     def filter_query_obj(self):
         qry = super(FilterBoxViz, self).query_obj()
@@ -2930,6 +3137,133 @@ class PartitionViz(NVD3TimeSeriesViz):
         return self.nest_values(levels)
 
 
+LATEST_PARTITION_MACRO_RE = re.compile(
+    r"""latest_(?:sub_)?partition\(\s*['"]([^'"]+)['"]""")
+
+
+def prefetch_partitions(viz_objs):
+    """Caches the latest partitions of the tables referenced with the
+    ``latest_partition`` macros of the charts' datasources and filters"""
+    tables = defaultdict(set)
+    databases = {}
+    for viz_obj in viz_objs:
+        datasource = viz_obj.datasource
+        database = getattr(datasource, 'database', None)
+        if database is None:
+            continue
+        sqls = [
+            getattr(datasource, 'sql', None),
+            viz_obj.form_data.get('where'),
+            viz_obj.form_data.get('having'),
+        ]
+        for sql in sqls:
+            for table_name in LATEST_PARTITION_MACRO_RE.findall(sql or ''):
+                schema = getattr(datasource, 'schema', None)
+                if '.' in table_name:
+                    schema, table_name = table_name.split('.', 1)
+                databases[database.id] = database
+                tables[database.id].add((schema, table_name))
+    for database_id, database_tables in tables.items():
+        database = databases[database_id]
+        database.db_engine_spec.prefetch_partitions(database, database_tables)
+
+
+def detach_datasources(viz_objs, max_workers):
+    """Points ``viz_objs`` to detached copies of their datasources before
+    their queries run on ``max_workers`` threads
+
+    The datasources are ORM objects of the request session, which isn't
+    thread safe: lazy loads, expiry and autoflush would run from several
+    threads at once. Viz objects sharing a datasource share its copy.
+    Returns False, leaving the viz objects untouched, when a datasource
+    can't be copied and the queries have to run serially.
+    """
+    if not max_workers or max_workers < 2 or len(viz_objs) < 2:
+        return True
+    copies = {}
+    for viz_obj in viz_objs:
+        key = id(viz_obj.datasource)
+        if key not in copies:
+            copies[key] = viz_obj.datasource.detached_copy()
+            if copies[key] is None:
+                return False
+    for viz_obj in viz_objs:
+        viz_obj.datasource = copies[id(viz_obj.datasource)]
+    return True
+
+
+def get_viz_payloads(viz_objs, max_workers=None):
+    """Yields ``(index, payload)`` for each of ``viz_objs``
+
+    The cache keys of the main query of all the charts are looked up with a
+    single ``get_many`` call. Charts served from cache are yielded first,
+    the others are then computed concurrently on ``max_workers`` threads and
+    yielded as soon as they are ready, after the partitions their queries
+    depend on were prefetched. The charts computed concurrently are pointed
+    to detached copies of their datasources. Errors are reported in the payload
+    of the chart that failed.
+    """
+    if max_workers is None:
+        max_workers = config.get('VIZ_QUERIES_MAX_WORKERS')
+
+    def error_payload(viz_obj, e):
+        logging.exception(e)
+        return {
+            'error': utils.error_msg_from_exception(e),
+            'form_data': viz_obj.form_data,
+            'status': utils.QueryStatus.FAILED,
+            'stacktrace': traceback.format_exc(),
+        }
+
+    def get_payload(viz_obj, query_obj):
+        try:
+            return viz_obj.get_payload(query_obj)
+        except Exception as e:
+            return error_payload(viz_obj, e)
+
+    query_objs = {}
+    cache_keys = {}
+    for i, viz_obj in enumerate(viz_objs):
+        try:
+            query_obj = viz_obj.query_obj()
+            if query_obj:
+                cache_keys[i] = viz_obj.cache_key(query_obj)
+            query_objs[i] = query_obj
+        except Exception as e:
+            yield i, error_payload(viz_obj, e)
+
+    hits = set()
+    if cache and cache_keys:
+        keys = [i for i in cache_keys if not viz_objs[i].force]
+        values = cache.get_many(*[cache_keys[i] for i in keys]) if keys else []
+        for i, value in zip(keys, values):
+            viz_objs[i]._prefetched_cache[cache_keys[i]] = value
+            if value is not None:
+                hits.add(i)
+
+    misses = []
+    for i in sorted(query_objs):
+        if i in hits:
+            yield i, get_payload(viz_objs[i], query_objs[i])
+        else:
+            misses.append(i)
+
+    try:
+        prefetch_partitions([viz_objs[i] for i in misses])
+    except Exception as e:
+        logging.exception(e)
+
+    if not detach_datasources([viz_objs[i] for i in misses], max_workers):
+        max_workers = None
+
+    tasks = [
+        functools.partial(get_payload, viz_objs[i], query_objs[i])
+        for i in misses
+    ]
+    for j, payload in iter_concurrently(tasks, max_workers):
+        yield misses[j], payload
+
+
 viz_types = {
     o.viz_type: o for o in globals().values()
     if (
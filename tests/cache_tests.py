@@ -1,7 +1,25 @@
 """Unit tests for Superset with caching"""
 import json
+import pickle as pkl
+import threading
+import time
 
-from superset import cache, db
+from mock import patch
+import pandas as pd
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import app, cache, db, viz
+from superset.jinja_context import url_param
+from superset.models.core import Dashboard, Log
+from superset.tasks.cache import (
+    chart_request_context,
+    DashboardStrategy,
+    DatasourceStrategy,
+    get_strategy,
+    TopNSlicesStrategy,
+    warm_up_slices,
+)
+from superset.utils.cache import CacheLock, get_cache_lock, InProcessLock
 from superset.utils.core import QueryStatus
 from .base_tests import SupersetTestCase
 
@@ -34,3 +52,151 @@ class CacheTests(SupersetTestCase):
         self.assertEqual(resp_from_cache['status'], QueryStatus.SUCCESS)
         self.assertEqual(resp['data'], resp_from_cache['data'])
         self.assertEqual(resp['query'], resp_from_cache['query'])
+
+    def test_get_cache_lock(self):
+        self.assertIsInstance(get_cache_lock(cache, 'key', 10), InProcessLock)
+
+    def test_in_process_lock(self):
+        lock = InProcessLock('key')
+        self.assertTrue(lock.acquire())
+        self.assertFalse(InProcessLock('key').acquire())
+        lock.release()
+        lock = InProcessLock('key')
+        self.assertTrue(lock.acquire())
+        lock.release()
+        self.assertEqual(InProcessLock._keys, set())
+
+    def test_cache_lock(self):
+        backend = SimpleCache()
+        lock = CacheLock('key', 10, backend)
+        self.assertTrue(lock.acquire())
+        self.assertFalse(CacheLock('key', 10, backend).acquire())
+        lock.release()
+        self.assertIsNone(backend.get('key'))
+
+    @patch('superset.viz.BaseViz.get_df')
+    @patch('superset.viz.BaseViz.cache_key', return_value='single_flight')
+    def test_single_flight(self, cache_key, get_df):
+        def slow_get_df(query_obj):
+            time.sleep(0.2)
+            return pd.DataFrame({'a': [1]})
+        get_df.side_effect = slow_get_df
+
+        payloads = []
+
+        def run():
+            with app.app_context():
+                test_viz = viz.BaseViz(
+                    self.get_datasource_mock(), {'cache_timeout': 10})
+                payloads.append(test_viz.get_df_payload({'a': 1}))
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(get_df.call_count, 1)
+        self.assertEqual(sorted(p['is_cached'] for p in payloads), [False, True, True])
+
+    def test_wait_for_cache(self):
+        lock = get_cache_lock(cache, 'waited', 10)
+        self.assertTrue(lock.acquire())
+        test_viz = viz.BaseViz(self.get_datasource_mock(), {})
+        try:
+            # gives up after the wait timeout
+            df, is_loaded, waiter_lock = test_viz.wait_for_cache(
+                'waited', get_cache_lock(cache, 'waited', 10), 0.2)
+            self.assertFalse(is_loaded)
+            self.assertIsNone(waiter_lock)
+
+            # served as soon as it is cached, while the lock is still held
+            timer = threading.Timer(0.2, cache.set, ['waited', pkl.dumps({
+                'df': pd.DataFrame({'a': [1]}),
+                'dttm': '2018-01-01T00:00:00',
+                'query': 'SELECT 1',
+            })])
+            timer.start()
+            df, is_loaded, waiter_lock = test_viz.wait_for_cache(
+                'waited', get_cache_lock(cache, 'waited', 10), 5)
+            self.assertTrue(is_loaded)
+            self.assertIsNone(waiter_lock)
+            self.assertEqual(list(df['a']), [1])
+        finally:
+            lock.release()
+            cache.delete('waited')
+
+    @patch('superset.tasks.cache.refresh_chart')
+    @patch('superset.viz.BaseViz.get_df')
+    @patch('superset.viz.BaseViz.cache_key', return_value='stale')
+    def test_stale_while_revalidate(self, cache_key, get_df, refresh_chart):
+        app.config['CACHE_STALE_WHILE_REVALIDATE_TIMEOUT'] = 60
+        try:
+            cache.set('stale', pkl.dumps({
+                'df': pd.DataFrame({'a': [1]}),
+                'dttm': '2018-01-01T00:00:00',
+                'query': 'SELECT 1',
+                'soft_expiry': time.time() - 1,
+            }))
+            for _ in range(2):
+                test_viz = viz.BaseViz(
+                    self.get_datasource_mock(), {'cache_timeout': 10})
+                payload = test_viz.get_df_payload({'a': 1})
+                self.assertTrue(payload['is_cached'])
+                self.assertEqual(payload['cached_dttm'], '2018-01-01T00:00:00')
+            get_df.assert_not_called()
+            self.assertEqual(refresh_chart.delay.call_count, 1)
+
+            get_df.return_value = pd.DataFrame({'a': [2]})
+            test_viz = viz.BaseViz(
+                self.get_datasource_mock(), {'cache_timeout': 10}, force=True)
+            test_viz.get_df_payload({'a': 1})
+            cache_value = pkl.loads(cache.get('stale'))
+            self.assertGreater(cache_value['soft_expiry'], time.time())
+            self.assertIsNone(cache.get('refresh_stale'))
+        finally:
+            app.config['CACHE_STALE_WHILE_REVALIDATE_TIMEOUT'] = 0
+
+    def test_dashboard_strategy(self):
+        dash = db.session.query(Dashboard).filter_by(slug='births').first()
+        slice_ids = DashboardStrategy([dash.id]).get_slice_ids(db.session)
+        self.assertEqual(
+            sorted(slice_ids), sorted(slc.id for slc in dash.slices))
+
+    def test_datasource_strategy(self):
+        slc = self.get_slice('Girls', db.session)
+        strategy = get_strategy(
+            'datasource', table_name='birth_names', db_name='main')
+        self.assertIn(slc.id, strategy.get_slice_ids(db.session))
+        strategy = DatasourceStrategy(slc.datasource_id, slc.datasource_type)
+        self.assertIn(slc.id, strategy.get_slice_ids(db.session))
+
+    def test_top_n_slices_strategy(self):
+        girls = self.get_slice('Girls', db.session)
+        boys = self.get_slice('Boys', db.session)
+        logs = (
+            [Log(action='explore_json', slice_id=girls.id) for _ in range(30)] +
+            [Log(action='explore_json', slice_id=boys.id) for _ in range(20)])
+        db.session.add_all(logs)
+        db.session.commit()
+        try:
+            slice_ids = TopNSlicesStrategy(top_n=2).get_slice_ids(db.session)
+            self.assertEqual(slice_ids, [girls.id, boys.id])
+        finally:
+            for log in logs:
+                db.session.delete(log)
+            db.session.commit()
+
+    def test_chart_request_context(self):
+        with chart_request_context({'url_params': {'foo': 'bar'}}):
+            self.assertEqual(url_param('foo'), 'bar')
+            self.assertEqual(url_param('baz', 'default'), 'default')
+        with chart_request_context({}):
+            self.assertIsNone(url_param('foo'))
+
+    def test_warm_up_slices(self):
+        slc = self.get_slice('Girls', db.session)
+        results = warm_up_slices([slc.id, 0], max_workers=2)
+        self.assertEqual([r['slice_id'] for r in results], [slc.id, 0])
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(results[0]['slice_name'], 'Girls')
+        self.assertIsNotNone(results[1]['error'])
@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+
+from flask import g
+
+from superset import app
+from superset.utils.concurrency import (
+    concurrency_limit,
+    run_concurrently,
+    with_app_context,
+)
+
+
+class ConcurrencyTestCase(unittest.TestCase):
+
+    def test_run_concurrently_keeps_order(self):
+        def task(i):
+            def f():
+                time.sleep(0.01 * (5 - i))
+                return i
+            return f
+        self.assertEqual(
+            run_concurrently([task(i) for i in range(5)], 3), list(range(5)))
+
+    def test_run_concurrently_serial(self):
+        threads = []
+
+        def f():
+            threads.append(threading.current_thread())
+        run_concurrently([f, f], 1)
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_run_concurrently_raises(self):
+        def f():
+            raise ValueError('boom')
+        with self.assertRaises(ValueError):
+            run_concurrently([f, lambda: 1], 2)
+
+    def test_with_app_context_carries_user(self):
+        with app.app_context():
+            g.user = 'alpha'
+            results = run_concurrently([lambda: g.user] * 2, 2)
+        self.assertEqual(results, ['alpha', 'alpha'])
+
+        with app.app_context():
+            g.user = 'gamma'
+            wrapped = with_app_context(lambda: g.user)
+        self.assertEqual(wrapped(), 'gamma')
+
+    def test_concurrency_limit(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def f():
+            with concurrency_limit('test_concurrency_limit', 2):
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+        run_concurrently([f] * 6, 6)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_concurrency_limit_disabled(self):
+        with concurrency_limit(None, 2):
+            pass
+        with concurrency_limit('key', None):
+            pass
@@ -2,6 +2,7 @@
 import csv
 import datetime
 import doctest
+import gzip
 import io
 import json
 import logging
@@ -16,7 +17,9 @@ import pandas as pd
 import psycopg2
 import sqlalchemy as sqla
 
-from superset import dataframe, db, jinja_context, security_manager, sql_lab
+from superset import (
+    app, dataframe, db, jinja_context, security_manager, sql_lab,
+)
 from superset.connectors.sqla.models import SqlaTable
 from superset.db_engine_specs import BaseEngineSpec
 from superset.models import core as models
@@ -133,6 +136,37 @@ class CoreTests(SupersetTestCase):
         resp = self.get_resp(slc.explore_json_url)
         assert '"Jennifer"' in resp
 
+    def test_explore_json_batch_dashboard(self):
+        self.login(username='admin')
+        dash = (
+            db.session.query(models.Dashboard)
+            .filter_by(slug='births')
+            .first()
+        )
+        data = self.get_json_resp(
+            '/superset/explore_json_batch/{}/'.format(dash.id))
+        self.assertEqual(len(data), len(dash.slices))
+        self.assertEqual([p['index'] for p in data], list(range(len(data))))
+
+        resp = self.get_resp(
+            '/superset/explore_json_batch/births/?ndjson=true')
+        lines = [json.loads(l) for l in resp.splitlines()]
+        self.assertEqual(
+            sorted(p['index'] for p in lines), list(range(len(dash.slices))))
+
+    def test_explore_json_batch_form_data(self):
+        self.login(username='admin')
+        slc = self.get_slice('Girls', db.session)
+        form_datas = [
+            {'slice_id': slc.id},
+            {'datasource': 'None__table', 'viz_type': 'table'},
+        ]
+        data = self.get_json_resp(
+            '/superset/explore_json_batch/',
+            {'form_data': json.dumps(form_datas)})
+        assert 'Jennifer' in json.dumps(data[0]['data'])
+        self.assertEqual(data[1]['status'], 'failed')
+
     def test_old_slice_csv_endpoint(self):
         self.login(username='admin')
         slc = self.get_slice('Girls', db.session)
@@ -396,12 +430,32 @@ class CoreTests(SupersetTestCase):
         slc = self.get_slice('Girls', db.session)
         data = self.get_json_resp(
             '/superset/warm_up_cache?slice_id={}'.format(slc.id))
-        assert data == [{'slice_id': slc.id, 'slice_name': slc.slice_name}]
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['slice_id'], slc.id)
+        self.assertEqual(data[0]['slice_name'], slc.slice_name)
+        self.assertIsNone(data[0]['error'])
 
         data = self.get_json_resp(
             '/superset/warm_up_cache?table_name=energy_usage&db_name=main')
         assert len(data) > 0
 
+    def test_warm_up_cache_table_without_charts(self):
+        database = get_main_database(db.session)
+        table = SqlaTable(table_name='warm_up_no_charts', database=database)
+        db.session.add(table)
+        db.session.commit()
+        try:
+            data = self.get_json_resp(
+                '/superset/warm_up_cache?table_name=warm_up_no_charts&db_name=main')
+            self.assertEqual(data, [])
+        finally:
+            db.session.delete(table)
+            db.session.commit()
+
+        resp = self.client.get(
+            '/superset/warm_up_cache?table_name=warm_up_no_charts&db_name=main')
+        self.assertEqual(resp.status_code, 404)
+
     def test_shortner(self):
         self.login(username='admin')
         data = (
@@ -474,6 +528,20 @@ class CoreTests(SupersetTestCase):
         self.assertEqual(list(expected_data), list(data))
         self.logout()
 
+    def test_csv_endpoint_gzip(self):
+        self.login('admin')
+        sql = "SELECT first_name FROM ab_user WHERE first_name='admin'"
+        client_id = '{}'.format(random.getrandbits(64))[:10]
+        self.run_sql(sql, client_id, raise_on_error=True)
+
+        resp = self.client.get('/superset/csv/{}?gzip=true'.format(client_id))
+        self.assertEqual(resp.mimetype, 'application/gzip')
+        data = csv.reader(io.StringIO(
+            gzip.decompress(resp.data).decode('utf-8')))
+        expected_data = csv.reader(io.StringIO('first_name\nadmin\n'))
+        self.assertEqual(list(expected_data), list(data))
+        self.logout()
+
     def test_extra_table_metadata(self):
         self.login('admin')
         dbid = get_main_database(db.session).id
@@ -656,6 +724,97 @@ class CoreTests(SupersetTestCase):
         finally:
             os.remove(filename)
 
+    @mock.patch.dict('superset.views.core.config', {'CSV_UPLOAD_ASYNC': True})
+    @mock.patch('superset.tasks.csv_upload.ingest_csv.delay')
+    def test_import_csv_async(self, delay):
+        from superset.tasks.csv_upload import ingest_csv
+        self.login(username='admin')
+        filename = 'testCSVAsync.csv'
+        table_name = ''.join(
+            random.choice(string.ascii_uppercase) for _ in range(5))
+        with open(filename, 'w+') as test_file:
+            test_file.write('a,b\n')
+            test_file.write('john,1\n')
+            test_file.write('paul,2\n')
+        main_db = get_main_database(db.session)
+
+        try:
+            with open(filename, 'rb') as test_file:
+                form_post = self.get_resp('/csvtodatabaseview/form', data={
+                    'csv_file': test_file,
+                    'sep': ',',
+                    'name': table_name,
+                    'con': main_db.id,
+                    'if_exists': 'append',
+                    'index_label': 'test_label',
+                    'mangle_dupe_cols': False,
+                })
+        finally:
+            os.remove(filename)
+        assert 'is being uploaded to table' in form_post
+        upload_id, form_values, user_name = delay.call_args[0]
+        self.assertEqual(form_values['name'], table_name)
+        self.assertEqual(user_name, 'admin')
+
+        url = '/superset/csv_upload_status/{}/'.format(upload_id)
+        self.assertEqual(
+            self.get_json_resp(url)['status'], utils.QueryStatus.PENDING)
+
+        # what the worker does
+        ingest_csv(upload_id, form_values, user_name)
+        status = self.get_json_resp(url)
+        self.assertEqual(status['status'], utils.QueryStatus.SUCCESS)
+        self.assertEqual(status['rows'], 2)
+        table = db.session.query(SqlaTable).get(status['table_id'])
+        self.assertEqual(table.table_name, table_name)
+
+    def test_import_csv_async_failure(self):
+        from superset.models.csv_upload import CsvUpload
+        from superset.tasks.csv_upload import FORM_FIELDS, ingest_csv
+        table_name = ''.join(
+            random.choice(string.ascii_uppercase) for _ in range(5))
+        filename = 'testCSVAsyncFailure.csv'
+        utils.ensure_path_exists(app.config['UPLOAD_FOLDER'])
+        with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'w') as f:
+            f.write('a,b\njohn,1\npaul,2\n')
+        main_db = get_main_database(db.session)
+        upload = CsvUpload(
+            database_id=main_db.id, table_name=table_name, filename=filename)
+        db.session.add(upload)
+        db.session.commit()
+        upload_id = upload.id
+        form_values = {name: None for name in FORM_FIELDS}
+        form_values.update(
+            name=table_name, sep=',', if_exists='fail', index=False,
+            mangle_dupe_cols=True, skipinitialspace=False,
+            skip_blank_lines=True, infer_datetime_format=False)
+
+        # the second chunk fails once the first one was inserted
+        db_engine_spec = main_db.db_engine_spec
+        insert_df = db_engine_spec.insert_df
+        chunks_inserted = []
+
+        def failing_insert_df(df, *args, **kwargs):
+            if chunks_inserted:
+                raise Exception('Insert failed')
+            chunks_inserted.append(df)
+            return insert_df(df, *args, **kwargs)
+
+        with mock.patch.dict(
+                'superset.db_engine_specs.config', {'CSV_UPLOAD_CHUNK_SIZE': 1}):
+            with mock.patch.object(
+                    db_engine_spec, 'insert_df', side_effect=failing_insert_df):
+                ingest_csv(upload_id, form_values, 'admin')
+
+        upload = db.session.query(CsvUpload).get(upload_id)
+        self.assertEqual(upload.status, utils.QueryStatus.FAILED)
+        self.assertIn('Insert failed', upload.error_message)
+        self.assertIsNone(upload.table_id)
+        self.assertIsNone(
+            db.session.query(SqlaTable).filter_by(table_name=table_name).first())
+        self.assertFalse(os.path.exists(
+            os.path.join(app.config['UPLOAD_FOLDER'], filename)))
+
     def test_dataframe_timezone(self):
         tz = psycopg2.tz.FixedOffsetTimezone(offset=60, name=None)
         data = [
@@ -3,6 +3,7 @@ import json
 import unittest
 
 from flask import escape
+from sqlalchemy import event
 
 from superset import db, security_manager
 from superset.connectors.sqla.models import SqlaTable
@@ -52,6 +53,46 @@ class DashboardTests(SupersetTestCase):
         for title, url in urls.items():
             assert escape(title) in self.client.get(url).data.decode('utf-8')
 
+    def count_statements(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.get_resp(url)
+        finally:
+            event.remove(
+                db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def test_dashboard_statement_count(self):
+        slices = (
+            db.session.query(models.Slice)
+            .filter_by(datasource_type='table')
+            .order_by(models.Slice.id)
+            .all()
+        )
+        self.assertGreater(len({slc.datasource_id for slc in slices}), 1)
+        urls = []
+        for slug, dash_slices in (
+                ('statement_count_1', slices[:1]), ('statement_count_n', slices)):
+            dash = (
+                db.session.query(models.Dashboard).filter_by(slug=slug).first() or
+                models.Dashboard(dashboard_title=slug, slug=slug)
+            )
+            dash.slices = dash_slices
+            db.session.merge(dash)
+            urls.append('/superset/dashboard/{}/'.format(slug))
+        db.session.commit()
+
+        self.login(username='admin')
+        self.get_resp(urls[0])
+        # the slices and their datasources are fetched in bulk
+        self.assertEqual(
+            self.count_statements(urls[0]), self.count_statements(urls[1]))
+
     def test_dashboard_modes(self):
         self.login(username='admin')
         dash = (
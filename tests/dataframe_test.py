@@ -1,7 +1,11 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
 import numpy as np
 
-from superset.dataframe import dedup, SupersetDataFrame
+from superset.dataframe import dedup, df_from_batches, SupersetDataFrame
 from superset.db_engine_specs import BaseEngineSpec
+from superset.utils.core import JS_MAX_INTEGER
 from .base_tests import SupersetTestCase
 
 
@@ -136,3 +140,77 @@ class SupersetDataFrameTestCase(SupersetTestCase):
         )
         cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
         self.assertListEqual(cdf.column_names, ['a', 'a__1'])
+
+    def test_data(self):
+        data = [
+            ('a', 1, 1.5, datetime(2018, 1, 1), JS_MAX_INTEGER + 1),
+            ('b', 2, None, None, 3),
+        ]
+        cursor_descr = (
+            ('a', 'string'),
+            ('b', 'int'),
+            ('c', 'float'),
+            ('d', 'datetime'),
+            ('e', 'int'),
+        )
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+        records = cdf.data
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['a'], 'a')
+        self.assertEqual(records[0]['b'], 1)
+        self.assertEqual(records[0]['d'], datetime(2018, 1, 1))
+        self.assertIsNone(records[1]['d'])
+        self.assertEqual(records[0]['e'], str(JS_MAX_INTEGER + 1))
+        self.assertEqual(records[1]['e'], 3)
+
+    def test_data_object_column_int_overflow(self):
+        data = [
+            ('a', 2 ** 70),
+            ('b', 'c'),
+        ]
+        cursor_descr = (
+            ('a', 'string'),
+            ('b', 'string'),
+        )
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+        self.assertEqual(
+            [r['b'] for r in cdf.data], [str(2 ** 70), 'c'])
+
+    def test_data_timedelta_column(self):
+        data = [
+            (timedelta(days=1, seconds=30),),
+            (None,),
+        ]
+        cdf = SupersetDataFrame(data, (('a', 'interval'),), BaseEngineSpec)
+        records = cdf.data
+        self.assertEqual(records[0]['a'], timedelta(days=1, seconds=30))
+        self.assertIsNone(records[1]['a'])
+
+    def test_data_empty(self):
+        cdf = SupersetDataFrame([], (('a', 'string'),), BaseEngineSpec)
+        self.assertEqual(cdf.data, [])
+
+    def test_df_from_batches(self):
+        batches = [
+            [(1, 'a', Decimal('1.5')), (2, 'b', None)],
+            [(3, 'c', Decimal('2.5'))],
+        ]
+        df = df_from_batches(iter(batches), ['a', 'b', 'c'])
+        self.assertEqual(list(df.columns), ['a', 'b', 'c'])
+        self.assertEqual(list(df['a']), [1, 2, 3])
+        self.assertEqual(list(df['b']), ['a', 'b', 'c'])
+        self.assertEqual(df['c'].dtype, np.float64)
+
+    def test_from_batches(self):
+        batches = [[(1, 'a'), (2, 'b')], [(3, 'c')]]
+        cursor_descr = (('a', 'int'), ('a', 'string'))
+        cdf = SupersetDataFrame.from_batches(
+            iter(batches), cursor_descr, BaseEngineSpec)
+        self.assertEqual(cdf.column_names, ['a', 'a__1'])
+        self.assertEqual(cdf.size, 3)
+        self.assertEqual(cdf.data[2], {'a': 3, 'a__1': 'c'})
+
+    def test_df_from_batches_empty(self):
+        df = df_from_batches([], ['a', 'b'])
+        self.assertEqual(list(df.columns), ['a', 'b'])
+        self.assertTrue(df.empty)
@@ -1,11 +1,20 @@
 import inspect
+import os
+
+import mock
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from werkzeug.contrib.cache import SimpleCache
 
 from superset import db_engine_specs
 from superset.db_engine_specs import (
     BaseEngineSpec, HiveEngineSpec, MssqlEngineSpec,
-    MySQLEngineSpec, PrestoEngineSpec,
+    MySQLEngineSpec, PostgresEngineSpec, PrestoEngineSpec,
 )
+from superset.exceptions import SupersetTemplateException
 from superset.models.core import Database
+from superset.utils.query_channel import InMemoryQueryChannel
 from .base_tests import SupersetTestCase
 
 
@@ -284,3 +293,197 @@ class DbEngineSpecsTestCase(SupersetTestCase):
                 defined_time_grains = {grain.duration for grain in cls.get_time_grains()}
                 intersection = time_grains.intersection(defined_time_grains)
                 self.assertSetEqual(defined_time_grains, intersection, cls_name)
+
+    def test_fetch_data_in_batches(self):
+        cursor = mock.Mock()
+        rows = [(i,) for i in range(25)]
+        cursor.fetchmany.side_effect = lambda size: [
+            rows.pop(0) for _ in range(min(size, len(rows)))]
+        batches = list(BaseEngineSpec.fetch_data_in_batches(cursor, 10))
+        self.assertEqual([len(b) for b in batches], [10, 10, 5])
+
+    def test_fetch_data_in_batches_with_limit(self):
+        cursor = mock.Mock()
+        rows = [(i,) for i in range(25)]
+        cursor.fetchmany.side_effect = lambda size: [
+            rows.pop(0) for _ in range(min(size, len(rows)))]
+        batches = list(
+            BaseEngineSpec.fetch_data_in_batches(cursor, 10, limit=15))
+        self.assertEqual([len(b) for b in batches], [10, 5])
+
+    def test_get_cursor(self):
+        conn = mock.Mock()
+        BaseEngineSpec.get_cursor(conn, server_side=True)
+        conn.cursor.assert_called_once_with()
+
+        conn = mock.Mock()
+        PostgresEngineSpec.get_cursor(conn, server_side=True)
+        self.assertIn('name', conn.cursor.call_args[1])
+
+        conn = mock.Mock()
+        PostgresEngineSpec.get_cursor(conn)
+        conn.cursor.assert_called_once_with()
+
+    def get_partitioned_database(self):
+        database = mock.Mock()
+        database.id = 1
+        database.get_indexes.return_value = [{'column_names': ['ds', 'hour']}]
+        database.get_df.return_value = pd.DataFrame({'ds': ['2018-01-02']})
+        return database
+
+    @mock.patch('superset.db_engine_specs.tables_cache', SimpleCache())
+    def test_latest_partition_cache(self):
+        database = self.get_partitioned_database()
+        for _ in range(2):
+            self.assertEqual(
+                PrestoEngineSpec.latest_partition(
+                    'table', 'schema', database, show_first=True),
+                ('ds', '2018-01-02'))
+            self.assertEqual(
+                PrestoEngineSpec.latest_sub_partition(
+                    'table', 'schema', database, hour='01'),
+                '2018-01-02')
+        self.assertEqual(database.get_indexes.call_count, 1)
+        self.assertEqual(database.get_df.call_count, 2)
+
+        with self.assertRaises(SupersetTemplateException):
+            PrestoEngineSpec.latest_partition('table', 'schema', database)
+
+        PrestoEngineSpec.invalidate_partition_cache(
+            database, 'schema', 'table')
+        PrestoEngineSpec.latest_partition(
+            'schema.table', None, database, show_first=True)
+        self.assertEqual(database.get_indexes.call_count, 2)
+        self.assertEqual(database.get_df.call_count, 3)
+
+    @mock.patch('superset.db_engine_specs.tables_cache', new_callable=SimpleCache)
+    def test_partition_values_cached_apart(self, tables_cache):
+        database = self.get_partitioned_database()
+        PrestoEngineSpec.latest_partition(
+            'table', 'schema', database, show_first=True)
+        with mock.patch.object(
+                PrestoEngineSpec, 'set_partition_metadata') as set_metadata:
+            for hour in range(3):
+                PrestoEngineSpec.latest_sub_partition(
+                    'table', 'schema', database, hour=str(hour))
+            # the metadata and its expiry are left as they are
+            set_metadata.assert_not_called()
+        metadata = tables_cache.get(
+            PrestoEngineSpec._partition_cache_key(database, 'schema', 'table'))
+        self.assertEqual(sorted(metadata), ['generation', 'part_fields'])
+        self.assertEqual(database.get_df.call_count, 4)
+
+    @mock.patch('superset.db_engine_specs.tables_cache', SimpleCache())
+    def test_prefetch_partitions(self):
+        database = self.get_partitioned_database()
+        PrestoEngineSpec.prefetch_partitions(
+            database, [('schema', 'a'), ('schema', 'b'), ('schema', 'a')])
+        self.assertEqual(database.get_df.call_count, 2)
+        PrestoEngineSpec.latest_partition(
+            'a', 'schema', database, show_first=True)
+        self.assertEqual(database.get_df.call_count, 2)
+
+    @mock.patch('superset.db_engine_specs.sqla.inspect')
+    def test_fetch_result_sets(self, inspect):
+        database = mock.Mock()
+        database.all_schema_names.return_value = ['a', 'b', 'c']
+        database.all_table_names_in_schema.side_effect = (
+            lambda schema, **kwargs: ['{}1'.format(schema), '{}2'.format(schema)])
+        result_sets = BaseEngineSpec.fetch_result_sets(database, 'table')
+        self.assertEqual(
+            result_sets, ['a.a1', 'a.a2', 'b.b1', 'b.b2', 'c.c1', 'c.c2'])
+        database.get_sqla_engine.assert_called_once_with(nullpool=False)
+        for call in database.all_table_names_in_schema.call_args_list:
+            self.assertIs(call[1]['inspector'], inspect.return_value)
+            self.assertTrue(call[1]['force'])
+
+    @mock.patch('superset.db_engine_specs.time.sleep', mock.Mock())
+    def test_presto_handle_cursor_cancel_signal(self):
+        channel = InMemoryQueryChannel()
+        query = mock.Mock(id=1, user_id=2, progress=0, status='running')
+        query.to_dict.side_effect = lambda: {'id': 'a', 'progress': query.progress}
+        session = mock.Mock()
+        cursor = mock.Mock()
+        stats = {'state': 'RUNNING', 'completedSplits': 1, 'totalSplits': 4}
+
+        def poll():
+            if cursor.poll.call_count == 3:
+                channel.cancel(query.id)
+            return {'stats': stats}
+        cursor.poll.side_effect = poll
+        with mock.patch(
+                'superset.db_engine_specs.get_query_channel',
+                return_value=channel):
+            PrestoEngineSpec.handle_cursor(cursor, query, session)
+        cursor.cancel.assert_called_once_with()
+        self.assertEqual(query.status, 'stopped')
+        self.assertEqual(query.progress, 25)
+        self.assertEqual(channel.get_progress([1]), {1: 25})
+        self.assertEqual(
+            channel.get_updates(2, 0)[1], {'a': {'id': 'a', 'progress': 25}})
+        # the query row is never read back, progress is committed once
+        session.query.assert_not_called()
+        self.assertEqual(session.commit.call_count, 1)
+
+    def test_df_chunks_to_sql(self):
+        engine = create_engine('sqlite://')
+        chunks = (
+            pd.DataFrame({'a': ['john', 'paul'], 'b': [1, 2]}),
+            pd.DataFrame({'a': ['george'], 'b': [3]}),
+        )
+        progress = mock.Mock()
+        rows = BaseEngineSpec.df_chunks_to_sql(
+            iter(chunks), 'beatles', engine, index=False, progress=progress)
+        self.assertEqual(rows, 3)
+        self.assertEqual(
+            [c[0][0] for c in progress.call_args_list], [2, 3])
+        self.assertEqual(
+            engine.execute('SELECT a, b FROM beatles ORDER BY b').fetchall(),
+            [('john', 1), ('paul', 2), ('george', 3)])
+
+        with self.assertRaises(ValueError):
+            BaseEngineSpec.df_chunks_to_sql(
+                iter(chunks), 'beatles', engine, if_exists='fail')
+
+    def test_postgres_insert_df_copy(self):
+        con = mock.Mock()
+        cursor = con.connection.cursor.return_value
+        copied = []
+        cursor.copy_expert.side_effect = (
+            lambda sql, buf: copied.append((sql, buf.read())))
+        con.dialect = make_url('postgresql://').get_dialect()()
+        df = pd.DataFrame({'a': ['john', None], 'b': [1, 2]})
+        PostgresEngineSpec.insert_df(
+            df, 'beatles', con, schema='music', index=True, index_label='i')
+        self.assertEqual(copied, [(
+            'COPY music.beatles (i, a, b) FROM STDIN WITH (FORMAT CSV)',
+            '0,john,1\n1,,2\n',
+        )])
+        cursor.close.assert_called_once_with()
+
+    @mock.patch('superset.db_engine_specs.create_engine')
+    @mock.patch('superset.db_engine_specs.Table')
+    @mock.patch('superset.db_engine_specs.boto3')
+    def test_hive_create_table_from_csv_progress(self, boto3, table, engine):
+        table.return_value.infer.return_value = {
+            'fields': [{'name': 'a', 'type': 'string'}]}
+        upload_folder = db_engine_specs.config['UPLOAD_FOLDER']
+        filename = 'test_hive_progress.csv'
+        with open(upload_folder + filename, 'w') as f:
+            f.write('a\njohn\n"paul\nmccartney"\n')
+        form = mock.Mock()
+        form.name.data = 'beatles'
+        form.schema.data = None
+        form.csv_file.data.filename = filename
+        progress = mock.Mock()
+        config = {
+            'CSV_TO_HIVE_UPLOAD_S3_BUCKET': 'bucket',
+            'UPLOADED_CSV_HIVE_NAMESPACE': None,
+        }
+        try:
+            with mock.patch.dict(db_engine_specs.config, config):
+                HiveEngineSpec.create_table_from_csv(
+                    form, mock.Mock(), progress=progress)
+        finally:
+            os.remove(upload_folder + filename)
+        progress.assert_called_once_with(2)
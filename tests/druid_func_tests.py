@@ -1,9 +1,12 @@
 import json
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
+from pydruid.query import QueryBuilder
+from pydruid.utils.aggregators import count
 from pydruid.utils.dimensions import MapLookupExtraction, RegexExtraction
 import pydruid.utils.postaggregator as postaggs
+from werkzeug.contrib.cache import SimpleCache
 
 
 import superset.connectors.druid.models as models
@@ -908,3 +911,46 @@ class DruidFuncTestCase(unittest.TestCase):
         metric_names = ['sum1', 'div1']
         self.assertRaises(
             SupersetException, ds.get_aggregations, metrics_dict, metric_names)
+
+    def test_run_pydruid_query_cache(self):
+        client = Mock()
+        client.query_builder = QueryBuilder()
+        client._post.side_effect = (
+            lambda query: query.parse('[{"result": {"count": 1}}]'))
+        cache = SimpleCache()
+        qry = dict(
+            datasource='datasource',
+            granularity='all',
+            intervals='2018-01-01/2018-01-02',
+            aggregations={'count': count('count')},
+        )
+        ds = DruidDatasource(datasource_name='datasource', cluster_name='a')
+        with patch.dict(models.conf, {'DRUID_QUERY_CACHE_TIMEOUT': 60}), \
+                patch.object(models, 'cache', cache):
+            ds.run_pydruid_query(client, 'timeseries', qry, phase=1)
+            ds.run_pydruid_query(client, 'timeseries', qry)
+            self.assertEqual(1, client._post.call_count)
+            self.assertEqual(
+                [{'result': {'count': 1}}],
+                client.query_builder.last_query.result)
+
+            # the same query sent to another cluster isn't served from cache
+            ds.cluster_name = 'b'
+            ds.run_pydruid_query(client, 'timeseries', qry)
+            self.assertEqual(2, client._post.call_count)
+
+            # forced queries skip the cache but refresh it
+            client._post.side_effect = (
+                lambda query: query.parse('[{"result": {"count": 2}}]'))
+            ds.run_pydruid_query(client, 'timeseries', qry, force=True)
+            self.assertEqual(3, client._post.call_count)
+            ds.run_pydruid_query(client, 'timeseries', qry)
+            self.assertEqual(3, client._post.call_count)
+            self.assertEqual(
+                [{'result': {'count': 2}}],
+                client.query_builder.last_query.result)
+
+        # without a timeout queries go straight to the client
+        client = Mock()
+        ds.run_pydruid_query(client, 'timeseries', qry)
+        client.timeseries.assert_called_once_with(**qry)
@@ -0,0 +1,90 @@
+import unittest
+
+import mock
+from sqlalchemy import create_engine
+
+from superset.utils.engine_pool import EngineRegistry
+
+
+class EngineRegistryTestCase(unittest.TestCase):
+
+    def get_factory(self):
+        return mock.Mock(side_effect=lambda: create_engine('sqlite://'))
+
+    def test_get_engine_reuses_engines(self):
+        registry = EngineRegistry()
+        factory = self.get_factory()
+        engine = registry.get_engine(1, 'v1', ('a',), factory)
+        self.assertIs(registry.get_engine(1, 'v1', ('a',), factory), engine)
+        self.assertIsNot(registry.get_engine(1, 'v1', ('b',), factory), engine)
+        self.assertIsNot(registry.get_engine(2, 'v1', ('a',), factory), engine)
+        self.assertEqual(factory.call_count, 3)
+
+    def test_engines_are_created_outside_of_the_lock(self):
+        registry = EngineRegistry()
+
+        def factory():
+            self.assertFalse(registry.lock.locked())
+            return create_engine('sqlite://')
+        registry.get_engine(1, 'v1', ('a',), factory)
+
+    def test_first_engine_registered_is_kept(self):
+        registry = EngineRegistry()
+        first = create_engine('sqlite://')
+
+        def factory():
+            # another thread registers the engine meanwhile
+            registry.get_engine(1, 'v1', ('a',), lambda: first)
+            return create_engine('sqlite://')
+        self.assertIs(registry.get_engine(1, 'v1', ('a',), factory), first)
+        self.assertEqual(len(registry.engines), 1)
+
+    def test_new_version_disposes_engines(self):
+        registry = EngineRegistry()
+        factory = self.get_factory()
+        engine = registry.get_engine(1, 'v1', ('a',), factory)
+        other = registry.get_engine(2, 'v1', ('a',), factory)
+        with mock.patch.object(engine, 'dispose') as dispose:
+            new_engine = registry.get_engine(1, 'v2', ('a',), factory)
+            dispose.assert_called_once_with()
+        self.assertIsNot(new_engine, engine)
+        self.assertIs(registry.get_engine(2, 'v1', ('a',), factory), other)
+        self.assertEqual(len(registry.engines), 2)
+
+    @mock.patch('superset.utils.engine_pool.time')
+    def test_evict_idle(self, time):
+        time.time.return_value = 0
+        registry = EngineRegistry(idle_timeout=100, eviction_interval=10)
+        factory = self.get_factory()
+        registry.get_engine(1, 'v1', ('a',), factory)
+        time.time.return_value = 50
+        registry.get_engine(1, 'v1', ('b',), factory)
+        time.time.return_value = 120
+        self.assertEqual(registry.evict_idle(), 1)
+        self.assertEqual(list(registry.engines), [(1, 'v1', 'b')])
+
+        # eviction also happens when getting engines
+        time.time.return_value = 200
+        registry.get_engine(2, 'v1', ('a',), factory)
+        self.assertEqual(list(registry.engines), [(2, 'v1', 'a')])
+
+    def test_clear(self):
+        registry = EngineRegistry()
+        factory = self.get_factory()
+        registry.get_engine(1, 'v1', ('a',), factory)
+        registry.get_engine(2, 'v1', ('a',), factory)
+        registry.clear(1)
+        self.assertEqual(list(registry.engines), [(2, 'v1', 'a')])
+        registry.clear()
+        self.assertEqual(registry.engines, {})
+
+    @mock.patch('superset.utils.engine_pool.stats_logger')
+    def test_pool_metrics(self, stats_logger):
+        registry = EngineRegistry()
+        engine = registry.get_engine(1, 'v1', ('a',), self.get_factory())
+        engine.execute('SELECT 1')
+        keys = [c[0][0] for c in stats_logger.incr.call_args_list]
+        self.assertIn('engine_pool.create', keys)
+        self.assertIn('engine_pool.connect', keys)
+        self.assertIn('engine_pool.checkout', keys)
+        self.assertEqual(registry.status()[0]['key'], ('a',))
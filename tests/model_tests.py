@@ -1,6 +1,13 @@
+import json
 import textwrap
 
+import mock
+import pandas as pd
+import sqlalchemy as sqla
+from sqlalchemy import column, select, table
 from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+from werkzeug.contrib.cache import SimpleCache
 
 from superset import app, db
 from superset.models.core import Database
@@ -71,6 +78,65 @@ class DatabaseModelTestCase(SupersetTestCase):
         user_name = make_url(model.get_sqla_engine(user_name=example_user).url).username
         self.assertNotEquals(example_user, user_name)
 
+    def test_get_sqla_engine_reuses_engines(self):
+        model = Database(
+            sqlalchemy_uri='postgresql+psycopg2://postgres.airbnb.io:5439/prod')
+        engine = model.get_sqla_engine()
+        self.assertIs(engine, model.get_sqla_engine())
+        self.assertIsNot(engine, model.get_sqla_engine(schema='foo'))
+        self.assertIsNot(engine, model.get_sqla_engine(nullpool=True))
+        self.assertIs(engine, model.get_sqla_engine(nullpool=False))
+        self.assertEquals(engine.pool.size(), 5)
+
+        model.extra = json.dumps({'connection_pool': {'pool_size': 2}})
+        engine = model.get_sqla_engine()
+        self.assertEquals(engine.pool.size(), 2)
+
+        model.extra = json.dumps({'connection_pool': {'enabled': False}})
+        self.assertIsNone(model.get_pool_params())
+        self.assertIsInstance(model.get_sqla_engine().pool, NullPool)
+        self.assertNotIsInstance(
+            model.get_sqla_engine(nullpool=False).pool, NullPool)
+
+    def test_sqlite_connections_are_not_pooled(self):
+        main_db = get_main_database(db.session)
+        self.assertIsNone(main_db.get_pool_params())
+
+    def test_compile_sqla_query_without_engine(self):
+        model = Database(sqlalchemy_uri='mysql://root@localhost/superset')
+        other = Database(sqlalchemy_uri='mysql://root@otherhost/superset')
+        self.assertIs(model.get_dialect(), other.get_dialect())
+        qry = (
+            select([column('a')])
+            .select_from(table('t'))
+            .where(column('b').like('%x%'))
+        )
+        with mock.patch.object(Database, 'get_sqla_engine') as get_sqla_engine:
+            sql = model.compile_sqla_query(qry)
+            select_star = model.select_star('t', schema='s', indent=False)
+            get_sqla_engine.assert_not_called()
+        self.assertIn("LIKE '%x%'", sql)
+        self.assertIn('FROM s.t', select_star)
+
+    def test_get_dialect_with_engine_params(self):
+        model = Database(
+            sqlalchemy_uri='mysql://root@localhost/superset',
+            extra=json.dumps({'engine_params': {'label_length': 20}}))
+        other = Database(sqlalchemy_uri='mysql://root@otherhost/superset')
+        self.assertIsNot(model.get_dialect(), other.get_dialect())
+        self.assertEquals(model.get_dialect().label_length, 20)
+        self.assertIs(
+            model.get_dialect(),
+            Database(
+                sqlalchemy_uri='mysql://root@otherhost/superset',
+                extra=model.extra).get_dialect())
+
+        # the parameters of the pool don't change the dialect
+        other.extra = json.dumps({'engine_params': {'pool_size': 20}})
+        self.assertIs(
+            other.get_dialect(),
+            Database(sqlalchemy_uri='mysql://root@localhost/superset').get_dialect())
+
     def test_select_star(self):
         main_db = get_main_database(db.session)
         table_name = 'bart_lines'
@@ -205,3 +271,214 @@ class SqlaTableModelTestCase(SupersetTestCase):
         self.assertIn('--COMMENT', sql)
 
         app.config['SQL_QUERY_MUTATOR'] = None
+
+    def test_shared_index(self):
+        tbl = self.get_table_by_name('birth_names')
+        index = tbl.index
+        self.assertIs(index, tbl.index)
+        self.assertIn('sum__num', index.metrics)
+        self.assertIs(index.columns['ds'], tbl.get_col('ds'))
+        # detached copies, usable once the session is gone
+        self.assertIsNone(sqla.inspect(index.columns['ds']).session)
+        db.session.expunge_all()
+        self.assertIs(index, self.get_table_by_name('birth_names').index)
+        self.assertEquals(
+            str(index.columns['gender'].get_sqla_col().compile()), 'gender')
+
+    def test_detached_copy(self):
+        tbl = self.get_table_by_name('birth_names')
+        copy = tbl.detached_copy()
+        self.assertIsNone(sqla.inspect(copy).session)
+        self.assertIsNone(sqla.inspect(copy.database).session)
+        self.assertEquals(copy.database.id, tbl.database.id)
+        self.assertEquals(
+            [c.column_name for c in copy.columns],
+            [c.column_name for c in tbl.columns])
+        self.assertIs(copy.columns[0].table, copy)
+        self.assertIs(copy.metrics[0].table, copy)
+        db.session.expunge_all()
+        self.assertEquals(copy.get_col('gender').column_name, 'gender')
+
+    def test_shared_index_invalidation(self):
+        tbl = self.get_table_by_name('birth_names')
+        index = tbl.index
+        col = tbl.get_column('gender')
+        verbose_name = col.verbose_name
+        col.verbose_name = 'Sex'
+        db.session.commit()
+
+        tbl = self.get_table_by_name('birth_names')
+        self.assertIsNot(index, tbl.index)
+        self.assertEquals(tbl.index.columns['gender'].verbose_name, 'Sex')
+
+        tbl.get_column('gender').verbose_name = verbose_name
+        db.session.commit()
+
+    def test_index_with_pending_changes(self):
+        tbl = self.get_table_by_name('birth_names')
+        index = tbl.index
+        col = tbl.get_column('gender')
+        col.verbose_name = 'Sex'
+        try:
+            self.assertIsNot(index, tbl.index)
+            self.assertEquals(tbl.index.columns['gender'].verbose_name, 'Sex')
+        finally:
+            db.session.rollback()
+        self.assertIs(index, self.get_table_by_name('birth_names').index)
+
+    def test_flush_touches_table_once(self):
+        tbl = self.get_table_by_name('birth_names')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('UPDATE tables'):
+                statements.append(statement)
+        sqla.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            for col in tbl.columns:
+                col.description = 'touched'
+            db.session.flush()
+        finally:
+            sqla.event.remove(
+                db.engine, 'before_cursor_execute', before_cursor_execute)
+            db.session.rollback()
+        self.assertEquals(len(statements), 1)
+
+    def test_data_json(self):
+        tbl = self.get_table_by_name('birth_names')
+        data_json = tbl.data_json
+        self.assertEquals(data_json, json.dumps(tbl.data))
+        self.assertIs(data_json, self.get_table_by_name('birth_names').data_json)
+
+        metric = [m for m in tbl.metrics if m.metric_name == 'sum__num'][0]
+        verbose_name = metric.verbose_name
+        metric.verbose_name = 'Sum of num'
+        db.session.commit()
+
+        tbl = self.get_table_by_name('birth_names')
+        self.assertIsNot(data_json, tbl.data_json)
+        data = json.loads(tbl.data_json)
+        self.assertEquals(data['verbose_map']['sum__num'], 'Sum of num')
+
+        metric = [m for m in tbl.metrics if m.metric_name == 'sum__num'][0]
+        metric.verbose_name = verbose_name
+        db.session.commit()
+
+    def get_top_groups_sql(self, dimensions, top_groups_filter, df=None):
+        tbl = self.get_table_by_name('birth_names')
+        if df is None:
+            df = pd.DataFrame({
+                'gender': ['boy', 'girl', None],
+                'state': ['CA', 'NY', 'TX'],
+                'sum__num': [3, 2, 1],
+            })
+        with mock.patch.object(
+                tbl.database.db_engine_spec, 'top_groups_filter',
+                top_groups_filter):
+            clause = tbl._get_top_groups(df, dimensions)
+        return str(clause.compile(compile_kwargs={'literal_binds': True}))
+
+    def test_top_groups_filter(self):
+        sql = self.get_top_groups_sql(['gender', 'state'], 'tuple_in')
+        self.assertIn(
+            "(gender, state) IN (('boy', 'CA'), ('girl', 'NY'))", sql)
+        self.assertIn("gender IS NULL AND state = 'TX'", sql)
+
+        sql = self.get_top_groups_sql(['gender', 'state'], 'values')
+        self.assertIn(
+            "(gender, state) IN (VALUES ('boy', 'CA'), ('girl', 'NY'))", sql)
+        self.assertIn("gender IS NULL AND state = 'TX'", sql)
+
+        sql = self.get_top_groups_sql(['gender', 'state'], None)
+        self.assertEquals(
+            "gender = 'boy' AND state = 'CA' OR "
+            "gender = 'girl' AND state = 'NY' OR "
+            "gender IS NULL AND state = 'TX'", sql)
+
+        sql = self.get_top_groups_sql(['gender'], None)
+        self.assertEquals("gender IN ('boy', 'girl') OR gender IS NULL", sql)
+
+    def test_top_groups_filter_nested_in(self):
+        df = pd.DataFrame({
+            'gender': ['boy', 'girl', 'boy', None],
+            'state': ['CA', 'NY', 'NY', 'TX'],
+            'sum__num': [4, 3, 2, 1],
+        })
+        sql = self.get_top_groups_sql(['gender', 'state'], 'nested_in', df)
+        self.assertEquals(
+            "gender = 'boy' AND state IN ('CA', 'NY') OR "
+            "gender = 'girl' AND state IN ('NY') OR "
+            "gender IS NULL AND state = 'TX'", sql)
+
+    def test_top_groups_filter_of_engines_without_inner_joins(self):
+        from superset.db_engine_specs import DruidEngineSpec
+        self.assertFalse(DruidEngineSpec.inner_joins)
+        self.assertEquals('nested_in', DruidEngineSpec.top_groups_filter)
+
+    def test_query_str_is_formatted_lazily(self):
+        tbl = self.get_table_by_name('birth_names')
+        query_obj = dict(
+            groupby=['name'],
+            metrics=['sum__num'],
+            filter=[],
+            is_timeseries=False,
+            columns=[],
+            granularity=None,
+            from_dttm=None, to_dttm=None,
+            is_prequery=False,
+            extras={},
+        )
+        with mock.patch('superset.connectors.sqla.models.sqlparse') as sqlparse:
+            sql = tbl.get_query_str(query_obj)
+            sqlparse.format.assert_not_called()
+            tbl.format_query_str(sql)
+            sqlparse.format.assert_called_once_with(sql, reindent=True)
+
+    def test_values_for_column_with_percent(self):
+        tbl = self.get_table_by_name('birth_names')
+        fetch_values_predicate = tbl.fetch_values_predicate
+        tbl.fetch_values_predicate = "name LIKE 'A%'"
+        try:
+            values = tbl.values_for_column('name', limit=10)
+        finally:
+            tbl.fetch_values_predicate = fetch_values_predicate
+            db.session.commit()
+        self.assertTrue(values)
+        for value in values:
+            self.assertTrue(value.startswith('A'))
+
+    def test_all_result_sets_in_database_partial(self):
+        main_db = get_main_database(db.session)
+        main_db.allow_multi_schema_metadata_fetch = True
+        tables_cache = SimpleCache()
+        tables_cache.set(
+            'db:{}:schema_list'.format(main_db.id), ['a', 'b'])
+        tables_cache.set(
+            'db:{}:schema:a:table_list'.format(main_db.id), ['t1', 't2'])
+        with mock.patch('superset.models.core.tables_cache', tables_cache), \
+                mock.patch('superset.models.core.threading') as threading:
+            names, complete = main_db.all_result_sets_in_database('table')
+            self.assertEqual(names, ['a.t1', 'a.t2'])
+            self.assertFalse(complete)
+            # the crawl and its heartbeat, neither blocking the shutdown
+            self.assertEqual(threading.Thread.call_count, 2)
+            self.assertTrue(threading.Thread.return_value.daemon)
+            crawl_key = 'db:{}:crawl:table'.format(main_db.id)
+            self.assertTrue(tables_cache.get(crawl_key))
+
+            # a single crawl runs at a time
+            main_db.all_result_sets_in_database('table')
+            self.assertEqual(threading.Thread.call_count, 2)
+
+            # until its marker expires, when its heartbeat stopped
+            tables_cache.delete(crawl_key)
+            main_db.all_result_sets_in_database('table')
+            self.assertEqual(threading.Thread.call_count, 4)
+
+            tables_cache.set(
+                'db:{}:schema:None:table_list'.format(main_db.id),
+                ['a.t1', 'a.t2', 'b.t3'])
+            names, complete = main_db.all_result_sets_in_database('table')
+            self.assertEqual(names, ['a.t1', 'a.t2', 'b.t3'])
+            self.assertTrue(complete)
+        main_db.allow_multi_schema_metadata_fetch = False
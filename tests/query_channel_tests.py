@@ -0,0 +1,122 @@
+import unittest
+
+import mock
+
+from superset.models.sql_lab import Query
+from superset.utils.query_channel import (
+    clear_query, InMemoryQueryChannel, ProgressReporter,
+)
+
+
+class QueryChannelTestCase(unittest.TestCase):
+
+    def test_cancel(self):
+        channel = InMemoryQueryChannel()
+        self.assertFalse(channel.is_cancelled(1))
+        channel.cancel(1)
+        self.assertTrue(channel.is_cancelled(1))
+        self.assertFalse(channel.is_cancelled(2))
+        channel.clear(1)
+        self.assertFalse(channel.is_cancelled(1))
+
+    def test_clear_query(self):
+        channel = InMemoryQueryChannel()
+        channel.cancel(1)
+        channel.set_progress(1, 10)
+        clear_query(1, channel)
+        self.assertFalse(channel.is_cancelled(1))
+        self.assertEqual(channel.get_progress([1]), {})
+
+    def test_progress(self):
+        channel = InMemoryQueryChannel()
+        self.assertEqual(channel.get_progress([]), {})
+        channel.set_progress(1, 10)
+        channel.set_progress(3, 30)
+        self.assertEqual(channel.get_progress([1, 2, 3]), {1: 10, 3: 30})
+
+    def test_updates(self):
+        channel = InMemoryQueryChannel()
+        self.assertEqual(channel.get_updates(1, None), (0, {}, False))
+        self.assertEqual(channel.get_updates(1, 0), (0, {}, True))
+        channel.publish(1, {'id': 'a', 'state': 'running'})
+        channel.publish(2, {'id': 'b', 'state': 'running'})
+        channel.publish(1, {'id': 'c', 'state': 'running'})
+        channel.publish(1, {'id': 'a', 'state': 'success'})
+        seq, queries, complete = channel.get_updates(1, 0)
+        self.assertEqual(seq, 3)
+        self.assertTrue(complete)
+        self.assertEqual(queries, {
+            'a': {'id': 'a', 'state': 'success'},
+            'c': {'id': 'c', 'state': 'running'},
+        })
+        self.assertEqual(channel.get_updates(1, 2)[1], {
+            'a': {'id': 'a', 'state': 'success'}})
+        self.assertEqual(channel.get_updates(1, 3), (3, {}, True))
+
+    def test_updates_missed(self):
+        channel = InMemoryQueryChannel()
+        for i in range(5):
+            channel.publish(1, {'id': 'a', 'progress': i})
+        # too far behind
+        self.assertFalse(channel.get_updates(1, 0, max_events=3)[2])
+        # counter reset
+        self.assertFalse(channel.get_updates(1, 10)[2])
+        # expired events
+        channel.backend.delete(channel._event_key(1, 4))
+        self.assertFalse(channel.get_updates(1, 2)[2])
+        self.assertTrue(channel.get_updates(1, 4)[2])
+
+    @mock.patch('superset.utils.query_channel.time')
+    def test_wait_for_updates(self, time):
+        time.time.side_effect = [0, 0, 1, 2, 3]
+        channel = InMemoryQueryChannel()
+        self.assertEqual(channel.wait_for_updates(1, 0, 2), (0, {}, True))
+        self.assertEqual(time.sleep.call_count, 2)
+
+
+class ProgressReporterTestCase(unittest.TestCase):
+
+    @mock.patch('superset.utils.query_channel.time')
+    def test_update_coalesces_commits(self, time):
+        time.time.return_value = 0
+        channel = InMemoryQueryChannel()
+        query = mock.Mock(id=1, progress=0)
+        session = mock.Mock()
+        reporter = ProgressReporter(query, session, channel, commit_interval=5)
+
+        reporter.update(10)
+        time.time.return_value = 2
+        reporter.update(20)
+        reporter.update(15)
+        self.assertEqual(query.progress, 20)
+        self.assertEqual(channel.get_progress([1]), {1: 20})
+        session.commit.assert_not_called()
+
+        time.time.return_value = 6
+        reporter.update(30, tracking_url='http://tracking')
+        self.assertEqual(query.tracking_url, 'http://tracking')
+        self.assertEqual(session.commit.call_count, 1)
+
+        reporter.flush()
+        self.assertEqual(session.commit.call_count, 1)
+        reporter.update(40)
+        reporter.flush()
+        self.assertEqual(session.commit.call_count, 2)
+
+    def test_is_stopped(self):
+        channel = InMemoryQueryChannel()
+        session = mock.Mock()
+        reporter = ProgressReporter(mock.Mock(id=1), session, channel)
+        self.assertFalse(reporter.is_stopped())
+        channel.cancel(1)
+        self.assertTrue(reporter.is_stopped())
+        session.query.assert_not_called()
+
+    def test_is_stopped_without_channel(self):
+        session = mock.Mock()
+        session.query.return_value.filter_by.return_value.scalar.return_value = (
+            'stopped')
+        query = Query(id=1)
+        reporter = ProgressReporter(query, session)
+        self.assertTrue(reporter.is_stopped())
+        session.query.assert_called_once_with(Query.status)
@@ -0,0 +1,102 @@
+from datetime import datetime
+import unittest
+
+from superset.utils.query_fingerprint import (
+    normalize_metric,
+    normalize_query_obj,
+    normalize_time_range,
+    query_fingerprint,
+)
+
+
+class QueryFingerprintTestCase(unittest.TestCase):
+
+    def get_query_obj(self, **kwargs):
+        query_obj = {
+            'granularity': 'ds',
+            'from_dttm': datetime(2018, 1, 1),
+            'to_dttm': datetime(2018, 2, 1),
+            'is_timeseries': False,
+            'groupby': ['gender', 'state'],
+            'metrics': [
+                'count',
+                {
+                    'expressionType': 'SIMPLE',
+                    'aggregate': 'SUM',
+                    'column': {'column_name': 'num', 'id': 1, 'type': 'BIGINT'},
+                    'label': 'SUM(num)',
+                    'optionId': 'metric_1',
+                    'hasCustomLabel': False,
+                },
+            ],
+            'row_limit': 100,
+            'filter': [
+                {'col': 'state', 'op': 'in', 'val': ['CA', 'NY']},
+                {'col': 'gender', 'op': '==', 'val': 'girl'},
+            ],
+            'timeseries_limit': 0,
+            'extras': {'where': '', 'having': '', 'time_grain_sqla': None},
+            'prequeries': [],
+            'is_prequery': False,
+        }
+        query_obj.update(kwargs)
+        return query_obj
+
+    def test_normalize_metric(self):
+        metric = self.get_query_obj()['metrics'][1]
+        self.assertEqual(normalize_metric(metric), {
+            'expressionType': 'SIMPLE',
+            'aggregate': 'SUM',
+            'column': 'num',
+            'label': 'SUM(num)',
+        })
+        self.assertEqual(normalize_metric('count'), 'count')
+
+    def test_normalize_query_obj(self):
+        normalized = normalize_query_obj(self.get_query_obj())
+        for key in ('from_dttm', 'to_dttm', 'prequeries', 'extras'):
+            self.assertNotIn(key, normalized)
+        self.assertEqual(
+            [f['col'] for f in normalized['filter']], ['gender', 'state'])
+        self.assertEqual(normalized['groupby'], ['gender', 'state'])
+
+    def test_equivalent_queries(self):
+        a = self.get_query_obj()
+        b = self.get_query_obj(
+            from_dttm=datetime(2017, 1, 1),
+            filter=[
+                {'col': 'gender', 'op': '==', 'val': 'girl'},
+                {'col': 'state', 'op': 'in', 'val': ['NY', 'CA']},
+            ],
+            extras={},
+        )
+        b['metrics'][1]['optionId'] = 'metric_2'
+        self.assertEqual(
+            query_fingerprint(a, '1__table'), query_fingerprint(b, '1__table'))
+
+    def test_different_queries(self):
+        a = self.get_query_obj()
+        fingerprint = query_fingerprint(a, '1__table')
+        self.assertNotEqual(fingerprint, query_fingerprint(a, '2__table'))
+        self.assertNotEqual(
+            fingerprint, query_fingerprint(a, '1__table', time_compare='1 year'))
+        self.assertNotEqual(
+            fingerprint,
+            query_fingerprint(
+                self.get_query_obj(groupby=['state', 'gender']), '1__table'))
+        self.assertNotEqual(
+            fingerprint,
+            query_fingerprint(
+                a, '1__table', normalize_time_range('Last week')))
+
+    def test_normalize_time_range(self):
+        self.assertEqual(
+            normalize_time_range(' Last  week '), {'time_range': 'Last week'})
+        self.assertEqual(
+            normalize_time_range(None, '7 days ago', 'now'),
+            {'since': '7 days ago', 'until': 'now'})
+        self.assertEqual(
+            normalize_time_range('Last week', time_shift='1 day'),
+            {'time_range': 'Last week', 'time_shift': 86400})
+        self.assertEqual(normalize_time_range('Last week', time_shift=''),
+                         {'time_range': 'Last week'})
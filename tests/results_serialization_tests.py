@@ -0,0 +1,105 @@
+from datetime import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+import simplejson as json
+
+from superset.dataframe import SupersetDataFrame
+from superset.db_engine_specs import BaseEngineSpec
+from superset.utils.core import json_iso_dttm_ser, JS_MAX_INTEGER
+from superset.utils.results_serialization import (
+    deserialize_results,
+    MSGPACK_MAGIC,
+    serialize_results,
+)
+
+
+class ResultsSerializationTestCase(unittest.TestCase):
+
+    def get_cdf(self):
+        data = [
+            (1, 1.5, 'a', datetime(2018, 1, 1), JS_MAX_INTEGER + 1, None),
+            (2, np.nan, None, datetime(2018, 1, 2), 3, 'x'),
+            (3, 3.5, 'c', datetime(2018, 1, 3), 4, 'y'),
+        ]
+        cursor_descr = (
+            ('id', 'int'),
+            ('value', 'float'),
+            ('name', 'string'),
+            ('ds', 'datetime'),
+            ('big', 'int'),
+            ('tag', 'string'),
+        )
+        return SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+
+    def get_payload(self, cdf):
+        return {
+            'query_id': 1,
+            'status': 'success',
+            'columns': cdf.columns,
+            'query': {'id': 1},
+        }
+
+    def assert_same_json(self, a, b):
+        self.assertEqual(
+            json.loads(json.dumps(
+                a, default=json_iso_dttm_ser, ignore_nan=True)),
+            json.loads(json.dumps(
+                b, default=json_iso_dttm_ser, ignore_nan=True)),
+        )
+
+    def test_msgpack_round_trip_matches_json(self):
+        cdf = self.get_cdf()
+        payload = self.get_payload(cdf)
+        json_blob = serialize_results(payload, cdf, 'json')
+        msgpack_blob = serialize_results(payload, cdf, 'msgpack')
+        self.assertFalse(json_blob.startswith(MSGPACK_MAGIC))
+        self.assertTrue(msgpack_blob.startswith(MSGPACK_MAGIC))
+
+        from_json = deserialize_results(json_blob)
+        from_msgpack = deserialize_results(msgpack_blob)
+        self.assert_same_json(from_json.to_dict(), from_msgpack.to_dict())
+        self.assertEqual(
+            from_msgpack.records()[0]['big'], str(JS_MAX_INTEGER + 1))
+
+    def test_msgpack_limit(self):
+        cdf = self.get_cdf()
+        blob = serialize_results(self.get_payload(cdf), cdf, 'msgpack')
+        results = deserialize_results(blob)
+        self.assertEqual(len(results.records(limit=2)), 2)
+        self.assertEqual(len(results.to_dict(limit=10)['data']), 3)
+
+    def test_msgpack_to_dataframe(self):
+        cdf = self.get_cdf()
+        blob = serialize_results(self.get_payload(cdf), cdf, 'msgpack')
+        df = deserialize_results(blob).to_dataframe()
+        self.assertEqual(list(df.columns), list(cdf.df.columns))
+        self.assertEqual(list(df['id']), [1, 2, 3])
+        self.assertEqual(list(df['name'].isnull()), [False, True, False])
+        self.assertEqual(df['ds'].dtype.kind, 'M')
+
+    def test_iter_dataframes(self):
+        cdf = self.get_cdf()
+        for name in ('json', 'msgpack'):
+            results = deserialize_results(
+                serialize_results(self.get_payload(cdf), cdf, name))
+            dfs = list(results.iter_dataframes(chunk_size=2))
+            self.assertEqual([len(df) for df in dfs], [2, 1])
+            self.assertEqual(list(dfs[0]['id']), [1, 2])
+            self.assertEqual(list(dfs[1]['name']), ['c'])
+            self.assertEqual(list(dfs[1]['tag']), ['y'])
+            self.assertEqual(
+                pd.Timestamp(dfs[1]['ds'][0]), pd.Timestamp(2018, 1, 3))
+
+    def test_empty_result_set(self):
+        cdf = SupersetDataFrame([], (('a', 'string'),), BaseEngineSpec)
+        payload = self.get_payload(cdf)
+        for name in ('json', 'msgpack'):
+            results = deserialize_results(serialize_results(payload, cdf, name))
+            self.assertEqual(results.records(), [])
+
+    def test_unknown_serialization(self):
+        cdf = self.get_cdf()
+        with self.assertRaises(Exception):
+            serialize_results(self.get_payload(cdf), cdf, 'foo')
@@ -1,4 +1,5 @@
-from superset import app, security_manager
+from superset import app, db, security_manager
+from superset.connectors.sqla.models import SqlaTable, SqlMetric
 from .base_tests import SupersetTestCase
 
 
@@ -216,3 +217,59 @@ class RolePermissionTests(SupersetTestCase):
         self.assertIn(('can_fave_slices', 'Superset'), gamma_perm_set)
         self.assertIn(('can_save_dash', 'Superset'), gamma_perm_set)
         self.assertIn(('can_slice', 'Superset'), gamma_perm_set)
+
+    def test_sync_role_definitions_is_idempotent(self):
+        timings = security_manager.sync_role_definitions()
+        self.assertIn('Syncing roles', timings)
+        self.assertIn('Creating missing permissions', timings)
+        perm_sets = {
+            role_name: get_perm_tuples(role_name)
+            for role_name in ('Admin', 'Alpha', 'Gamma', 'granter', 'sql_lab')
+        }
+        security_manager.sync_role_definitions()
+        for role_name, perm_set in perm_sets.items():
+            self.assertEqual(get_perm_tuples(role_name), perm_set)
+
+    def test_set_role_revokes_permissions(self):
+        role_name = 'test_set_role'
+        security_manager.set_role(
+            role_name, lambda pvm: pvm.view_menu.name == 'SliceModelView')
+        perm_set = get_perm_tuples(role_name)
+        self.assertIn(('can_list', 'SliceModelView'), perm_set)
+        self.assertEqual({v for _, v in perm_set}, {'SliceModelView'})
+
+        security_manager.set_role(
+            role_name, lambda pvm: pvm.view_menu.name == 'DashboardModelView')
+        perm_set = get_perm_tuples(role_name)
+        self.assertIn(('can_list', 'DashboardModelView'), perm_set)
+        self.assertEqual({v for _, v in perm_set}, {'DashboardModelView'})
+
+        db.session.delete(security_manager.find_role(role_name))
+        db.session.commit()
+
+    def test_create_missing_perms(self):
+        table = (
+            db.session.query(SqlaTable)
+            .filter_by(table_name='birth_names')
+            .first()
+        )
+        metric = SqlMetric(
+            metric_name='test_restricted_metric', expression='COUNT(*)',
+            is_restricted=True, table=table)
+        db.session.add(metric)
+        db.session.commit()
+        perm = metric.perm
+        try:
+            self.assertNotIn(
+                ('metric_access', perm), security_manager.get_pv_names())
+            security_manager.create_missing_perms()
+            self.assertIn(
+                ('metric_access', perm), security_manager.get_pv_names())
+            # the existing permissions are left alone
+            pv_names = security_manager.get_pv_names()
+            security_manager.create_missing_perms()
+            self.assertEqual(security_manager.get_pv_names(), pv_names)
+        finally:
+            db.session.delete(metric)
+            db.session.commit()
+            security_manager.del_permission_view_menu('metric_access', perm)
@@ -3,13 +3,18 @@ from datetime import datetime, timedelta
 import json
 import unittest
 
+import mock
+
 from flask_appbuilder.security.sqla import models as ab_models
 
 from superset import db, security_manager
 from superset.dataframe import SupersetDataFrame
 from superset.db_engine_specs import BaseEngineSpec
 from superset.models.sql_lab import Query
-from superset.utils.core import datetime_to_epoch, get_main_database
+from superset.utils.core import (
+    datetime_to_epoch, get_main_database, now_as_float, QueryStatus,
+)
+from superset.utils.query_channel import InMemoryQueryChannel
 from .base_tests import SupersetTestCase
 
 
@@ -123,6 +128,60 @@ class SqlLabTests(SupersetTestCase):
         # Redirects to the login page
         self.assertEquals(403, resp.status_code)
 
+    def test_queries_endpoint_cancels_timed_out_queries(self):
+        self.login('admin')
+        query = Query(
+            client_id='client_id_timeout',
+            database_id=get_main_database(db.session).id,
+            user_id=security_manager.find_user('admin').id,
+            sql='SELECT 1',
+            status=QueryStatus.RUNNING,
+            start_time=now_as_float() - 7 * 60 * 60 * 1000,
+        )
+        db.session.add(query)
+        db.session.commit()
+        channel = InMemoryQueryChannel()
+        try:
+            with mock.patch('superset.utils.query_channel._channel', channel):
+                data = self.get_json_resp('/superset/queries/0')
+            self.assertEquals(
+                QueryStatus.TIMED_OUT, data['client_id_timeout']['state'])
+            self.assertTrue(channel.is_cancelled(query.id))
+        finally:
+            db.session.delete(query)
+            db.session.commit()
+
+    def test_query_channel_cleared(self):
+        self.login('admin')
+        with mock.patch('superset.sql_lab.clear_query') as clear_query:
+            self.run_sql('SELECT * FROM ab_user LIMIT 1', client_id='client_id_4')
+        query = db.session.query(Query).filter_by(client_id='client_id_4').one()
+        clear_query.assert_called_once_with(query.id)
+
+    def test_query_updates_endpoint(self):
+        self.login('admin')
+        with mock.patch('superset.views.core.get_query_channel', return_value=None):
+            resp = self.client.get('/superset/query_updates/')
+            self.assertEquals(404, resp.status_code)
+
+        channel = InMemoryQueryChannel()
+        with mock.patch('superset.utils.query_channel._channel', channel):
+            data = self.get_json_resp('/superset/query_updates/')
+            self.assertTrue(data['resync'])
+            seq = data['seq']
+
+            self.run_sql('SELECT * FROM ab_user LIMIT 1', client_id='client_id_4')
+            data = self.get_json_resp(
+                '/superset/query_updates/?seq={}'.format(seq))
+            self.assertFalse(data['resync'])
+            self.assertEquals(['client_id_4'], list(data['queries']))
+            self.assertEquals('success', data['queries']['client_id_4']['state'])
+
+            data = self.get_json_resp(
+                '/superset/query_updates/?seq={}'.format(data['seq']))
+            self.assertEquals({}, data['queries'])
+            self.assertFalse(data['resync'])
+
     def test_search_query_on_db_id(self):
         self.run_some_queries()
         self.login('admin')
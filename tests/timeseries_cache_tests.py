@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+import unittest
+
+import mock
+import pandas as pd
+from werkzeug.contrib.cache import SimpleCache
+
+from superset.models.helpers import QueryResult
+from superset.utils import timeseries_cache
+from superset.utils.core import DTTM_ALIAS, QueryStatus
+
+
+class FakeDatasource(object):
+    """Returns a row a day between the bounds of the query"""
+
+    type = 'table'
+    uid = '1__table'
+
+    def __init__(self, row_value=1):
+        self.row_value = row_value
+        self.query_objs = []
+
+    def query(self, query_obj, force=False):
+        self.query_objs.append(query_obj)
+        end_inclusive = query_obj['extras'].get(
+            'time_range_endpoints', [None, 'inclusive'])[1] != 'exclusive'
+        days = pd.date_range(
+            query_obj['from_dttm'], query_obj['to_dttm'], freq='D')
+        days = [
+            d for d in days
+            if end_inclusive or d < pd.Timestamp(query_obj['to_dttm'])
+        ]
+        df = pd.DataFrame({
+            DTTM_ALIAS: days,
+            'count': [self.row_value] * len(days),
+        })
+        return QueryResult(df, 'SELECT 1', timedelta(seconds=1))
+
+
+class TimeseriesCacheTestCase(unittest.TestCase):
+
+    def query_obj(self, from_dttm, to_dttm, **kwargs):
+        query_obj = {
+            'granularity': 'ds',
+            'from_dttm': from_dttm,
+            'to_dttm': to_dttm,
+            'is_timeseries': True,
+            'groupby': [],
+            'metrics': ['count'],
+            'row_limit': 1000,
+            'extras': {'time_grain_sqla': 'P1D'},
+        }
+        query_obj.update(kwargs)
+        return query_obj
+
+    def test_get_chunks(self):
+        chunks = timeseries_cache.get_chunks(
+            datetime(2018, 1, 1, 12), datetime(2018, 1, 3))
+        self.assertEqual(chunks, [
+            (datetime(2018, 1, 1, 12), datetime(2018, 1, 2)),
+            (datetime(2018, 1, 2), datetime(2018, 1, 3)),
+        ])
+        self.assertEqual(
+            timeseries_cache.get_chunks(datetime(2018, 1, 1), datetime(2018, 1, 1)),
+            [])
+
+    def test_get_runs(self):
+        self.assertEqual(
+            timeseries_cache.get_runs([0, 1, 2, 5, 7, 8]),
+            [[0, 1, 2], [5], [7, 8]])
+
+    def test_is_cacheable(self):
+        datasource = mock.Mock(type='table')
+        datasource.database.grains_dict.return_value = {
+            'P1D': mock.Mock(duration='P1D'),
+            'P1M': mock.Mock(duration='P1M'),
+        }
+        query_obj = self.query_obj(datetime(2018, 1, 1), datetime(2018, 2, 1))
+        self.assertTrue(timeseries_cache.is_cacheable(datasource, query_obj))
+        query_obj['extras'] = {'time_grain_sqla': 'P1M'}
+        self.assertFalse(timeseries_cache.is_cacheable(datasource, query_obj))
+        query_obj['extras'] = {}
+        self.assertTrue(timeseries_cache.is_cacheable(datasource, query_obj))
+        query_obj.update(groupby=['gender'], timeseries_limit=10)
+        self.assertFalse(timeseries_cache.is_cacheable(datasource, query_obj))
+        query_obj.update(timeseries_limit=0, from_dttm=None)
+        self.assertFalse(timeseries_cache.is_cacheable(datasource, query_obj))
+        datasource.type = 'druid'
+        self.assertFalse(timeseries_cache.is_cacheable(datasource, query_obj))
+
+    def test_query_reuses_cached_days(self):
+        cache = SimpleCache()
+        datasource = FakeDatasource()
+        now = datetime(2018, 2, 1)
+        query_obj = self.query_obj(datetime(2018, 1, 1), datetime(2018, 1, 11))
+
+        result = timeseries_cache.query(
+            datasource, query_obj, cache, settle_time=0, now=now)
+        self.assertEqual(result.status, QueryStatus.SUCCESS)
+        # all the missing days are fetched at once
+        self.assertEqual(len(datasource.query_objs), 1)
+        self.assertEqual(len(result.df), 11)
+        self.assertEqual(list(result.df[DTTM_ALIAS]), list(
+            pd.date_range(datetime(2018, 1, 1), datetime(2018, 1, 11))))
+
+        # a day later, only the last days are queried
+        datasource.query_objs = []
+        query_obj = self.query_obj(datetime(2018, 1, 2), datetime(2018, 1, 12))
+        result = timeseries_cache.query(
+            datasource, query_obj, cache, settle_time=0, now=now)
+        self.assertEqual(len(datasource.query_objs), 1)
+        chunk_query_obj = datasource.query_objs[0]
+        # the last day was cached with its end included, it's queried again
+        self.assertEqual(chunk_query_obj['from_dttm'], datetime(2018, 1, 10))
+        self.assertEqual(chunk_query_obj['to_dttm'], datetime(2018, 1, 12))
+        self.assertNotIn('time_range_endpoints', chunk_query_obj['extras'])
+        self.assertEqual(list(result.df[DTTM_ALIAS]), list(
+            pd.date_range(datetime(2018, 1, 2), datetime(2018, 1, 12))))
+        self.assertEqual(result.df['count'].sum(), 11)
+
+    def test_query_refreshes_recent_days(self):
+        cache = SimpleCache()
+        datasource = FakeDatasource()
+        query_obj = self.query_obj(datetime(2018, 1, 1), datetime(2018, 1, 11))
+        now = datetime(2018, 1, 11)
+        timeseries_cache.query(
+            datasource, query_obj, cache, settle_time=3600 * 24 * 2, now=now)
+
+        datasource.row_value = 2
+        datasource.query_objs = []
+        result = timeseries_cache.query(
+            datasource, query_obj, cache, settle_time=3600 * 24 * 2, now=now)
+        self.assertEqual(len(datasource.query_objs), 1)
+        self.assertEqual(
+            datasource.query_objs[0]['from_dttm'], datetime(2018, 1, 9))
+        self.assertEqual(list(result.df['count']), [1] * 8 + [2] * 3)
+
+    def test_query_falls_back_when_rows_are_limited(self):
+        cache = SimpleCache()
+        datasource = FakeDatasource()
+        query_obj = self.query_obj(
+            datetime(2018, 1, 1), datetime(2018, 1, 11), row_limit=5)
+        self.assertIsNone(timeseries_cache.query(
+            datasource, query_obj, cache, now=datetime(2018, 2, 1)))
+
+    def test_query_returns_failures(self):
+        cache = SimpleCache()
+        datasource = mock.Mock(uid='1__table')
+        failed = QueryResult(
+            None, 'SELECT 1', timedelta(0), QueryStatus.FAILED, 'error')
+        datasource.query.return_value = failed
+        query_obj = self.query_obj(datetime(2018, 1, 1), datetime(2018, 1, 11))
+        self.assertIs(
+            timeseries_cache.query(datasource, query_obj, cache), failed)
@@ -1,17 +1,21 @@
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+import gzip
 import unittest
 import uuid
 
 from mock import patch
 import numpy
+import pandas as pd
 
 from superset.exceptions import SupersetException
 from superset.utils.core import (
     base_json_conv,
     convert_legacy_filters_into_adhoc,
     datetime_f,
+    df_chunks_to_csv,
     get_since_until,
+    gzip_chunks,
     json_int_dttm_ser,
     json_iso_dttm_ser,
     JSONEncodedDict,
@@ -108,6 +112,19 @@ class UtilsTestCase(unittest.TestCase):
         got_str = zlib_decompress_to_string(blob)
         self.assertEquals(json_str, got_str)
 
+    def test_df_chunks_to_csv(self):
+        chunks = [
+            pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}),
+            pd.DataFrame({'a': [3], 'b': ['z']}),
+        ]
+        csv = ''.join(df_chunks_to_csv(chunks, index=False))
+        self.assertEqual(csv, 'a,b\n1,x\n2,y\n3,z\n')
+
+    def test_gzip_chunks(self):
+        chunks = ['a,b\n', '1,x\n', b'2,y\n']
+        blob = b''.join(gzip_chunks(chunks))
+        self.assertEqual(gzip.decompress(blob), b'a,b\n1,x\n2,y\n')
+
     @patch('superset.utils.core.to_adhoc', mock_to_adhoc)
     def test_merge_extra_filters(self):
         # does nothing if no extra filters
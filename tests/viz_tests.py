@@ -164,6 +164,91 @@ class BaseVizTestCase(SupersetTestCase):
         test_viz = viz.BaseViz(datasource, form_data={})
         self.assertEqual(app.config['CACHE_DEFAULT_TIMEOUT'], test_viz.cache_timeout)
 
+    @patch('superset.viz.BaseViz.process_df', side_effect=lambda df, fmt: df)
+    @patch('superset.viz.BaseViz.get_timestamp_format', return_value=None)
+    @patch('superset.viz.BaseViz.query_obj', return_value={'groupby': ['a']})
+    def test_get_csv_chunks_index(self, query_obj, *args):
+        datasource = self.get_datasource_mock()
+        test_viz = viz.BaseViz(datasource, form_data={})
+        datasource.query_chunks.return_value = iter([
+            pd.DataFrame({'b': [1, 2]}),
+            pd.DataFrame({'b': [3]}, index=[2]),
+        ])
+        self.assertEqual(
+            ''.join(test_viz.get_csv_chunks()), 'b\n1\n2\n3\n')
+
+        datasource.query_chunks.return_value = iter([
+            pd.DataFrame({'b': [1, 2]}, index=pd.Index(['x', 'y'], name='a')),
+            pd.DataFrame({'b': [3]}, index=pd.Index(['z'], name='a')),
+        ])
+        self.assertEqual(
+            ''.join(test_viz.get_csv_chunks()), 'a,b\nx,1\ny,2\nz,3\n')
+
+    @patch('superset.viz.BaseViz.get_df_payload', autospec=True)
+    def test_get_df_payloads(self, get_df_payload):
+        def fake_get_df_payload(viz_obj, query_obj, **kwargs):
+            if query_obj['id'] == 1:
+                viz_obj._any_cache_key = 'key1'
+                viz_obj._any_cached_dttm = 'dttm1'
+            if query_obj['id'] == 2:
+                viz_obj.status = 'failed'
+                viz_obj.error_message = 'error2'
+            return {'id': query_obj['id'], 'kwargs': kwargs}
+        get_df_payload.side_effect = fake_get_df_payload
+
+        test_viz = viz.BaseViz(self.get_datasource_mock(), {})
+        queries = [({'id': i}, {'time_compare': i}) for i in range(4)]
+        payloads = test_viz.get_df_payloads(queries)
+        self.assertEqual(
+            payloads,
+            [{'id': i, 'kwargs': {'time_compare': i}} for i in range(4)])
+        self.assertEqual(test_viz._any_cache_key, 'key1')
+        self.assertEqual(test_viz._any_cached_dttm, 'dttm1')
+        self.assertEqual(test_viz.status, 'failed')
+        self.assertEqual(test_viz.error_message, 'error2')
+
+    def test_detach_datasources(self):
+        datasource = self.get_datasource_mock()
+        viz_objs = [viz.BaseViz(datasource, {}) for _ in range(2)]
+        self.assertTrue(viz.detach_datasources(viz_objs, 2))
+        datasource.detached_copy.assert_called_once_with()
+        for viz_obj in viz_objs:
+            self.assertIs(viz_obj.datasource, datasource.detached_copy.return_value)
+
+        # datasources that can't be copied are queried serially
+        datasource = self.get_datasource_mock()
+        datasource.detached_copy.return_value = None
+        viz_objs = [viz.BaseViz(datasource, {}) for _ in range(2)]
+        self.assertFalse(viz.detach_datasources(viz_objs, 2))
+        self.assertIs(viz_objs[0].datasource, datasource)
+
+    @patch('superset.viz.cache')
+    @patch('superset.viz.BaseViz.get_payload', autospec=True)
+    @patch('superset.viz.BaseViz.query_obj', autospec=True)
+    def test_get_viz_payloads(self, query_obj, get_payload, cache):
+        query_obj.side_effect = lambda viz_obj: {'id': viz_obj.form_data['id']}
+        get_payload.side_effect = lambda viz_obj, query_obj: dict(query_obj)
+        cache.get_many.return_value = ['cached', None]
+        viz_objs = [
+            viz.BaseViz(self.get_datasource_mock(), {'id': i})
+            for i in range(3)
+        ]
+        for i, viz_obj in enumerate(viz_objs):
+            viz_obj.cache_key = Mock(return_value='key{}'.format(i))
+        viz_objs[2].cache_key = Mock(side_effect=Exception('error'))
+        results = list(viz.get_viz_payloads(viz_objs, max_workers=2))
+
+        # one payload per chart, the failed one isn't queried afterwards
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(i for i, _ in results), [0, 1, 2])
+        # errors first, then cache hits, then the queries that ran
+        self.assertEqual(results[0][0], 2)
+        self.assertEqual(results[0][1]['status'], 'failed')
+        self.assertEqual(results[1], (0, {'id': 0}))
+        self.assertEqual(results[2], (1, {'id': 1}))
+        cache.get_many.assert_called_once_with('key0', 'key1')
+        self.assertEqual(viz_objs[0]._prefetched_cache, {'key0': 'cached'})
+
 
 class TableVizTestCase(SupersetTestCase):
 
@@ -1092,3 +1177,31 @@ class TimeSeriesVizTestCase(SupersetTestCase):
                 u'key': (u'Real Madrid C.F.\U0001f1fa\U0001f1f8\U0001f1ec\U0001f1e7',)},
         ]
         self.assertEqual(expected, viz_data)
+
+    @patch('superset.viz.timeseries_cache')
+    @patch('superset.viz.cache')
+    def test_query_datasource_uses_incremental_cache(self, cache, timeseries_cache):
+        datasource = self.get_datasource_mock()
+        query_obj = {'granularity': 'ds'}
+        test_viz = viz.NVD3TimeSeriesViz(datasource, {'cache_timeout': 60})
+        timeseries_cache.is_cacheable.return_value = True
+        with patch.dict(app.config, {'TIMESERIES_INCREMENTAL_CACHE': True}):
+            results = test_viz.query_datasource(query_obj)
+            self.assertIs(results, timeseries_cache.query.return_value)
+            datasource.query.assert_not_called()
+
+            # falls back to the whole query when the days can't be stitched
+            timeseries_cache.query.return_value = None
+            results = test_viz.query_datasource(query_obj)
+            self.assertIs(results, datasource.query.return_value)
+
+        datasource.query.reset_mock()
+        timeseries_cache.query.reset_mock()
+        results = viz.TableViz(datasource, {}).query_datasource(query_obj)
+        self.assertIs(results, datasource.query.return_value)
+        timeseries_cache.query.assert_not_called()
+        datasource.query.assert_called_once_with(query_obj, force=False)
+
+        datasource.query.reset_mock()
+        viz.TableViz(datasource, {}, force=True).query_datasource(query_obj)
+        datasource.query.assert_called_once_with(query_obj, force=True)